@@ -0,0 +1,93 @@
+"""
+Run the detection engineering pipeline over a manifest of goals and threat reports, without the UI.
+
+    python -m app.bulk manifest.jsonl --output bulk-output --provider OpenAI --model gpt-4o
+
+Results are written to the output directory as items finish. Running the same command again resumes:
+items already done are skipped, failed ones are retried.
+"""
+import argparse
+import sys
+from dotenv import load_dotenv
+
+
+def read_optional(path):
+    if path is None:
+        return None
+
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def main() -> int:
+    load_dotenv()
+
+    # after load_dotenv, the app modules read their settings from the environment on import
+    from app.bulk.engine import BulkEngine, BulkSettings, BULK_OUTPUT_DIR, BULK_WORKERS
+    from app.bulk.manifest import read_manifest, ManifestError
+    from app.llm.budget import DEFAULT_MAX_OUTPUT_TOKENS
+    from app.llm.programs import program_registry
+    from app.llm.prompt import PROGRAM_SIGNATURES
+    from app.llm.setup import PROVIDERS, MODELS
+
+    parser = argparse.ArgumentParser(prog="python -m app.bulk", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("manifest", help="JSONL manifest, or a directory with one report file or report directory per item")
+    parser.add_argument("--output", default=BULK_OUTPUT_DIR, help="output directory, also used to resume")
+    parser.add_argument("--workers", type=int, default=BULK_WORKERS)
+    parser.add_argument("--provider", default=next(iter(PROVIDERS)), choices=list(PROVIDERS))
+    parser.add_argument("--model", help="defaults to the first model of the provider")
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_OUTPUT_TOKENS)
+    parser.add_argument("--data-source", default="AWS CloudTrail Logs")
+    parser.add_argument("--detection-language", default="Splunk SPL")
+    parser.add_argument("--max-detections", type=int, default=1, help="suggested detections turned into rules per item")
+    parser.add_argument("--goal", help="goal of items that do not set one")
+    parser.add_argument("--detection-steps", help="file with the detection implementation steps")
+    parser.add_argument("--triage-steps", help="file with the alert triage steps")
+    args = parser.parse_args()
+
+    try:
+        items = read_manifest(args.manifest, default_goal=args.goal)
+    except (ManifestError, OSError) as e:
+        print(f"Invalid manifest: {e}", file=sys.stderr)
+        return 2
+
+    settings = BulkSettings(
+        llm_provider=args.provider,
+        model=args.model or next(iter(MODELS[PROVIDERS[args.provider]])),
+        temperature=args.temperature,
+        max_tokens=args.max_tokens,
+        data_source=args.data_source,
+        detection_language=args.detection_language,
+        detection_steps=read_optional(args.detection_steps),
+        triage_steps=read_optional(args.triage_steps),
+        max_detections=args.max_detections,
+    )
+    engine = BulkEngine(settings, output_dir=args.output, workers=args.workers)
+
+    compiled = program_registry().load(list(PROGRAM_SIGNATURES.values()))
+    if compiled:
+        print(f"Using compiled programs for {', '.join(compiled)}", file=sys.stderr)
+
+    pending = len(engine.pending(items))
+    print(f"{pending} of {len(items)} items to process, writing to {args.output}", file=sys.stderr)
+
+    failed = 0
+    results = engine.run(items)
+    try:
+        for done, item_result in enumerate(results, start=1):
+            line = f"[{done}/{pending}] {item_result.item.id}: {item_result.status} ({item_result.wall_seconds:.1f}s)"
+            if item_result.error:
+                failed += 1
+                line += f" {item_result.error}"
+            print(line, file=sys.stderr)
+    except KeyboardInterrupt:
+        print("Interrupted, waiting for the items in flight. Run the same command again to resume.", file=sys.stderr)
+        results.close()
+        return 130
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Iterator, Optional
+from streamlit.logger import get_logger
+from app.bulk.manifest import BulkItem
+from app.ingestion import pdf, scrape
+from app.ingestion.dedup import dedup_sources
+from app.ingestion.spool import SpooledUpload
+from app.llm.prompt import PromptSignature
+
+
+logger = get_logger(__name__)
+
+BULK_WORKERS = int(os.getenv("LANGDON_BULK_WORKERS", 4))
+# Manifests, reports and output directories entered in the web UI must be inside this directory.
+BULK_ROOT = os.getenv("LANGDON_BULK_ROOT", os.path.join(os.getcwd(), "bulk"))
+BULK_OUTPUT_DIR = os.getenv("LANGDON_BULK_OUTPUT_DIR", os.path.join(BULK_ROOT, "output"))
+
+CHECKPOINT_FILE = "checkpoint.jsonl"
+RESULTS_FILE = "results.jsonl"
+ITEM_RESULT_FILE = "result.json"
+
+
+class BulkSettings:
+    """Model and detection settings of a bulk run, the sidebar configuration of the wizard."""
+
+    llm_provider: str
+    model: str
+    temperature: float
+    max_tokens: int
+    data_source: str
+    detection_language: str
+    detection_steps: Optional[str]
+    triage_steps: Optional[str]
+    max_detections: int
+
+    def __init__(self, llm_provider: str, model: str, temperature: float, max_tokens: int, data_source: str,
+                 detection_language: str, detection_steps: Optional[str] = None, triage_steps: Optional[str] = None,
+                 max_detections: int = 1):
+        self.llm_provider = llm_provider
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.data_source = data_source
+        self.detection_language = detection_language
+        self.detection_steps = detection_steps
+        self.triage_steps = triage_steps
+        # suggested detections carried through rule, guide, QA and summary, in the order they were suggested
+        self.max_detections = max_detections
+
+    def model_params(self) -> dict[str, Any]:
+        return {
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "llm_provider": self.llm_provider,
+            "model": self.model,
+        }
+
+
+class Checkpoint:
+    """
+    Append-only log of finished items in the output directory. An item is only logged once its result files
+    are written, so a run that is interrupted and started again skips exactly the items already done.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done = {}
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # the last line of a run killed mid-write
+                        continue
+
+                    self.done[entry["id"]] = entry
+
+    def is_done(self, item: BulkItem) -> bool:
+        entry = self.done.get(item.id)
+
+        return entry is not None and entry["status"] == "done" and entry["fingerprint"] == item.fingerprint()
+
+    def record(self, item: BulkItem, status: str, error: Optional[str] = None):
+        entry = {"id": item.id, "fingerprint": item.fingerprint(), "status": status, "error": error}
+        self.done[item.id] = entry
+
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class ItemResult:
+    item: BulkItem
+    status: str
+    error: Optional[str]
+    result: Optional[dict[str, Any]]
+    wall_seconds: float
+
+    def __init__(self, item: BulkItem, status: str, error: Optional[str], result: Optional[dict[str, Any]], wall_seconds: float):
+        self.item = item
+        self.status = status
+        self.error = error
+        self.result = result
+        self.wall_seconds = wall_seconds
+
+
+class BulkEngine:
+    """Runs the PromptSignature pipeline over manifest items on a bounded worker pool."""
+
+    def __init__(self, settings: BulkSettings, output_dir: str = BULK_OUTPUT_DIR, workers: int = BULK_WORKERS):
+        self.settings = settings
+        self.output_dir = output_dir
+        self.workers = workers
+        self._cancelled = threading.Event()
+
+    def pending(self, items: list[BulkItem]) -> list[BulkItem]:
+        """Items not processed yet by a previous run into the same output directory."""
+        checkpoint = Checkpoint(os.path.join(self.output_dir, CHECKPOINT_FILE))
+
+        return [item for item in items if not checkpoint.is_done(item)]
+
+    def run(self, items: list[BulkItem]) -> Iterator[ItemResult]:
+        """
+        Process the pending items and yield their results as they finish. Results are written to the output
+        directory before they are yielded, so consumers may stop iterating at any time.
+        """
+        self._cancelled.clear()
+        os.makedirs(self.output_dir, exist_ok=True)
+        checkpoint = Checkpoint(os.path.join(self.output_dir, CHECKPOINT_FILE))
+        pending = [item for item in items if not checkpoint.is_done(item)]
+        logger.info(f"Bulk run: {len(pending)} of {len(items)} items pending, {self.workers} workers")
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bulk") as executor:
+            futures = [executor.submit(self._process, item) for item in pending]
+            written = set()
+            try:
+                for future in as_completed(futures):
+                    item_result = future.result()
+                    self._write(item_result, checkpoint)
+                    written.add(future)
+                    yield item_result
+            finally:
+                # stopping early, or failing, drops the items that did not start
+                self._cancelled.set()
+                for future in futures:
+                    future.cancel()
+
+                # the items in flight run to completion anyway, keep their results for the next run
+                for future in futures:
+                    if future in written or future.cancelled():
+                        continue
+
+                    self._write(future.result(), checkpoint)
+
+    def cancel(self):
+        """Stop after the items in flight, the others are left for the next run."""
+        self._cancelled.set()
+
+    def _process(self, item: BulkItem) -> ItemResult:
+        started_at = time.monotonic()
+        if self._cancelled.is_set():
+            return ItemResult(item, "cancelled", None, None, 0.0)
+
+        try:
+            result = process_item(item, self.settings)
+        except Exception as e:
+            logger.error(f"Bulk item {item.id} failed: {e}")
+            error = "".join(traceback.format_exception_only(type(e), e)).strip()
+
+            return ItemResult(item, "failed", error, None, time.monotonic() - started_at)
+
+        return ItemResult(item, "done", None, result, time.monotonic() - started_at)
+
+    def _write(self, item_result: ItemResult, checkpoint: Checkpoint):
+        if item_result.status == "cancelled":
+            return
+
+        item = item_result.item
+        if item_result.result is not None:
+            item_dir = os.path.join(self.output_dir, item.id)
+            os.makedirs(item_dir, exist_ok=True)
+
+            _write_atomic(os.path.join(item_dir, ITEM_RESULT_FILE), json.dumps(item_result.result, indent=2))
+            for i, detection in enumerate(item_result.result["detections"], start=1):
+                _write_atomic(os.path.join(item_dir, f"summary-{i}.md"), detection["final_summary"])
+
+        line = {"id": item.id, "status": item_result.status, "error": item_result.error, "wall_seconds": item_result.wall_seconds}
+        with open(os.path.join(self.output_dir, RESULTS_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps(line) + "\n")
+
+        checkpoint.record(item, item_result.status, item_result.error)
+
+
+def process_item(item: BulkItem, settings: BulkSettings) -> dict[str, Any]:
+    """Suggest detections for an item and carry the first ones through rule, guide, QA and summary."""
+    reports = dedup_sources(load_reports(item)).contents
+    data_source = item.data_source or settings.data_source
+    detection_language = item.detection_language or settings.detection_language
+
+    suggested = PromptSignature.suggest_detections_from_intel(
+        goal=item.goal,
+        reports=reports,
+        data_source=data_source,
+        model_params=settings.model_params(),
+    )
+
+    selected = suggested[:settings.max_detections]
+    rules = PromptSignature.create_detection_rules(
+        detection_descriptions=selected,
+        detection_language=detection_language,
+        example_logs=[],
+        example_detections=[],
+        detection_steps=settings.detection_steps,
+        model_params=settings.model_params(),
+    )
+
+    detections = []
+    for detection, (rule, _) in zip(selected, rules):
+        guide, _ = PromptSignature.develop_investigation_guide(
+            detection_rule=rule,
+            standard_op_procedure=settings.triage_steps,
+            model_params=settings.model_params(),
+        )
+        score, assessment, _ = PromptSignature.qa_review(
+            detection_description=detection,
+            detection_rule=rule,
+            model_params=settings.model_params(),
+        )
+        summary, _ = PromptSignature.final_summary(
+            detection_description=detection,
+            detection_rule=rule,
+            investigation_guide=guide,
+            qa_assessment=assessment,
+            qa_score=score,
+            model_params=settings.model_params(),
+        )
+
+        detections.append({
+            "detection": detection.model_dump(),
+            "detection_rule": rule.model_dump(),
+            "investigation_guide": guide,
+            "qa_score": score,
+            "qa_assessment": assessment,
+            "final_summary": summary,
+        })
+
+    return {
+        "id": item.id,
+        "goal": item.goal,
+        "reports": item.reports,
+        "data_source": data_source,
+        "detection_language": detection_language,
+        "model": f"{settings.llm_provider}/{settings.model}",
+        "suggested_detections": [d.model_dump() for d in suggested],
+        "detections": detections,
+    }
+
+
+def load_reports(item: BulkItem) -> list[str]:
+    contents = list(item.report_texts)
+
+    for report in item.reports:
+        if report.startswith(("http://", "https://")):
+            content, _ = scrape.website_to_md(report)
+        else:
+            content = pdf.serialize_file(SpooledUpload.from_path(report), layout_aware=True)
+
+        contents.append(content)
+
+    return contents
+
+
+class BulkJob:
+    """A bulk run in a background thread, so the page can show its progress while it runs."""
+
+    engine: BulkEngine
+    total: int
+    results: list[ItemResult]
+    error: Optional[str]
+
+    def __init__(self, engine: BulkEngine, items: list[BulkItem]):
+        self.engine = engine
+        self.items = items
+        self.total = len(engine.pending(items))
+        self.results = []
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="bulk-job", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self.engine.cancel()
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def counts(self) -> dict[str, int]:
+        results = list(self.results)
+        counts = {"done": 0, "failed": 0}
+        for item_result in results:
+            counts[item_result.status] = counts.get(item_result.status, 0) + 1
+
+        return counts
+
+    def _run(self):
+        try:
+            for item_result in self.engine.run(self.items):
+                self.results.append(item_result)
+        except Exception as e:
+            logger.error(f"Bulk job failed: {e}")
+            self.error = str(e)
+
+
+def _write_atomic(path: str, content: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+    os.replace(tmp_path, path)
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import re
+from typing import Any, Iterator, Optional
+
+
+REPORT_EXTENSIONS = (".txt", ".md", ".pdf")
+# Goal of the items of a directory manifest, read from this file in the item directory.
+GOAL_FILE = "goal.txt"
+
+_UNSAFE_ID_CHARS = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+class ManifestError(Exception):
+    pass
+
+
+class BulkItem:
+    """A goal and its threat reports, processed like one run of the detection engineering wizard."""
+
+    id: str
+    goal: str
+    reports: list[str]
+    report_texts: list[str]
+    data_source: Optional[str]
+    detection_language: Optional[str]
+
+    def __init__(self, id: str, goal: str, reports: list[str], report_texts: Optional[list[str]] = None,
+                 data_source: Optional[str] = None, detection_language: Optional[str] = None):
+        self.id = id
+        self.goal = goal
+        # paths of report files or URLs
+        self.reports = reports
+        self.report_texts = report_texts or []
+        self.data_source = data_source
+        self.detection_language = detection_language
+
+    def fingerprint(self) -> str:
+        """Changes when the item changes, so an edited item is processed again on resume."""
+        data = json.dumps(
+            [self.goal, self.reports, self.report_texts, self.data_source, self.detection_language],
+            sort_keys=True,
+        )
+
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+def read_manifest(path: str, default_goal: Optional[str] = None, root: Optional[str] = None, allow_paths: bool = True) -> list[BulkItem]:
+    """
+    Items of a JSONL manifest, one {"id", "goal", "reports", "report_text", "data_source", "detection_language"}
+    object per line, or of a directory where every report file or sub-directory of reports is an item.
+    Relative report paths are resolved against the manifest location. With a root, report paths must resolve
+    inside it; without allow_paths, e.g. for an uploaded manifest, reports must be URLs or report_text.
+    """
+    if os.path.isdir(path):
+        items = list(_iter_directory(path, default_goal))
+    else:
+        items = list(_iter_jsonl(path, default_goal))
+
+    seen = set()
+    for item in items:
+        if item.id in seen:
+            raise ManifestError(f"Duplicate item id {item.id} in {path}")
+        seen.add(item.id)
+
+        item.reports = [_check_report(report, root, allow_paths) for report in item.reports]
+
+    return items
+
+
+def within_root(path: str, root: str) -> str:
+    """Real path of path, symlinks resolved. Raises ManifestError unless it is inside root."""
+    real_path = os.path.realpath(path)
+    real_root = os.path.realpath(root)
+    if os.path.commonpath([real_path, real_root]) != real_root:
+        raise ManifestError(f"{path} is outside {root}")
+
+    return real_path
+
+
+def _iter_jsonl(path: str, default_goal: Optional[str]) -> Iterator[BulkItem]:
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ManifestError(f"{path}:{line_number}: invalid JSON: {e}")
+
+            yield _item_from_entry(entry, line_number, base_dir, default_goal, f"{path}:{line_number}")
+
+
+def _item_from_entry(entry: dict[str, Any], line_number: int, base_dir: str, default_goal: Optional[str], where: str) -> BulkItem:
+    goal = entry.get("goal") or default_goal
+    if not goal:
+        raise ManifestError(f"{where}: missing goal")
+
+    reports = entry.get("reports", [])
+    if isinstance(reports, str):
+        reports = [reports]
+
+    report_texts = entry.get("report_text", [])
+    if isinstance(report_texts, str):
+        report_texts = [report_texts]
+
+    if not reports and not report_texts:
+        raise ManifestError(f"{where}: no reports or report_text")
+
+    return BulkItem(
+        id=_safe_id(str(entry.get("id") or f"item-{line_number}")),
+        goal=goal,
+        reports=[_resolve(report, base_dir) for report in reports],
+        report_texts=report_texts,
+        data_source=entry.get("data_source"),
+        detection_language=entry.get("detection_language"),
+    )
+
+
+def _iter_directory(path: str, default_goal: Optional[str]) -> Iterator[BulkItem]:
+    for name in sorted(os.listdir(path)):
+        entry_path = os.path.join(path, name)
+
+        if os.path.isdir(entry_path):
+            reports = [
+                os.path.join(entry_path, report) for report in sorted(os.listdir(entry_path))
+                if report.lower().endswith(REPORT_EXTENSIONS) and report != GOAL_FILE
+            ]
+            goal = _read_goal(entry_path) or default_goal
+        elif name.lower().endswith(REPORT_EXTENSIONS) and name != GOAL_FILE:
+            reports = [entry_path]
+            goal = default_goal
+        else:
+            continue
+
+        if not reports:
+            continue
+        if not goal:
+            raise ManifestError(f"{entry_path}: missing goal, add a {GOAL_FILE} or pass a default goal")
+
+        yield BulkItem(id=_safe_id(os.path.splitext(name)[0]), goal=goal, reports=reports)
+
+
+def _read_goal(directory: str) -> Optional[str]:
+    goal_path = os.path.join(directory, GOAL_FILE)
+    if not os.path.exists(goal_path):
+        return None
+
+    with open(goal_path, encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+def _check_report(report: str, root: Optional[str], allow_paths: bool) -> str:
+    if report.startswith(("http://", "https://")):
+        return report
+    if not allow_paths:
+        raise ManifestError(f"{report}: reports of an uploaded manifest must be URLs or report_text")
+    if root is not None:
+        return within_root(report, root)
+
+    return report
+
+
+def _resolve(report: str, base_dir: str) -> str:
+    if report.startswith(("http://", "https://")) or os.path.isabs(report):
+        return report
+
+    return os.path.join(base_dir, report)
+
+
+def _safe_id(item_id: str) -> str:
+    # ids name the output directory of the item
+    return _UNSAFE_ID_CHARS.sub("_", item_id).strip("._") or "item"
@@ -0,0 +1,184 @@
+import os
+import streamlit as st
+from streamlit.logger import get_logger
+from app.bulk.engine import BulkEngine, BulkJob, BulkSettings, BULK_OUTPUT_DIR, BULK_ROOT, BULK_WORKERS
+from app.bulk.manifest import BulkItem, read_manifest, within_root, ManifestError
+from app.ingestion.spool import spool_upload, release_upload
+from app.state import StateKey, State
+
+
+logger = get_logger(__name__)
+
+BULK_PROGRESS_REFRESH_SECONDS = 2
+BULK_RECENT_RESULTS = 20
+
+
+class BulkProcessingView:
+    def render(self):
+        """Render the Bulk Detection Processing tab."""
+        st.subheader("Bulk Detection Processing")
+        st.write(
+            "Run the whole pipeline over many goal and report pairs, using the model and detection settings of the sidebar. "
+            "Each line of a JSONL manifest is an item: `{\"id\": ..., \"goal\": ..., \"reports\": [paths or URLs], \"report_text\": ...}`. "
+            "A directory manifest makes an item of every report file, or of every sub-directory of reports with a `goal.txt`. "
+            f"Server paths must be inside `{BULK_ROOT}`."
+        )
+
+        job = State.get(StateKey.BULK_JOB)
+        running = job is not None and job.running
+
+        self.render_job_form(running)
+
+        if running:
+            render_bulk_progress()
+        elif job is not None:
+            render_job_status(job)
+
+    def render_job_form(self, running: bool):
+        st.file_uploader(
+            "Upload a JSONL manifest:",
+            type=["jsonl"],
+            help="Reports of an uploaded manifest must be URLs or inline report_text.",
+            key=self.uploader_key(),
+        )
+        st.text_input(
+            "Or a manifest path on the server:",
+            placeholder=os.path.join(BULK_ROOT, "manifest.jsonl"),
+            key=State.component_key(StateKey.BULK_MANIFEST_PATH),
+        )
+        st.text_area(
+            "Goal of items without one:",
+            height=80,
+            key=State.component_key(StateKey.BULK_DEFAULT_GOAL),
+        )
+
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            st.text_input(
+                "Output directory:",
+                value=BULK_OUTPUT_DIR,
+                help=f"Inside {BULK_ROOT}. Results are written here as items finish. Starting again with the same directory resumes the run.",
+                key=State.component_key(StateKey.BULK_OUTPUT_DIR),
+            )
+        with col2:
+            st.number_input("Workers", min_value=1, max_value=32, value=BULK_WORKERS, key=State.component_key(StateKey.BULK_WORKERS))
+        with col3:
+            st.number_input("Detections per item", min_value=1, max_value=20, value=1, key=State.component_key(StateKey.BULK_MAX_DETECTIONS))
+
+        if st.button("Start bulk processing", type="primary", disabled=running):
+            try:
+                items = self.read_items()
+            except (ManifestError, OSError, ValueError) as e:
+                st.error(f"Invalid manifest: {e}")
+                return
+
+            try:
+                output_dir = within_root(State.get(StateKey.BULK_OUTPUT_DIR) or BULK_OUTPUT_DIR, BULK_ROOT)
+            except ManifestError as e:
+                st.error(f"Invalid output directory: {e}")
+                return
+
+            engine = BulkEngine(self.settings(), output_dir=output_dir, workers=State.get(StateKey.BULK_WORKERS))
+            job = BulkJob(engine, items)
+            job.start()
+            State.set(StateKey.BULK_JOB, job)
+            logger.info(f"Started bulk job over {len(items)} items, {job.total} pending")
+
+            st.rerun()
+
+    def read_items(self) -> list[BulkItem]:
+        """
+        Items of the uploaded manifest, which may only list URLs and report_text, or of the server manifest,
+        which with its reports must be inside BULK_ROOT.
+        """
+        default_goal = State.get(StateKey.BULK_DEFAULT_GOAL) or None
+
+        uploaded_manifest = State.get(self.uploader_key())
+        if uploaded_manifest is not None:
+            try:
+                spooled = spool_upload(uploaded_manifest)
+            finally:
+                release_upload(uploaded_manifest)
+                State.set(StateKey.BULK_MANIFEST_FILE_GENERATION, State.get(StateKey.BULK_MANIFEST_FILE_GENERATION, 0) + 1)
+
+            try:
+                return read_manifest(spooled.path, default_goal=default_goal, allow_paths=False)
+            finally:
+                spooled.discard()
+
+        path = (State.get(StateKey.BULK_MANIFEST_PATH) or "").strip()
+        if not path:
+            raise ValueError("upload a manifest or enter its path")
+
+        path = within_root(path, BULK_ROOT)
+        if not os.path.exists(path):
+            raise ValueError(f"{path} does not exist")
+
+        return read_manifest(path, default_goal=default_goal, root=BULK_ROOT)
+
+    def uploader_key(self) -> str:
+        # the uploader is re-keyed once the manifest is read so it does not keep showing a released file
+        generation = State.get(StateKey.BULK_MANIFEST_FILE_GENERATION, 0)
+
+        return State.component_key(StateKey.BULK_MANIFEST_FILE, suffix=f"_{generation}")
+
+    def settings(self) -> BulkSettings:
+        data_source = State.get(StateKey.DATA_SOURCE) or []
+
+        return BulkSettings(
+            llm_provider=State.get(StateKey.LLM_PROVIDER),
+            model=State.get(StateKey.MODEL),
+            temperature=State.get(StateKey.MODEL_TEMPERATURE),
+            max_tokens=State.get(StateKey.MODEL_MAX_TOKENS),
+            data_source=", ".join(data_source) if isinstance(data_source, list) else data_source,
+            detection_language=State.get(StateKey.DETECTION_LANG),
+            detection_steps=State.get(StateKey.DETECTION_STEPS) or None,
+            triage_steps=State.get(StateKey.TRIAGE_STEPS) or None,
+            max_detections=State.get(StateKey.BULK_MAX_DETECTIONS, 1),
+        )
+
+
+@st.fragment(run_every=BULK_PROGRESS_REFRESH_SECONDS)
+def render_bulk_progress():
+    """Refreshes on its own while the job runs, without rerunning the rest of the page."""
+    job = State.get(StateKey.BULK_JOB)
+    if not job.running:
+        # a full rerun enables the form again
+        st.rerun()
+
+    render_job_status(job)
+
+
+def render_job_status(job: BulkJob):
+    counts = job.counts()
+    finished = counts["done"] + counts["failed"]
+
+    st.progress(
+        finished / job.total if job.total else 1.0,
+        text=f"{finished}/{job.total} items processed, {counts['failed']} failed",
+    )
+
+    if job.error is not None:
+        st.error(f"Bulk processing stopped: {job.error}")
+
+    if job.running:
+        if st.button("Cancel", help="Finish the items in flight and stop. Start again to resume."):
+            job.cancel()
+    else:
+        st.success(f"Bulk processing finished, results are in {job.engine.output_dir}")
+        if st.button("Dismiss"):
+            State.set(StateKey.BULK_JOB, None)
+            st.rerun()
+
+    recent = [r for r in job.results if r.status != "cancelled"][-BULK_RECENT_RESULTS:]
+    if recent:
+        st.table([
+            {
+                "item": r.item.id,
+                "status": r.status,
+                "detections": len(r.result["detections"]) if r.result else 0,
+                "wall (s)": round(r.wall_seconds, 1),
+                "error": r.error or "",
+            }
+            for r in reversed(recent)
+        ])
@@ -1,11 +1,21 @@
 import streamlit as st
 from app.llm.prompt import Debug
+from app.llm.streaming import SignatureStream
 
 
 def line_separator():
     st.markdown("<hr>", unsafe_allow_html=True)
 
 
+def render_stream(label: str, stream: SignatureStream):
+    """Show the completion as it arrives and return the stream result once done."""
+    with st.status(label, expanded=True) as status:
+        st.write_stream(stream)
+        status.update(state="complete", expanded=False)
+
+    return stream.result
+
+
 class DetectionDetailComponent:
     def __init__(self, detection):
         self.detection = detection
@@ -30,3 +40,13 @@ class DebugInfoComponent:
 
             st.write("**Response**:")
             st.code(debug_info.response)
+
+            if debug_info.budget is not None:
+                self.render_budget(debug_info.budget)
+
+    def render_budget(self, budget):
+        st.write(
+            f"**Token budget** ({budget.model}): ~{budget.prompt_tokens} prompt tokens of "
+            f"{budget.available_prompt_tokens} available, {budget.context_window} context window."
+        )
+        st.table(budget.rows())
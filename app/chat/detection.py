@@ -1,14 +1,18 @@
+import sys
 import streamlit as st
 from streamlit.logger import get_logger
 from app.state import StateKey, State, DETECTION_ENGINEERING_STEPS, DetectionEngineeringStep
 from .components import line_separator
 from app.ingestion import pdf, scrape
+from app.ingestion.layout import IOC_TABLE_MODES
+from app.ingestion.spool import spool_upload, release_upload, check_memory_budget, MemoryBudgetExceeded
 
 from .steps import (SuggestDetectionStepComponent,
                     GenerateRuleStepComponent,
                     InvestigationGuideStepComponent,
                     QAReviewStepComponent,
-                    FinalSummaryStepComponent)
+                    FinalSummaryStepComponent,
+                    run_ready_steps_concurrently)
 
 logger = get_logger(__name__)
 
@@ -49,7 +53,7 @@ class DetectionCreationView:
                     disabled=disable_start_button,
                     use_container_width=True,
                 ):
-                    State.advance_detection_engineering_step()
+                    State.complete_detection_engineering_step(DetectionEngineeringStep.INIT)
                     st.rerun()
 
             with col2:
@@ -60,9 +64,6 @@ class DetectionCreationView:
             self.render_output()
 
     def render_output(self):
-        step = State.get(StateKey.DETECTION_ENG_CURRENT_STEP)
-        logger.info(f"Rendering output for step {step}")
-
         step_render = {
             DetectionEngineeringStep.SUGGEST_DETECTION_FROM_INTEL: SuggestDetectionStepComponent(),
             DetectionEngineeringStep.GENERATE_DETECTION_RULE: GenerateRuleStepComponent(),
@@ -71,6 +72,11 @@ class DetectionCreationView:
             DetectionEngineeringStep.FINAL_SUMMARY: FinalSummaryStepComponent(),
         }
 
+        run_ready_steps_concurrently(step_render)
+
+        step = State.get(StateKey.DETECTION_ENG_CURRENT_STEP)
+        logger.info(f"Rendering output for step {step}")
+
         for s in DETECTION_ENGINEERING_STEPS:
             if s > step:
                 break
@@ -85,7 +91,8 @@ class DetectionCreationView:
     def render_progress(self):
         current_step = State.get(StateKey.DETECTION_ENG_CURRENT_STEP)
         logger.info(f"Rendering progress bar for {current_step}, of all {DETECTION_ENGINEERING_STEPS}")
-        step_index = DETECTION_ENGINEERING_STEPS.index(current_step) + 1
+        # steps may complete out of order, so progress counts completed steps
+        step_index = min(len(State.get(StateKey.DETECTION_ENG_COMPLETED_STEPS, set())) + 1, len(DETECTION_ENGINEERING_STEPS))
         total = len(DETECTION_ENGINEERING_STEPS)
 
         st.progress(step_index / total,
@@ -106,12 +113,17 @@ class DetectionCreationView:
 
         if st.button("Add threat source", type="secondary"):
             self.render_threat_source_modal()
+        else:
+            # the dialog reruns on its own while open, so a full rerun without it means it was closed
+            State.discard_spooled_upload()
 
         sources = State.get(StateKey.THREAT_SOURCES, [])
         for i, source in enumerate(sources):
             with st.expander(f"Threat Source {i + 1}", expanded=False):
                 st.write(f"**Type:** {source['type']}")
                 st.write(f"**ID:** {source['id']}")
+                if source.get('tokens_saved'):
+                    st.write(f"**Boilerplate removed:** ~{source['tokens_saved']} tokens")
 
                 st.button("Remove", key=f"remove_source_{i}", on_click=self.remove_threat_source(i))
 
@@ -136,32 +148,135 @@ class DetectionCreationView:
         if State.get(StateKey.SCRAPED_THREAT_SOURCE) is not None:
             st.success("Scraping complete!")
 
+        with st.expander("Bulk mode", expanded=False):
+            self.render_bulk_scrape()
+
         line_separator()
 
         st.subheader("Parse threat intel report")
         st.file_uploader(
             "Upload file (optional):",
             type=["txt", "md", "pdf"],
-            key=State.component_key(StateKey.UPLOADED_THREAT_FILE),
+            key=self.uploader_key(),
             label_visibility="visible",
             on_change=self.update_threat_source_from_file,
         )
 
-        if st.button("Submit", type="primary"):
-            if State.get(StateKey.SCRAPED_THREAT_SOURCE) is not None:
-                scraped = State.get(StateKey.SCRAPED_THREAT_SOURCE)
+        upload_error = State.get(StateKey.UPLOADED_THREAT_FILE_ERROR)
+        if upload_error is not None:
+            st.error(upload_error)
+            State.delete(StateKey.UPLOADED_THREAT_FILE_ERROR)
 
-                State.append(StateKey.THREAT_SOURCES, {'type': 'scrape', 'id': scrape_url, 'content': scraped})
-                State.delete(StateKey.SCRAPED_THREAT_SOURCE)
-            elif State.get(StateKey.UPLOADED_THREAT_FILE) is not None:
-                uploaded_file = State.get(StateKey.UPLOADED_THREAT_FILE)
-                file_content = pdf.serialize_file(uploaded_file)
+        spooled_file = State.get(StateKey.SPOOLED_THREAT_FILE)
+        if spooled_file is not None:
+            st.success(f"Uploaded {spooled_file.name} ({spooled_file.size / (1024 * 1024):.1f} MB)")
 
-                State.append(StateKey.THREAT_SOURCES, {'type': 'file', 'id': uploaded_file.name, 'content': file_content})
-                State.delete(StateKey.UPLOADED_THREAT_FILE)
+        st.text_input(
+            "Pages (optional, PDF only):",
+            placeholder="1-10, 15, 40-",
+            help="Extract only the selected pages. Leave empty to extract the whole document.",
+            key=State.component_key(StateKey.UPLOADED_THREAT_FILE_PAGES),
+        )
+        try:
+            pdf.normalize_page_ranges(State.get(StateKey.UPLOADED_THREAT_FILE_PAGES))
+        except ValueError as e:
+            st.error(str(e))
+        layout_aware = st.checkbox(
+            "Strip repeated headers, footers and page furniture (PDF only)",
+            value=True,
+            key=State.component_key(StateKey.UPLOADED_THREAT_FILE_LAYOUT_AWARE),
+        )
+        st.selectbox(
+            "IOC table appendices:",
+            IOC_TABLE_MODES,
+            format_func=str.capitalize,
+            disabled=not layout_aware,
+            help="Appendix pages that mostly list indicators (hashes, IPs, domains) can be skipped or summarized.",
+            key=State.component_key(StateKey.UPLOADED_THREAT_FILE_IOC_TABLES),
+        )
+
+        if st.button("Submit", type="primary"):
+            try:
+                if State.get(StateKey.SCRAPED_THREAT_SOURCE) is not None:
+                    content, tokens_saved = State.get(StateKey.SCRAPED_THREAT_SOURCE)
+
+                    self.add_threat_source({'type': 'scrape', 'id': scrape_url, 'content': content, 'tokens_saved': tokens_saved})
+                    State.delete(StateKey.SCRAPED_THREAT_SOURCE)
+                elif State.get(StateKey.SPOOLED_THREAT_FILE) is not None:
+                    spooled_file = State.get(StateKey.SPOOLED_THREAT_FILE)
+                    page_ranges = State.get(StateKey.UPLOADED_THREAT_FILE_PAGES)
+                    layout_aware = State.get(StateKey.UPLOADED_THREAT_FILE_LAYOUT_AWARE, False)
+                    ioc_tables = State.get(StateKey.UPLOADED_THREAT_FILE_IOC_TABLES, "keep")
+                    with st.spinner("Extracting report..."):
+                        file_content = pdf.serialize_file(
+                            spooled_file,
+                            page_ranges=page_ranges,
+                            layout_aware=layout_aware,
+                            ioc_tables=ioc_tables,
+                        )
+
+                    # the spooled file is only discarded once the source is added, so a rejected extraction can be retried
+                    self.add_threat_source({'type': 'file', 'id': spooled_file.name, 'content': file_content})
+                    State.discard_spooled_upload()
+            except (MemoryBudgetExceeded, ValueError) as e:
+                # ValueError: a page selection that is malformed or past the last page
+                st.error(str(e))
+                return
 
             st.rerun()
 
+    def add_threat_source(self, source: dict):
+        """Append a threat source, enforcing the per-session memory ceiling."""
+        check_memory_budget(self.session_memory_usage(), sys.getsizeof(source['content']))
+
+        State.append(StateKey.THREAT_SOURCES, source)
+
+    def session_memory_usage(self) -> int:
+        """Memory held by the extracted threat sources; the pending upload is spooled to disk and not counted."""
+        sources = State.get(StateKey.THREAT_SOURCES, [])
+
+        return sum(sys.getsizeof(source['content']) for source in sources)
+
+    def uploader_key(self) -> str:
+        # the uploader is re-keyed after every upload so Streamlit forgets the file once it is spooled to disk
+        generation = State.get(StateKey.UPLOADED_THREAT_FILE_GENERATION, 0)
+
+        return State.component_key(StateKey.UPLOADED_THREAT_FILE, suffix=f"_{generation}")
+
+
+    def render_bulk_scrape(self):
+        bulk_urls = st.text_area("Enter one URL per line:", "", height=150)
+        if not st.button("Scrape all URLs"):
+            return
+
+        urls = list(dict.fromkeys(u.strip() for u in bulk_urls.splitlines() if u.strip()))
+        if not urls:
+            st.warning("No URLs provided.")
+            return
+
+        progress = st.progress(0.0, text=f"Scraped 0/{len(urls)}")
+        failed = 0
+        for done, (url, scraped, error) in enumerate(scrape.websites_to_md(urls), start=1):
+            if error is None:
+                content, tokens_saved = scraped
+                try:
+                    self.add_threat_source({'type': 'scrape', 'id': url, 'content': content, 'tokens_saved': tokens_saved})
+                    st.write(f":white_check_mark: {url}")
+                except MemoryBudgetExceeded as e:
+                    failed += 1
+                    st.write(f":x: {url}: {e}")
+            else:
+                failed += 1
+                st.write(f":x: {url}: {error}")
+
+            progress.progress(done / len(urls), text=f"Scraped {done}/{len(urls)}")
+
+        if failed:
+            # keep the dialog open so the failures stay visible, the added sources show up on the next rerun
+            st.warning(f"Added {len(urls) - failed} sources, {failed} failed.")
+            return
+
+        st.rerun()
 
     def render_prompt_customization(self):
         st.write("**Prompt customization**")
@@ -184,9 +299,22 @@ class DetectionCreationView:
             )
 
     def update_threat_source_from_file(self):
-        """Update the threat source based on the uploaded file."""
-        uploaded_file = State.get(StateKey.UPLOADED_THREAT_FILE)
+        """Spool the uploaded file to disk and release the in-memory upload right away."""
+        uploaded_file = State.get(self.uploader_key())
         logger.info(f"Uploaded File: {uploaded_file}")
+        if uploaded_file is None:
+            return
+
+        try:
+            # a new upload replaces the pending one
+            State.discard_spooled_upload()
+
+            State.set(StateKey.SPOOLED_THREAT_FILE, spool_upload(uploaded_file))
+        except OSError as e:
+            State.set(StateKey.UPLOADED_THREAT_FILE_ERROR, f"Failed to store the upload: {e}")
+        finally:
+            release_upload(uploaded_file)
+            State.set(StateKey.UPLOADED_THREAT_FILE_GENERATION, State.get(StateKey.UPLOADED_THREAT_FILE_GENERATION, 0) + 1)
 
     def render_example_detections(self):
         """Render the Example Detections section."""
@@ -1,8 +1,15 @@
 import streamlit as st
+from dotenv import load_dotenv
 from streamlit.logger import get_logger
 from app.state import StateKey, State, DETECTION_ENGINEERING_STEPS
 from .detection import DetectionCreationView
-from app.llm.setup import PROVIDERS, MODELS
+from .bulk import BulkProcessingView
+from app.llm.setup import PROVIDERS, MODELS, flush_lm_pool
+from app.llm.cache import response_cache
+from app.llm.metrics import metrics_registry
+from app.llm.ratelimit import rate_limiter
+from app.llm.routing import ROUTED_STEPS, default_step_models
+from app.llm.speculation import SPECULATIVE_RULES, SPECULATION_TOKEN_CAP
 
 logger = get_logger(__name__)
 
@@ -24,13 +31,14 @@ class DetectionEngineeringPage:
             st.write(" Detection Engineering engine powered by LLM.")
 
             self.render_configuration_section()
+            self.render_metrics()
 
     def render_configuration_section(self):
         """Render the configuration section in the sidebar."""
         llm_providers = list(PROVIDERS.keys())
 
         selected_provider = State.get(StateKey.LLM_PROVIDER, llm_providers[0])
-        models = MODELS.get(PROVIDERS[selected_provider])
+        models = list(MODELS.get(PROVIDERS[selected_provider]))
 
         st.write("### Configuration")
         st.selectbox("LLM Provider", llm_providers, key=State.component_key(StateKey.LLM_PROVIDER))
@@ -68,6 +76,8 @@ class DetectionEngineeringPage:
             key=State.component_key(StateKey.DETECTION_LANG),
         )
 
+        self.render_step_models(models)
+
         st.write("### Model Parameters")
         st.slider(
             "Temperature",
@@ -85,6 +95,98 @@ class DetectionEngineeringPage:
             key=State.component_key(StateKey.MODEL_MAX_TOKENS),
         )
 
+        st.checkbox(
+            "Stream responses",
+            value=True,
+            help="Show the rule, investigation guide and summary as they are generated.",
+            key=State.component_key(StateKey.STREAM_RESPONSES),
+        )
+        st.checkbox(
+            "Speculative rule generation",
+            value=False,
+            help=f"Start generating rules for the top {SPECULATIVE_RULES} suggested detections while you review them. "
+                 f"Spends up to ~{SPECULATION_TOKEN_CAP} tokens per analysis on rules that may go unused.",
+            key=State.component_key(StateKey.SPECULATIVE_RULES),
+        )
+        st.checkbox(
+            "Cache sampled responses",
+            value=False,
+            help="Reuse cached LLM responses even when temperature is above 0. Leave off to get a fresh sample on every run.",
+            key=State.component_key(StateKey.CACHE_SAMPLED_RESPONSES),
+        )
+        self.render_response_cache_stats()
+
+        if st.button("Reconnect LLM clients", help="Drop the pooled LLM clients and reload provider credentials, e.g. after rotating keys."):
+            load_dotenv(override=True)
+            flush_lm_pool()
+            st.toast("LLM clients reconnected.")
+
+    def render_step_models(self, models):
+        """Route steps to their own model, e.g. a fast model for the QA score and a strong one for the rule."""
+        default_routes = default_step_models()
+        same_as_default = "Same as Model Type"
+
+        with st.expander("Per-step models", expanded=False):
+            for step, label in ROUTED_STEPS.items():
+                key = State.component_key(StateKey.STEP_MODEL, suffix=f"_{step}")
+                if not State.has(key) and default_routes.get(step) in models:
+                    State.set(key, default_routes[step])
+
+                st.selectbox(label, [None] + models, key=key, format_func=lambda m: m or same_as_default)
+
+            st.checkbox(
+                "Escalate invalid outputs",
+                value=False,
+                help="Retry a step on the main model when the output of its routed model fails validation. "
+                     "Streamed steps are not escalated: with streaming on, this covers the suggestions and the QA review.",
+                key=State.component_key(StateKey.ESCALATE_INVALID_OUTPUT),
+            )
+
+    def render_metrics(self):
+        """Per-step latency, token and cost figures of the LLM calls made by this server."""
+        registry = metrics_registry()
+
+        with st.expander("LLM metrics", expanded=False):
+            queued = sum(rate_limiter().queue_depths().values())
+            if queued:
+                st.caption(f"{queued} LLM requests queued behind the rate limiter.")
+
+            totals = registry.totals()
+            if not totals:
+                st.caption("No LLM calls yet.")
+                return
+
+            st.table([
+                {
+                    "step": row["step"],
+                    "calls": row["calls"],
+                    "mean wall (s)": round(row["wall_seconds"] / row["calls"], 2),
+                    "mean TTFT (s)": round(row["ttft_seconds"] / row["calls"], 2),
+                    "tokens in/out": f"{row['prompt_tokens']}/{row['completion_tokens']}",
+                    "cache hits": row["cache_hits"],
+                    "retries": row["retries"],
+                    "cost ($)": round(row["cost"], 4),
+                }
+                for row in totals
+            ])
+
+            last = registry.recent[-1]
+            st.caption(
+                f"Last call: {last['step']} on {last['model']} took {last['wall_seconds']:.1f}s "
+                f"(first token after {last['ttft_seconds']:.1f}s)"
+            )
+
+    def render_response_cache_stats(self):
+        stats = response_cache().stats()
+
+        st.caption(
+            f"Response cache: {stats['hits']} hits, {stats['misses']} misses, {stats['bypasses']} bypassed "
+            f"({stats['entries']} entries, {stats['bytes'] // 1024} KB)"
+        )
+        if st.button("Clear response cache"):
+            response_cache().clear()
+            st.toast("Response cache cleared.")
+
     def render_main_header(self):
         """Render the main header with app title and subtitle."""
         st.markdown(
@@ -99,7 +201,7 @@ class DetectionEngineeringPage:
     def render_tabs(self):
         """Render the tabs for different functionalities."""
         tabs = st.tabs(
-            ["Detection Engineering", "Threat Research Crew", "Bulk Detection Processing [Coming Soon]"]
+            ["Detection Engineering", "Bulk Detection Processing"]
         )
         return tabs
 
@@ -109,6 +211,10 @@ class DetectionEngineeringPage:
         self.render_sidebar()
         self.render_main_header()
 
-        detection_tab = DetectionCreationView()
+        detection_tab, bulk_tab = self.render_tabs()
+
+        with detection_tab:
+            DetectionCreationView().render()
 
-        detection_tab.render()
+        with bulk_tab:
+            BulkProcessingView().render()
@@ -1,9 +1,17 @@
+import asyncio
 import base64
+import threading
+from concurrent.futures import Future
 import streamlit as st
 from streamlit.components import v1 as components
 from streamlit.logger import get_logger
-from app.chat.components import DetectionDetailComponent, DebugInfoComponent, line_separator
+from app.chat.components import DetectionDetailComponent, DebugInfoComponent, line_separator, render_stream
 from app.llm.prompt import PromptSignature
+from app.llm.async_prompt import AsyncPromptSignature
+from app.llm.speculation import RuleSpeculation, SPECULATIVE_RULES
+from app.llm.cache import CACHE_SAMPLED_RESPONSES
+from app.llm.routing import route_model, ESCALATION_MODELS
+from app.ingestion.dedup import dedup_sources
 from app.state import step_update_transaction, State, StateKey, DetectionEngineeringStep
 
 
@@ -20,6 +28,7 @@ class SuggestDetectionStepComponent:
         detections = self.run_analysis()
 
         self.render_detection_list(detections)
+        self.speculate_rules(detections)
 
         with step_update_transaction():
             self.render_detection_selection()
@@ -33,14 +42,13 @@ class SuggestDetectionStepComponent:
         goal = State.get(StateKey.DETECTION_GOAL)
         threat_sources = State.get(StateKey.THREAT_SOURCES, [])
         data_source = State.get(StateKey.DATA_SOURCE)
-        model_params = {
-            "temperature": State.get(StateKey.MODEL_TEMPERATURE),
-            "max_tokens": State.get(StateKey.MODEL_MAX_TOKENS),
-            "llm_provider": State.get(StateKey.LLM_PROVIDER),
-            "model": State.get(StateKey.MODEL),
-        }
+        model_params = model_params_from_state("suggest_detections_from_intel")
 
-        threat_sources = [source['content'] for source in threat_sources]
+        dedup = dedup_sources([source['content'] for source in threat_sources])
+        if dedup.duplicate_paragraphs:
+            st.info(f"Removed {dedup.duplicate_paragraphs} duplicate passages (~{dedup.duplicate_tokens} tokens) across threat sources.")
+
+        threat_sources = dedup.contents
 
         with st.spinner("Analyzing threat intelligence..."):
             detections = PromptSignature.suggest_detections_from_intel(
@@ -60,6 +68,26 @@ class SuggestDetectionStepComponent:
 
         return detections
 
+    def speculate_rules(self, detections):
+        """Start generating rules for the top suggestions while the analyst reads them."""
+        if not detections or not State.get(StateKey.SPECULATIVE_RULES, False):
+            return
+        if State.get(StateKey.DETECTION_ENG_CURRENT_STEP) != DetectionEngineeringStep.SUGGEST_DETECTION_FROM_INTEL:
+            return
+
+        speculation = State.get(StateKey.RULE_SPECULATION)
+        if speculation is None:
+            speculation = RuleSpeculation()
+            State.set(StateKey.RULE_SPECULATION, speculation)
+
+        for detection in detections[:SPECULATIVE_RULES]:
+            speculation.speculate(
+                detection,
+                detection_language=State.get(StateKey.DETECTION_LANG),
+                detection_steps=State.get(StateKey.DETECTION_STEPS),
+                model_params=model_params_from_state("create_detection_rule"),
+            )
+
     def render_detection_list(self, detections):
         if detections is None:
             return
@@ -84,7 +112,7 @@ class SuggestDetectionStepComponent:
             selected_detection = next(d for d in detections if d.name == selected_detection_name)
 
             State.set(StateKey.SELECTED_DETECTION, selected_detection)
-            State.advance_detection_engineering_step()
+            State.complete_detection_engineering_step(DetectionEngineeringStep.SUGGEST_DETECTION_FROM_INTEL)
 
     def render_selected_detection(self):
         selected_detection = State.get(StateKey.SELECTED_DETECTION)
@@ -125,15 +153,14 @@ class GenerateRuleStepComponent:
         logger.info(f"Example detections: {example_detections}")
 
         detection_steps = State.get(StateKey.DETECTION_STEPS)
-        model_params = {
-            "temperature": State.get(StateKey.MODEL_TEMPERATURE),
-            "max_tokens": State.get(StateKey.MODEL_MAX_TOKENS),
-            "llm_provider": State.get(StateKey.LLM_PROVIDER),
-            "model": State.get(StateKey.MODEL),
-        }
-
-        with st.spinner("Processing rule creation..."):
-            detection_rule, debug_info = PromptSignature.create_detection_rule(
+        model_params = model_params_from_state("create_detection_rule")
+
+        speculated = self.take_speculated_rule(detection, detection_lang, detection_steps, model_params)
+
+        if speculated is not None:
+            detection_rule, debug_info = speculated
+        elif State.get(StateKey.STREAM_RESPONSES, True):
+            stream = PromptSignature.stream_create_detection_rule(
                 detection_description=detection,
                 detection_language=detection_lang,
                 example_logs=[],
@@ -141,14 +168,43 @@ class GenerateRuleStepComponent:
                 detection_steps=detection_steps,
                 model_params=model_params,
             )
+            detection_rule, debug_info = render_stream("Processing rule creation...", stream)
+        else:
+            with st.spinner("Processing rule creation..."):
+                detection_rule, debug_info = PromptSignature.create_detection_rule(
+                    detection_description=detection,
+                    detection_language=detection_lang,
+                    example_logs=[],
+                    example_detections=[],
+                    detection_steps=detection_steps,
+                    model_params=model_params,
+                )
 
         State.set(StateKey.DETECTION_RULE, (detection_rule, debug_info))
-        State.advance_detection_engineering_step()
+        State.complete_detection_engineering_step(DetectionEngineeringStep.GENERATE_DETECTION_RULE)
 
         return detection_rule, debug_info
 
+    def take_speculated_rule(self, detection, detection_lang, detection_steps, model_params):
+        speculation = State.get(StateKey.RULE_SPECULATION)
+        if speculation is None:
+            return None
+
+        future = speculation.take(detection, detection_lang, detection_steps, model_params)
+        if future is None or future.cancelled():
+            return None
+
+        try:
+            with st.spinner("Waiting for the rule generated in the background..."):
+                return future.result()
+        except Exception as e:
+            logger.warning(f"Speculative rule for {detection.name} failed, generating it again: {e}")
+            return None
+
 
 class InvestigationGuideStepComponent:
+    step = DetectionEngineeringStep.DEVELOP_INVESTIGATION_PLAYBOOK
+
     def render(self):
         """Render the Investigation Guide step."""
         logger.info("Rendering investigation guide")
@@ -170,27 +226,50 @@ class InvestigationGuideStepComponent:
             return
 
         triage_steps = State.get(StateKey.TRIAGE_STEPS)
-        model_params = {
-            "temperature": State.get(StateKey.MODEL_TEMPERATURE),
-            "max_tokens": State.get(StateKey.MODEL_MAX_TOKENS),
-            "llm_provider": State.get(StateKey.LLM_PROVIDER),
-            "model": State.get(StateKey.MODEL),
-        }
-
-        with st.spinner("Processing rule creation..."):
-            investigation_guide, debug_info = PromptSignature.develop_investigation_guide(
+        model_params = model_params_from_state("develop_investigation_guide")
+
+        result = take_step_call(self.step, "Processing investigation guide...")
+        if result is None and State.get(StateKey.STREAM_RESPONSES, True):
+            stream = PromptSignature.stream_develop_investigation_guide(
                 detection_rule=detection_rule,
                 standard_op_procedure=triage_steps,
                 model_params=model_params,
             )
+            result = render_stream("Processing investigation guide...", stream)
+        elif result is None:
+            with st.spinner("Processing investigation guide..."):
+                result = PromptSignature.develop_investigation_guide(
+                    detection_rule=detection_rule,
+                    standard_op_procedure=triage_steps,
+                    model_params=model_params,
+                )
 
-        State.set(StateKey.INVESTIGATION_GUIDE, (investigation_guide, debug_info))
-        State.advance_detection_engineering_step()
+        self.store(result)
 
-        return investigation_guide, debug_info
+        return result
+
+    def streams_output(self) -> bool:
+        return State.get(StateKey.STREAM_RESPONSES, True)
+
+    def run_concurrently(self, llm: AsyncPromptSignature):
+        detection_rule, _ = State.get(StateKey.DETECTION_RULE)
+
+        return llm.develop_investigation_guide(
+            detection_rule=detection_rule,
+            standard_op_procedure=State.get(StateKey.TRIAGE_STEPS),
+            model_params=model_params_from_state("develop_investigation_guide"),
+        )
+
+    def store(self, result):
+        investigation_guide, debug_info = result
+
+        State.set(StateKey.INVESTIGATION_GUIDE, (investigation_guide, debug_info))
+        State.complete_detection_engineering_step(self.step)
 
 
 class QAReviewStepComponent:
+    step = DetectionEngineeringStep.QA_REVIEW
+
     def render(self):
         """Render the Quality Assurance Review step."""
         logger.info("Rendering Quality Assurance Review")
@@ -209,24 +288,35 @@ class QAReviewStepComponent:
 
         selected_detection = State.get(StateKey.SELECTED_DETECTION)
         detection_rule, _ = State.get(StateKey.DETECTION_RULE)
-        model_params = {
-            "temperature": State.get(StateKey.MODEL_TEMPERATURE),
-            "max_tokens": State.get(StateKey.MODEL_MAX_TOKENS),
-            "llm_provider": State.get(StateKey.LLM_PROVIDER),
-            "model": State.get(StateKey.MODEL),
-        }
-
-        with st.spinner("Processing QA assessment..."):
-            score, review, debug_info = PromptSignature.qa_review(
-                detection_description=selected_detection,
-                detection_rule=detection_rule,
-                model_params=model_params,
-            )
+        model_params = model_params_from_state("qa_review")
 
-        State.set(StateKey.QA_REVIEW, (score, review, debug_info))
-        State.advance_detection_engineering_step()
+        result = take_step_call(self.step, "Processing QA assessment...")
+        if result is None:
+            with st.spinner("Processing QA assessment..."):
+                result = PromptSignature.qa_review(
+                    detection_description=selected_detection,
+                    detection_rule=detection_rule,
+                    model_params=model_params,
+                )
+
+        self.store(result)
 
-        return score, review, debug_info
+        return result
+
+    def run_concurrently(self, llm: AsyncPromptSignature):
+        detection_rule, _ = State.get(StateKey.DETECTION_RULE)
+
+        return llm.qa_review(
+            detection_description=State.get(StateKey.SELECTED_DETECTION),
+            detection_rule=detection_rule,
+            model_params=model_params_from_state("qa_review"),
+        )
+
+    def store(self, result):
+        score, review, debug_info = result
+
+        State.set(StateKey.QA_REVIEW, (score, review, debug_info))
+        State.complete_detection_engineering_step(self.step)
 
 
 class FinalSummaryStepComponent:
@@ -295,15 +385,10 @@ class FinalSummaryStepComponent:
         detection_rule, _ = State.get(StateKey.DETECTION_RULE)
         investigation_guide, _ = State.get(StateKey.INVESTIGATION_GUIDE)
         score, qa_review, _ = State.get(StateKey.QA_REVIEW)
-        model_params = {
-            "temperature": State.get(StateKey.MODEL_TEMPERATURE),
-            "max_tokens": State.get(StateKey.MODEL_MAX_TOKENS),
-            "llm_provider": State.get(StateKey.LLM_PROVIDER),
-            "model": State.get(StateKey.MODEL),
-        }
-
-        with st.spinner("Processing final summary..."):
-            summary, debug_info = PromptSignature.final_summary(
+        model_params = model_params_from_state("final_summary")
+
+        if State.get(StateKey.STREAM_RESPONSES, True):
+            stream = PromptSignature.stream_final_summary(
                 detection_description=selected_detection,
                 detection_rule=detection_rule,
                 investigation_guide=investigation_guide,
@@ -311,7 +396,102 @@ class FinalSummaryStepComponent:
                 qa_score=score,
                 model_params=model_params,
             )
+            summary, debug_info = render_stream("Processing final summary...", stream)
+        else:
+            with st.spinner("Processing final summary..."):
+                summary, debug_info = PromptSignature.final_summary(
+                    detection_description=selected_detection,
+                    detection_rule=detection_rule,
+                    investigation_guide=investigation_guide,
+                    qa_assessment=qa_review,
+                    qa_score=score,
+                    model_params=model_params,
+                )
 
         State.set(StateKey.FINAL_SUMMARY, (summary, debug_info))
 
         return summary, debug_info
+
+
+def model_params_from_state(step: str) -> dict:
+    """Model params of a PromptSignature step, on the model routed to the step."""
+    provider = State.get(StateKey.LLM_PROVIDER)
+    default_model = State.get(StateKey.MODEL)
+    model = route_model(provider, default_model, State.get(State.component_key(StateKey.STEP_MODEL, suffix=f"_{step}")))
+
+    model_params = {
+        "temperature": State.get(StateKey.MODEL_TEMPERATURE),
+        "max_tokens": State.get(StateKey.MODEL_MAX_TOKENS),
+        "llm_provider": provider,
+        "model": model,
+        CACHE_SAMPLED_RESPONSES: State.get(StateKey.CACHE_SAMPLED_RESPONSES, False),
+    }
+
+    # a step routed to a cheaper model falls back to the main model when its output does not validate
+    if model != default_model and State.get(StateKey.ESCALATE_INVALID_OUTPUT, False):
+        model_params[ESCALATION_MODELS] = [default_model]
+
+    return model_params
+
+
+def run_ready_steps_concurrently(step_components: dict):
+    """
+    Start the LLM calls of the ready steps in the background when more than one step is ready, e.g. the
+    QA review while the investigation guide streams, since both only need the detection rule. A step that
+    streams its output runs when rendered; the others join their background call then, see take_step_call.
+    """
+    ready = [
+        step_components[s] for s in State.ready_detection_engineering_steps()
+        if hasattr(step_components.get(s), "run_concurrently")
+    ]
+    if len(ready) < 2:
+        return
+
+    calls = State.get(StateKey.STEP_CALLS) or {}
+    background = [
+        c for c in ready
+        if c.step not in calls and not getattr(c, "streams_output", lambda: False)()
+    ]
+    if not background:
+        return
+
+    llm = AsyncPromptSignature(max_concurrency=len(background))
+    # the step inputs are read from the session state here, the background thread has no script context
+    coroutines = [c.run_concurrently(llm) for c in background]
+    futures = [Future() for _ in background]
+
+    async def run_all():
+        async def run(coroutine, future: Future):
+            try:
+                future.set_result(await coroutine)
+            except Exception as e:
+                future.set_exception(e)
+
+        await asyncio.gather(*(run(c, f) for c, f in zip(coroutines, futures)))
+
+    threading.Thread(target=asyncio.run, args=(run_all(),), name="llm-steps", daemon=True).start()
+
+    for component, future in zip(background, futures):
+        calls[component.step] = future
+    State.set(StateKey.STEP_CALLS, calls)
+
+    steps = ", ".join(c.step.value for c in background)
+    logger.info(f"Started steps in the background: {steps}")
+
+
+def take_step_call(step: DetectionEngineeringStep, label: str):
+    """
+    Claim the result of the call started in the background for a step, waiting for it if needed.
+    Returns None when no call was started or it failed, so the step runs again on its own.
+    """
+    calls = State.get(StateKey.STEP_CALLS) or {}
+    future = calls.pop(step, None)
+    if future is None:
+        return None
+
+    try:
+        with st.spinner(label):
+            return future.result()
+    except Exception as e:
+        logger.warning(f"Background call of step {step.value} failed, running it again: {e}")
+        return None
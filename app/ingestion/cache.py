@@ -0,0 +1,148 @@
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from streamlit.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+CACHE_DIR = os.getenv("LANGDON_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "langdon"))
+CACHE_MAX_BYTES = int(os.getenv("LANGDON_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class ContentCache:
+    """
+    On-disk, content-addressed store for extracted threat source text.
+    Each entry is a file named by its key; the file mtime is used as the LRU clock.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+
+        # mark as most recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        logger.info(f"Content cache hit: {key}")
+
+        return content
+
+    def set(self, key: str, content: str):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+
+        os.replace(tmp_path, self._path(key))
+
+        self._evict()
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for entry in self._entries():
+            self.delete(entry.name)
+
+    def size(self) -> int:
+        return sum(st.st_size for _, st in self._stats())
+
+    def _evict(self):
+        with self._lock:
+            entries = [(st.st_mtime, st.st_size, name) for name, st in self._stats()]
+            total = sum(size for _, size, _ in entries)
+
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+
+                logger.info(f"Evicting content cache entry: {name}")
+                self.delete(name)
+                total -= size
+
+    def _entries(self):
+        return [e for e in os.scandir(self.directory) if e.is_file() and not e.name.endswith(".tmp")]
+
+    def _stats(self):
+        stats = []
+        for entry in self._entries():
+            try:
+                stats.append((entry.name, entry.stat()))
+            except FileNotFoundError:
+                # evicted or deleted by another thread since the scan
+                continue
+
+        return stats
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+
+_content_cache = None
+_content_cache_lock = threading.Lock()
+
+
+def content_cache() -> ContentCache:
+    """Return the process-wide content cache."""
+    global _content_cache
+    with _content_cache_lock:
+        if _content_cache is None:
+            _content_cache = ContentCache(CACHE_DIR, CACHE_MAX_BYTES)
+
+    return _content_cache
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL so that trivially different spellings of the same page share a cache entry."""
+    parts = urlsplit(url.strip())
+
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port is not None and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+
+    # a trailing slash is kept, /a and /a/ may be distinct resources
+    path = parts.path or "/"
+
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+
+    # the fragment never reaches the server
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def url_key(url: str, *variant: str) -> str:
+    return _key("url", normalize_url(url).encode("utf-8"), variant)
+
+
+def file_key(sha256: str, *variant: str) -> str:
+    """Key for a file by the SHA-256 hex digest of its bytes, see spool.spool_upload."""
+    return _key("file", sha256.encode("utf-8"), variant)
+
+
+def _key(namespace: str, data: bytes, variant) -> str:
+    digest = hashlib.sha256(data)
+    for v in variant:
+        digest.update(b"\0" + str(v).encode("utf-8"))
+
+    return f"{namespace}-{digest.hexdigest()}"
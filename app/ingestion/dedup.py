@@ -0,0 +1,112 @@
+import hashlib
+import random
+import re
+from app.llm.tokens import estimate_tokens
+
+
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+# Passages whose estimated Jaccard similarity is above this threshold are considered duplicates.
+DUPLICATE_THRESHOLD = 0.8
+# Headings, bullet fragments and other short passages are always kept.
+MIN_PARAGRAPH_WORDS = 8
+# Passages longer than this without a sentence end, e.g. table rows, are split again at line breaks.
+MAX_PASSAGE_WORDS = 80
+
+# Passages end at a sentence end or a blank line. PDF text has single newlines only, so sentences
+# rather than paragraphs line a PDF up with the same text scraped from a web page.
+PASSAGE_SEPARATOR = re.compile(r"((?<=[.!?])\s+|\n\s*\n)")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+_rng = random.Random(1337)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+
+class DedupResult:
+    contents: list[str]
+    duplicate_paragraphs: int
+    duplicate_tokens: int
+
+    def __init__(self, contents: list[str], duplicate_paragraphs: int, duplicate_tokens: int):
+        self.contents = contents
+        self.duplicate_paragraphs = duplicate_paragraphs
+        self.duplicate_tokens = duplicate_tokens
+
+
+def dedup_sources(contents: list[str]) -> DedupResult:
+    """
+    Drop passages that repeat, verbatim or nearly, an earlier passage of any source.
+    Near duplicates are found with MinHash signatures over word shingles and LSH banding.
+    """
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    buckets = {}
+    signatures = []
+
+    deduped = []
+    duplicate_paragraphs = 0
+    duplicate_tokens = 0
+
+    for content in contents:
+        kept = []
+        for passage, separator in _passages(content):
+            words = re.findall(r"\w+", passage.lower())
+            if len(words) < MIN_PARAGRAPH_WORDS:
+                kept.append(passage + separator)
+                continue
+
+            signature = minhash(words)
+            bands = [(b, tuple(signature[b * rows:(b + 1) * rows])) for b in range(LSH_BANDS)]
+
+            candidates = {i for band in bands for i in buckets.get(band, [])}
+            if any(_similarity(signature, signatures[i]) >= DUPLICATE_THRESHOLD for i in candidates):
+                duplicate_paragraphs += 1
+                duplicate_tokens += estimate_tokens(passage)
+                # keep paragraph breaks, they separate the passages that remain
+                if "\n" in separator:
+                    kept.append(separator)
+                continue
+
+            index = len(signatures)
+            signatures.append(signature)
+            for band in bands:
+                buckets.setdefault(band, []).append(index)
+
+            kept.append(passage + separator)
+
+        deduped.append("".join(kept).strip())
+
+    return DedupResult(deduped, duplicate_paragraphs, duplicate_tokens)
+
+
+def minhash(words: list[str]) -> list[int]:
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles]
+
+    return [
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def _passages(content: str) -> list[tuple[str, str]]:
+    """Passages of a text with the separator that follows each, so kept passages join back as they were."""
+    parts = PASSAGE_SEPARATOR.split(content)
+    pairs = list(zip(parts[::2], parts[1::2] + [""]))
+
+    passages = []
+    for passage, separator in pairs:
+        if len(passage.split()) <= MAX_PASSAGE_WORDS or "\n" not in passage:
+            passages.append((passage, separator))
+            continue
+
+        lines = passage.split("\n")
+        passages.extend((line, "\n") for line in lines[:-1])
+        passages.append((lines[-1], separator))
+
+    return passages
+
+
+def _similarity(a: list[int], b: list[int]) -> float:
+    return sum(x == y for x, y in zip(a, b)) / len(a)
@@ -0,0 +1,160 @@
+import re
+from collections import Counter
+
+
+# A block is (top, bottom, text) with top/bottom relative to the page height.
+Block = tuple[float, float, str]
+
+# Blocks in these bands of the page are candidates for running headers and footers.
+HEADER_BAND = 0.12
+FOOTER_BAND = 0.88
+# Text repeated on at least this share of the pages is treated as page furniture. Blocks in the
+# header/footer bands need less repetition, e.g. running headers that alternate between odd and even pages.
+REPEAT_RATIO = 0.5
+BAND_REPEAT_RATIO = 0.3
+MIN_REPEAT_PAGES = 3
+
+IOC_TABLE_MODES = ["keep", "skip", "summarize"]
+
+PAGE_NUMBER_PATTERN = re.compile(r"^\s*(page\s*)?\d+(\s*(/|of)\s*\d+)?\s*$", re.IGNORECASE)
+# Entries with leader dots are table-of-contents lines anywhere; entries that only end in a page number after
+# a wide gap look like table rows, so they count only on a page with a contents heading.
+TOC_LINE_PATTERN = re.compile(r"^.{3,}?(\s*\.){4,}\s*\d+\s*$")
+TOC_SPACED_LINE_PATTERN = re.compile(r"^.{3,}\s{3,}\d+\s*$")
+TOC_HEADING_PATTERN = re.compile(r"^\s*(table of )?contents\s*$", re.IGNORECASE | re.MULTILINE)
+APPENDIX_HEADING_PATTERN = re.compile(r"^\s*(appendix\b|indicators of compromise|iocs?\b)", re.IGNORECASE)
+
+IOC_PATTERNS = {
+    "SHA256 hashes": re.compile(r"\b[a-f0-9]{64}\b", re.IGNORECASE),
+    "SHA1 hashes": re.compile(r"\b[a-f0-9]{40}\b", re.IGNORECASE),
+    "MD5 hashes": re.compile(r"\b[a-f0-9]{32}\b", re.IGNORECASE),
+    "IP addresses": re.compile(r"\b(?:\d{1,3}\[?\.\]?){3}\d{1,3}\b"),
+    "domains": re.compile(r"\b(?:[a-z0-9-]+\[?\.\]?)+(?:com|net|org|io|ru|cn|info|xyz|top|biz)\b", re.IGNORECASE),
+    "URLs": re.compile(r"\bh(?:tt|xx)ps?://\S+", re.IGNORECASE),
+}
+# Share of the words of a page that must be indicators for the page to count as an IOC table.
+IOC_DENSITY = 0.4
+IOC_SAMPLES = 3
+
+
+def page_blocks(page) -> list[Block]:
+    """Text blocks of a PyMuPDF page with coordinates relative to the page height."""
+    height = page.rect.height or 1
+
+    return [
+        (y0 / height, y1 / height, text)
+        for x0, y0, x1, y1, text, block_no, block_type in page.get_text("blocks", sort=True)
+        if block_type == 0 and text.strip()
+    ]
+
+
+def filter_page_furniture(pages: list[list[Block]], ioc_tables: str = "keep") -> list[str]:
+    """
+    Drop running headers, footers, page numbers, repeated disclaimers and table-of-contents lines.
+    In the header and footer bands repetition ignores digits, so "Page 3" matches "Page 4".
+    Optionally skips or summarizes appendix pages that are mostly IOC tables.
+    """
+    repeated = _repeated_blocks(pages)
+
+    texts = []
+    in_appendix = False
+    for blocks in pages:
+        toc_page = any(TOC_HEADING_PATTERN.search(text) for _, _, text in blocks)
+
+        kept = []
+        for top, bottom, text in blocks:
+            if PAGE_NUMBER_PATTERN.match(text):
+                continue
+            if _normalize(text, keep_digits=True) in repeated:
+                continue
+            if (bottom <= HEADER_BAND or top >= FOOTER_BAND) and _normalize(text) in repeated:
+                continue
+            if _is_toc(text, toc_page):
+                continue
+
+            kept.append(text)
+
+        # blocks end in a newline, the blank line between them keeps paragraph breaks for dedup
+        page_text = "\n".join(kept)
+
+        if ioc_tables != "keep":
+            in_appendix = in_appendix or any(APPENDIX_HEADING_PATTERN.match(t) for t in kept)
+            if in_appendix and _is_ioc_table(page_text):
+                page_text = summarize_iocs(page_text) if ioc_tables == "summarize" else ""
+
+        texts.append(page_text)
+
+    return texts
+
+
+def summarize_iocs(text: str) -> str:
+    parts = []
+    for kind, pattern in IOC_PATTERNS.items():
+        matches = list(dict.fromkeys(pattern.findall(text)))
+        if matches:
+            samples = ", ".join(matches[:IOC_SAMPLES])
+            parts.append(f"{len(matches)} {kind} (e.g. {samples})")
+
+    if not parts:
+        return ""
+
+    return f"[IOC table omitted: {'; '.join(parts)}]\n"
+
+
+def _repeated_blocks(pages: list[list[Block]]) -> set[str]:
+    if len(pages) < MIN_REPEAT_PAGES:
+        return set()
+
+    banded = Counter()
+    anywhere = Counter()
+    for blocks in pages:
+        seen_banded = set()
+        seen_anywhere = set()
+        for top, bottom, text in blocks:
+            key = _normalize(text, keep_digits=True)
+            if not key:
+                continue
+
+            seen_anywhere.add(key)
+            if bottom <= HEADER_BAND or top >= FOOTER_BAND:
+                seen_banded.add(_normalize(text))
+
+        banded.update(seen_banded)
+        anywhere.update(seen_anywhere)
+
+    band_threshold = max(MIN_REPEAT_PAGES, BAND_REPEAT_RATIO * len(pages))
+    threshold = max(MIN_REPEAT_PAGES, REPEAT_RATIO * len(pages))
+
+    # headers and footers repeat in their band; disclaimers and watermarks may float but repeat verbatim
+    return {key for key, count in banded.items() if count >= band_threshold} | \
+        {key for key, count in anywhere.items() if count >= threshold and len(key) > 20}
+
+
+def _is_toc(text: str, toc_page: bool = False) -> bool:
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return False
+
+    toc_lines = sum(
+        1 for line in lines
+        if TOC_LINE_PATTERN.match(line) or (toc_page and TOC_SPACED_LINE_PATTERN.match(line))
+    )
+
+    return toc_lines / len(lines) > 0.5
+
+
+def _is_ioc_table(text: str) -> bool:
+    words = text.split()
+    if not words:
+        return False
+
+    iocs = sum(len(pattern.findall(text)) for pattern in IOC_PATTERNS.values())
+
+    return iocs / len(words) >= IOC_DENSITY
+
+
+def _normalize(text: str, keep_digits: bool = False) -> str:
+    if not keep_digits:
+        text = re.sub(r"\d+", "#", text)
+
+    return re.sub(r"\s+", " ", text).strip().lower()
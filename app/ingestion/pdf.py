@@ -1,20 +1,171 @@
 import fitz
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, Optional
+from streamlit.logger import get_logger
+from app.ingestion.cache import content_cache, file_key
+from app.ingestion.spool import SpooledUpload
+from app.ingestion.layout import page_blocks, filter_page_furniture
 
 
-def serialize_file(uploaded_file):
-    if uploaded_file.type == "application/pdf":
-        file_content = ""
+logger = get_logger(__name__)
 
-        pdf_document = fitz.open(stream=uploaded_file.read(), filetype="pdf")
-        for page_num in range(pdf_document.page_count):
-            page = pdf_document.load_page(page_num)
-            file_content += page.get_text()
+PDF_EXTRACTION_WORKERS = int(os.getenv("LANGDON_PDF_EXTRACTION_WORKERS", os.cpu_count() or 1))
+# Below this page count the cost of starting the workers outweighs the parallel speed-up.
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("LANGDON_PDF_PARALLEL_MIN_PAGES", 32))
+
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+
+
+def serialize_file(upload: SpooledUpload, page_ranges: Optional[str] = None, layout_aware: bool = False, ioc_tables: str = "keep"):
+    if upload.type == "application/pdf":
+        cache_key = file_key(upload.sha256, normalize_page_ranges(page_ranges), layout_aware, ioc_tables)
+        cached = content_cache().get(cache_key)
+        if cached is not None:
+            return cached
+
+        if layout_aware:
+            file_content = "".join(iter_pdf_pages_layout_aware(upload.path, page_ranges, ioc_tables))
+        else:
+            file_content = "".join(iter_pdf_pages(upload.path, page_ranges))
+
+        content_cache().set(cache_key, file_content)
 
         return file_content
 
-    elif uploaded_file.type == "text/plain":
-        return uploaded_file.getvalue().decode("utf-8")
-    elif uploaded_file.type == "application/octet-stream" and uploaded_file.name.endswith(".md"):
-        return uploaded_file.getvalue().decode("utf-8")
+    elif upload.type == "text/plain":
+        return upload.read_text()
+    elif upload.type == "application/octet-stream" and upload.name.endswith(".md"):
+        return upload.read_text()
     else:
-        raise Exception(f"Unsupported file type: {uploaded_file.type}")
+        raise Exception(f"Unsupported file type: {upload.type}")
+
+
+def iter_pdf_pages(path: str, page_ranges: Optional[str] = None) -> Iterator[str]:
+    """
+    Yield the text of each selected page, in page order.
+    The document is opened from disk, so only the pages being extracted are held in memory.
+    Large documents are split into contiguous page ranges and extracted by a process pool.
+    """
+    yield from _iter_extracted(path, page_ranges, _page_text)
+
+
+def iter_pdf_pages_layout_aware(path: str, page_ranges: Optional[str] = None, ioc_tables: str = "keep") -> Iterator[str]:
+    """
+    Yield the text of each selected page without running headers, footers, page numbers and other page furniture.
+    Furniture is found by repetition across pages, so every page is extracted before the first one is yielded.
+    """
+    pages = list(_iter_extracted(path, page_ranges, page_blocks))
+
+    yield from filter_page_furniture(pages, ioc_tables=ioc_tables)
+
+
+def _iter_extracted(path: str, page_ranges: Optional[str], extract: Callable) -> Iterator:
+    with fitz.open(path, filetype="pdf") as pdf_document:
+        pages = parse_page_ranges(page_ranges, pdf_document.page_count)
+
+        if len(pages) < PDF_PARALLEL_MIN_PAGES or PDF_EXTRACTION_WORKERS <= 1:
+            for page_num in pages:
+                yield extract(pdf_document.load_page(page_num))
+
+            return
+
+    chunks = _split_pages(pages, PDF_EXTRACTION_WORKERS)
+    logger.info(f"Extracting {len(pages)} pages across {len(chunks)} workers")
+
+    pool = _get_extraction_pool()
+    for chunk_results in pool.map(_extract_pages, [path] * len(chunks), chunks, [extract] * len(chunks)):
+        yield from chunk_results
+
+
+def parse_page_ranges(page_ranges: Optional[str], page_count: int) -> list[int]:
+    """
+    Parse a 1-based page selection such as "1-5, 8, 20-" into sorted 0-based page numbers.
+    An empty selection means every page. Raises ValueError for a malformed selection or one past the last page.
+    """
+    if page_ranges is None or not page_ranges.strip():
+        return list(range(page_count))
+
+    pages = set()
+    for start, end in _page_range_parts(page_ranges):
+        pages.update(range(start - 1, min(end or page_count, page_count)))
+
+    if not pages:
+        raise ValueError(f"No pages selected by {page_ranges.strip()}, the document has {page_count} pages")
+
+    return sorted(pages)
+
+
+def normalize_page_ranges(page_ranges: Optional[str]) -> str:
+    """
+    Canonical form of a page selection, e.g. "1 - 3,8" becomes "1-3,8", so equal selections share a cache entry.
+    Raises ValueError for a malformed selection.
+    """
+    if page_ranges is None:
+        return ""
+
+    parts = []
+    for start, end in _page_range_parts(page_ranges):
+        if start == end:
+            parts.append(str(start))
+        else:
+            parts.append(f"{start}-{end or ''}")
+
+    return ",".join(parts)
+
+
+def _page_range_parts(page_ranges: str) -> list[tuple[int, Optional[int]]]:
+    """(start, end) of every part of a page selection, 1-based and inclusive, end None for an open range."""
+    parts = []
+    for part in page_ranges.split(","):
+        part = part.strip()
+        if not part:
+            continue
+
+        match = re.fullmatch(r"(\d*)\s*-\s*(\d*)|(\d+)", part)
+        if match is None:
+            raise ValueError(f"Invalid page range: {part}")
+
+        if match.group(3) is not None:
+            start = end = int(match.group(3))
+        else:
+            start = int(match.group(1) or 1)
+            end = int(match.group(2)) if match.group(2) else None
+
+        if start < 1 or (end is not None and start > end):
+            raise ValueError(f"Invalid page range: {part}")
+
+        parts.append((start, end))
+
+    return parts
+
+
+def _split_pages(pages: list[int], workers: int) -> list[list[int]]:
+    chunk_size = -(-len(pages) // workers)
+    return [pages[i:i + chunk_size] for i in range(0, len(pages), chunk_size)]
+
+
+def _extract_pages(path: str, pages: list[int], extract: Callable) -> list:
+    with fitz.open(path, filetype="pdf") as pdf_document:
+        return [extract(pdf_document.load_page(page_num)) for page_num in pages]
+
+
+def _page_text(page) -> str:
+    return page.get_text()
+
+
+def _get_extraction_pool():
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            # spawn instead of fork: the Streamlit server is multi-threaded and forking it is unsafe.
+            _extraction_pool = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACTION_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+    return _extraction_pool
@@ -0,0 +1,137 @@
+import re
+from bs4 import BeautifulSoup, Tag
+
+
+# Elements that never carry report content.
+# Not "form": some CMSs wrap the whole page in one.
+STRIP_TAGS = ["script", "style", "noscript", "iframe", "svg", "canvas", "button", "input", "select",
+              "nav", "footer", "aside", "template", "link", "meta"]
+# Only block-level containers are dropped by class or id, e.g. not the highlighted spans of a code sample.
+BOILERPLATE_TAGS = ["div", "section", "header", "ul", "ol", "dl", "table", "figure", "p"]
+
+BOILERPLATE_PATTERN = re.compile(
+    r"cookie|consent|banner|gdpr|footer|header|masthead|navbar|\bnav\b|menu|sidebar|widget|related|recommend|"
+    r"share|social|comment|subscribe|newsletter|signup|advert|\bads?\b|sponsor|promo|breadcrumb|popup|modal|"
+    r"pagination|author-bio|tags",
+    re.IGNORECASE,
+)
+CONTENT_PATTERN = re.compile(r"article|content|entry|main|post|story|body|text|report|blog", re.IGNORECASE)
+
+CANDIDATE_TAGS = ["article", "main", "section", "div", "td"]
+PARAGRAPH_TAGS = ["p", "pre", "li", "blockquote", "h1", "h2", "h3", "h4", "table"]
+
+# The best candidate must hold at least this share of the page text, otherwise the page is kept as a whole.
+MIN_CONTENT_RATIO = 0.25
+MIN_PARAGRAPH_CHARS = 25
+
+
+def extract_main_content(soup: BeautifulSoup) -> Tag:
+    """
+    Readability-style extraction of the main content of a page.
+    Strips page furniture, scores candidate containers by the text density of their paragraphs
+    penalised by link density, and returns the best scoring container.
+    """
+    for tag in soup(STRIP_TAGS):
+        tag.decompose()
+
+    for tag in soup.find_all(_is_boilerplate):
+        if not tag.decomposed:
+            tag.decompose()
+
+    root = soup.body or soup
+    total_chars = len(_text(root))
+    if total_chars == 0:
+        return root
+
+    # keyed by id(): bs4 tags hash and compare by their rendered markup
+    candidates = {}
+    scores = {}
+    for paragraph in root.find_all(PARAGRAPH_TAGS):
+        text = _text(paragraph)
+        if len(text) < MIN_PARAGRAPH_CHARS:
+            continue
+
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+
+        parent = paragraph.find_parent(CANDIDATE_TAGS)
+        if parent is None:
+            continue
+
+        _add_score(candidates, scores, parent, score)
+
+        grandparent = parent.find_parent(CANDIDATE_TAGS)
+        if grandparent is not None:
+            _add_score(candidates, scores, grandparent, score / 2)
+
+    if not scores:
+        return root
+
+    ranked = {key: score * (1 - link_density(candidates[key])) for key, score in scores.items()}
+    best = candidates[max(ranked, key=ranked.get)]
+
+    # climb while the parent adds a substantial amount of content, e.g. a multi-column article body
+    while len(_text(best)) < MIN_CONTENT_RATIO * total_chars and best.parent is not None and best.parent is not root:
+        best = best.parent
+
+    if len(_text(best)) < MIN_CONTENT_RATIO * total_chars:
+        return root
+
+    return best
+
+
+def _add_score(candidates: dict, scores: dict, tag: Tag, score: float):
+    key = id(tag)
+    if key not in candidates:
+        candidates[key] = tag
+        scores[key] = _class_weight(tag)
+
+    scores[key] += score
+
+
+def link_density(tag: Tag) -> float:
+    text_length = len(_text(tag))
+    if text_length == 0:
+        return 0.0
+
+    link_length = sum(len(_text(a)) for a in tag.find_all("a"))
+
+    return min(link_length / text_length, 1.0)
+
+
+def _is_boilerplate(tag: Tag) -> bool:
+    if tag.name in ("html", "body", "article", "main"):
+        return False
+
+    if tag.find_parent(["pre", "code"]) is not None:
+        return False
+
+    attrs = getattr(tag, "attrs", None) or {}
+    if attrs.get("role") in ("navigation", "banner", "contentinfo", "complementary", "dialog"):
+        return True
+
+    if attrs.get("aria-hidden") == "true" or attrs.get("hidden") is not None:
+        return True
+
+    if tag.name not in BOILERPLATE_TAGS:
+        return False
+
+    identity = " ".join(attrs.get("class", [])) + " " + attrs.get("id", "")
+    return BOILERPLATE_PATTERN.search(identity) is not None and CONTENT_PATTERN.search(identity) is None
+
+
+def _class_weight(tag: Tag) -> float:
+    identity = " ".join(tag.get("class", [])) + " " + tag.get("id", "")
+
+    weight = 0
+    if tag.name in ("article", "main"):
+        weight += 25
+    if CONTENT_PATTERN.search(identity):
+        weight += 25
+    if BOILERPLATE_PATTERN.search(identity):
+        weight -= 25
+
+    return weight
+
+
+def _text(tag: Tag) -> str:
+    return tag.get_text(" ", strip=True)
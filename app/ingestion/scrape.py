@@ -1,36 +1,196 @@
+import json
+import os
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 from markdownify import markdownify as md
 import re
+from typing import Iterator, Optional
 from streamlit.logger import get_logger
+from app.ingestion.cache import content_cache, url_key
+from app.ingestion.readability import extract_main_content
+from app.llm.tokens import estimate_tokens
 
 
 logger = get_logger(__name__)
 
+SCRAPE_CONNECT_TIMEOUT = float(os.getenv("LANGDON_SCRAPE_CONNECT_TIMEOUT", 5))
+SCRAPE_READ_TIMEOUT = float(os.getenv("LANGDON_SCRAPE_READ_TIMEOUT", 20))
+SCRAPE_MAX_BYTES = int(os.getenv("LANGDON_SCRAPE_MAX_BYTES", 20 * 1024 * 1024))
+SCRAPE_POOL_SIZE = int(os.getenv("LANGDON_SCRAPE_POOL_SIZE", 16))
+# Bump when the extraction changes so stale markdown is not served from the cache.
+EXTRACTION_VERSION = "main-content-v1"
+# Cached pages younger than this are served without contacting the origin; older ones are revalidated.
+SCRAPE_FRESHNESS_SECONDS = int(os.getenv("LANGDON_SCRAPE_FRESHNESS_SECONDS", 3600))
+SCRAPE_BULK_WORKERS = int(os.getenv("LANGDON_SCRAPE_BULK_WORKERS", 8))
+
+_CHUNK_SIZE = 64 * 1024
+
+
+class FetchResult:
+    status_code: int
+    text: Optional[str]
+    validators: dict
+
+    def __init__(self, status_code: int, text: Optional[str], validators: dict):
+        self.status_code = status_code
+        self.text = text
+        self.validators = validators
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status_code == 304
+
+
+class ScrapeClient:
+    """HTTP client shared by all sessions, with keep-alive pooling, timeouts and a response size cap."""
+
+    def __init__(self, connect_timeout: float, read_timeout: float, max_bytes: int, pool_size: int):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_bytes = max_bytes
+
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"User-Agent": "Langdon/0.1 (+https://github.com/caiorcferreira/langdon)"})
+
+    def fetch(self, url: str, validators: Optional[dict] = None) -> FetchResult:
+        headers = {}
+        if validators:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+
+        with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if response.status_code == 304:
+                return FetchResult(304, None, validators or {})
+
+            if response.status_code != 200:
+                raise Exception("Failed to retrieve the website.")
+
+            content_length = response.headers.get("Content-Length")
+            if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+                raise Exception(f"Website is larger than the {self.max_bytes} bytes limit.")
+
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+                body.extend(chunk)
+                if len(body) > self.max_bytes:
+                    raise Exception(f"Website is larger than the {self.max_bytes} bytes limit.")
+
+            encoding = response.encoding or response.apparent_encoding or "utf-8"
+            text = bytes(body).decode(encoding, errors="replace")
+
+            return FetchResult(200, text, {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            })
+
+
+_scrape_client = None
+_scrape_client_lock = threading.Lock()
+
+
+def scrape_client() -> ScrapeClient:
+    """Return the process-wide scraping client."""
+    global _scrape_client
+    with _scrape_client_lock:
+        if _scrape_client is None:
+            _scrape_client = ScrapeClient(
+                connect_timeout=SCRAPE_CONNECT_TIMEOUT,
+                read_timeout=SCRAPE_READ_TIMEOUT,
+                max_bytes=SCRAPE_MAX_BYTES,
+                pool_size=SCRAPE_POOL_SIZE,
+            )
+
+    return _scrape_client
+
 
 def collapse_empty_lines(text):
     collapsed_text = re.sub(r'(\n\s*){3,}', '\n\n', text)
     return collapsed_text
 
 
-def website_to_md(url):
+def website_to_md(url) -> tuple[str, int]:
+    """
+    Retrieve a website and convert its main content to markdown.
+    Returns the markdown and the estimated number of tokens saved by dropping the page boilerplate.
+    """
+    cache = content_cache()
+    cache_key = url_key(url, EXTRACTION_VERSION)
+    meta_key = url_key(url, EXTRACTION_VERSION, "meta")
+
+    cached = cache.get(cache_key)
+    meta = _load_meta(cache.get(meta_key))
+
+    if cached is not None and time.time() - meta.get("fetched_at", 0) < SCRAPE_FRESHNESS_SECONDS:
+        return cached, meta.get("tokens_saved", 0)
+
     logger.info(f"Retrieving website: {url}")
-    
-    response = requests.get(url)
-    if response.status_code != 200:
-        raise Exception("Failed to retrieve the website.")
+
+    result = scrape_client().fetch(url, validators=meta.get("validators") if cached is not None else None)
+    if result.not_modified:
+        logger.info("Website not modified, using cached content.")
+        cache.set(meta_key, json.dumps({**meta, "fetched_at": time.time(), "validators": result.validators}))
+
+        return cached, meta.get("tokens_saved", 0)
 
     logger.info("Successfully retrieved the website.")
 
-    soup = BeautifulSoup(response.text, 'html.parser')
+    soup = BeautifulSoup(result.text, 'html.parser')
+    page_tokens = estimate_tokens(soup.get_text(" ", strip=True))
 
     logger.info("Successfully parsed the HTML.")
 
-    markdown_content = md(str(soup))
+    main_content = extract_main_content(soup)
+    tokens_saved = max(page_tokens - estimate_tokens(main_content.get_text(" ", strip=True)), 0)
+
+    logger.info(f"Extracted main content, saving ~{tokens_saved} of {page_tokens} tokens.")
+
+    markdown_content = md(str(main_content))
 
     markdown_content = markdown_content.strip()
     markdown_content = collapse_empty_lines(markdown_content)
 
     logger.info("Successfully converted the HTML to markdown.")
 
-    return markdown_content
+    cache.set(cache_key, markdown_content)
+    cache.set(meta_key, json.dumps({
+        "fetched_at": time.time(),
+        "validators": result.validators,
+        "tokens_saved": tokens_saved,
+    }))
+
+    return markdown_content, tokens_saved
+
+
+def websites_to_md(urls: list[str], max_workers: int = SCRAPE_BULK_WORKERS) -> Iterator[tuple[str, Optional[tuple[str, int]], Optional[Exception]]]:
+    """
+    Scrape many URLs concurrently with a bounded thread pool.
+    Yields (url, website_to_md result, error) tuples in completion order, so callers can consume results as they arrive.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scrape") as pool:
+        futures = {pool.submit(website_to_md, url): url for url in urls}
+
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                yield url, future.result(), None
+            except Exception as e:
+                logger.warning(f"Failed to scrape {url}: {e}")
+                yield url, None, e
+
+
+def _load_meta(raw: Optional[str]) -> dict:
+    if raw is None:
+        return {}
+
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return {}
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from streamlit.logger import get_logger
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+
+logger = get_logger(__name__)
+
+SPOOL_DIR = os.getenv("LANGDON_SPOOL_DIR", tempfile.gettempdir())
+# Ceiling for the threat intel a single session may hold in memory, i.e. extracted text; spooled uploads are on disk.
+SESSION_MEMORY_LIMIT_BYTES = int(os.getenv("LANGDON_SESSION_MEMORY_LIMIT_MB", 256)) * 1024 * 1024
+# Spooled uploads older than this are left over by sessions that ended without submitting them.
+SPOOL_MAX_AGE_SECONDS = int(os.getenv("LANGDON_SPOOL_MAX_AGE_HOURS", 24)) * 3600
+SPOOL_PREFIX = "langdon-upload-"
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+class MemoryBudgetExceeded(Exception):
+    pass
+
+
+class SpooledUpload:
+    """An uploaded file written to disk, so it can be parsed without keeping its bytes in memory."""
+
+    name: str
+    type: str
+    path: str
+    size: int
+    sha256: str
+
+    def __init__(self, name: str, type: str, path: str, size: int, sha256: str):
+        self.name = name
+        self.type = type
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    @staticmethod
+    def from_path(path: str) -> "SpooledUpload":
+        """Wrap a file already on disk, e.g. a report listed in a bulk manifest. It must not be discarded."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(_CHUNK_SIZE):
+                digest.update(chunk)
+
+        file_type = "application/pdf" if path.lower().endswith(".pdf") else "text/plain"
+
+        return SpooledUpload(os.path.basename(path), file_type, path, os.path.getsize(path), digest.hexdigest())
+
+    def read_text(self) -> str:
+        with open(self.path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def spool_upload(uploaded_file) -> SpooledUpload:
+    """Copy an UploadedFile to a temp file in chunks, hashing it on the way."""
+    digest = hashlib.sha256()
+    size = 0
+
+    _, extension = os.path.splitext(uploaded_file.name)
+    fd, path = tempfile.mkstemp(prefix=SPOOL_PREFIX, suffix=extension, dir=SPOOL_DIR)
+
+    uploaded_file.seek(0)
+    with os.fdopen(fd, "wb") as f:
+        while chunk := uploaded_file.read(_CHUNK_SIZE):
+            digest.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+
+    logger.info(f"Spooled upload {uploaded_file.name} ({size} bytes) to {path}")
+
+    return SpooledUpload(uploaded_file.name, uploaded_file.type, path, size, digest.hexdigest())
+
+
+def sweep_spool_dir(max_age_seconds: int = SPOOL_MAX_AGE_SECONDS) -> int:
+    """Remove the spooled uploads older than max_age_seconds, once per process. Returns how many were removed."""
+    global _spool_swept
+    with _spool_sweep_lock:
+        if _spool_swept:
+            return 0
+        _spool_swept = True
+
+    removed = 0
+    cutoff = time.time() - max_age_seconds
+    for entry in os.scandir(SPOOL_DIR):
+        if not entry.name.startswith(SPOOL_PREFIX) or not entry.is_file():
+            continue
+
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+
+    if removed:
+        logger.info(f"Removed {removed} stale spooled uploads from {SPOOL_DIR}")
+
+    return removed
+
+
+_spool_swept = False
+_spool_sweep_lock = threading.Lock()
+
+
+def release_upload(uploaded_file):
+    """Drop the upload buffer held by the Streamlit file manager for the current session."""
+    uploaded_file.close()
+
+    ctx = get_script_run_ctx()
+    if ctx is None or not Runtime.exists():
+        return
+
+    try:
+        Runtime.instance().uploaded_file_mgr.remove_file(session_id=ctx.session_id, file_id=uploaded_file.file_id)
+    except Exception as e:
+        logger.warning(f"Failed to release upload {uploaded_file.name}: {e}")
+
+
+def check_memory_budget(used_bytes: int, incoming_bytes: int):
+    if used_bytes + incoming_bytes > SESSION_MEMORY_LIMIT_BYTES:
+        limit_mb = SESSION_MEMORY_LIMIT_BYTES // (1024 * 1024)
+        raise MemoryBudgetExceeded(
+            f"Adding this source would exceed the {limit_mb} MB per-session limit. Remove a threat source and try again."
+        )
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from streamlit.logger import get_logger
+from app.llm.prompt import PromptSignature, Detection, DetectionRule
+
+
+logger = get_logger(__name__)
+
+# Calls in flight per AsyncPromptSignature, and threads shared by all of them.
+ASYNC_MAX_CONCURRENCY = int(os.getenv("LANGDON_LLM_MAX_CONCURRENCY", 4))
+ASYNC_WORKERS = int(os.getenv("LANGDON_LLM_ASYNC_WORKERS", 16))
+
+
+class AsyncPromptSignature:
+    """
+    Awaitable counterpart of PromptSignature.
+    Every call runs the blocking step on a worker thread, where it enters its own LM context, and at most
+    max_concurrency calls of an instance are in flight. Cancelling a call that is waiting for a slot drops it;
+    an LM request already on the wire cannot be interrupted, so its result is discarded and its slot is only
+    freed once the request is done.
+    """
+
+    def __init__(self, max_concurrency: int = ASYNC_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def suggest_detections_from_intel(self, goal: str, reports: list[str], data_source: str, model_params: dict) -> list[Detection]:
+        return await self._run(
+            PromptSignature.suggest_detections_from_intel,
+            goal=goal,
+            reports=reports,
+            data_source=data_source,
+            model_params=model_params,
+        )
+
+    async def create_detection_rule(self, detection_description: Detection, detection_language: str, example_logs: list[str], example_detections: list[str], detection_steps: Optional[str], model_params: dict):
+        return await self._run(
+            PromptSignature.create_detection_rule,
+            detection_description=detection_description,
+            detection_language=detection_language,
+            example_logs=example_logs,
+            example_detections=example_detections,
+            detection_steps=detection_steps,
+            model_params=model_params,
+        )
+
+    async def develop_investigation_guide(self, detection_rule: DetectionRule, standard_op_procedure: Optional[str], model_params: dict):
+        return await self._run(
+            PromptSignature.develop_investigation_guide,
+            detection_rule=detection_rule,
+            standard_op_procedure=standard_op_procedure,
+            model_params=model_params,
+        )
+
+    async def qa_review(self, detection_description: Detection, detection_rule: DetectionRule, model_params: dict):
+        return await self._run(
+            PromptSignature.qa_review,
+            detection_description=detection_description,
+            detection_rule=detection_rule,
+            model_params=model_params,
+        )
+
+    async def final_summary(self, detection_description: Detection, detection_rule: DetectionRule, investigation_guide: str, qa_assessment: str, qa_score: int, model_params: dict):
+        return await self._run(
+            PromptSignature.final_summary,
+            detection_description=detection_description,
+            detection_rule=detection_rule,
+            investigation_guide=investigation_guide,
+            qa_assessment=qa_assessment,
+            qa_score=qa_score,
+            model_params=model_params,
+        )
+
+    async def _run(self, step, **kwargs):
+        # PromptSignature consumes the provider and model keys, so concurrent calls must not share the dict
+        kwargs["model_params"] = dict(kwargs["model_params"])
+
+        async with self._semaphore:
+            future = _executor().submit(step, **kwargs)
+            call = asyncio.wrap_future(future)
+            try:
+                return await asyncio.shield(call)
+            except asyncio.CancelledError:
+                if not future.cancel():
+                    logger.info(f"Cancelled {step.__name__} while running, its result will be discarded")
+                    await _wait_uncancellable(call)
+                raise
+
+
+async def _wait_uncancellable(call: asyncio.Future):
+    """Wait for a call that can no longer be cancelled, so it keeps its slot until its request is done."""
+    while not call.done():
+        try:
+            await asyncio.wait([call])
+        except asyncio.CancelledError:
+            continue
+
+    if not call.cancelled():
+        # retrieved so a failure of the discarded call is not reported as never retrieved
+        call.exception()
+
+
+_async_executor = None
+_async_executor_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _async_executor
+    with _async_executor_lock:
+        if _async_executor is None:
+            _async_executor = ThreadPoolExecutor(max_workers=ASYNC_WORKERS, thread_name_prefix="llm-async")
+
+    return _async_executor
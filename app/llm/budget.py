@@ -0,0 +1,183 @@
+import json
+from typing import Any, Optional
+from pydantic import BaseModel
+from dspy.adapters.chat_adapter import ChatAdapter
+from streamlit.logger import get_logger
+from app.llm.setup import context_window
+from app.llm.tokens import estimate_tokens, CHARS_PER_TOKEN
+
+
+logger = get_logger(__name__)
+
+# Inputs that may be trimmed to fit the context window, lowest priority first.
+TRIMMABLE_INPUTS = [
+    "example_logs",
+    "example_detection_rules",
+    "example_standard_operation_procedure",
+    "detection_steps",
+    "reports",
+]
+# Head-room kept free for the estimate error of the token heuristic.
+SAFETY_MARGIN = 0.05
+DEFAULT_MAX_OUTPUT_TOKENS = 1000
+
+TRUNCATION_MARKER = "\n[... truncated {tokens} tokens to fit the model context ...]"
+
+
+class PromptBudgetExceeded(Exception):
+    pass
+
+
+class TokenBudget:
+    """Pre-flight token accounting of a single signature call."""
+
+    model: str
+    context_window: int
+    max_output_tokens: int
+    instructions_tokens: int
+    input_tokens: dict[str, int]
+    trimmed_tokens: dict[str, int]
+
+    def __init__(self, model: str, context_window: int, max_output_tokens: int, instructions_tokens: int,
+                 input_tokens: dict[str, int], trimmed_tokens: dict[str, int]):
+        self.model = model
+        self.context_window = context_window
+        self.max_output_tokens = max_output_tokens
+        self.instructions_tokens = instructions_tokens
+        self.input_tokens = input_tokens
+        self.trimmed_tokens = trimmed_tokens
+
+    @property
+    def prompt_tokens(self) -> int:
+        return self.instructions_tokens + sum(self.input_tokens.values())
+
+    @property
+    def available_prompt_tokens(self) -> int:
+        return prompt_budget(self.context_window, self.max_output_tokens)
+
+    def rows(self) -> list[dict[str, Any]]:
+        rows = [{"part": "instructions", "tokens": self.instructions_tokens, "trimmed": 0}]
+        rows += [
+            {"part": name, "tokens": tokens, "trimmed": self.trimmed_tokens.get(name, 0)}
+            for name, tokens in self.input_tokens.items()
+        ]
+        rows.append({"part": "reserved for output", "tokens": self.max_output_tokens, "trimmed": 0})
+
+        return rows
+
+
+def prompt_budget(window: int, max_output_tokens: int) -> int:
+    return int(window * (1 - SAFETY_MARGIN)) - max_output_tokens
+
+
+def fit_inputs(signature, inputs: dict[str, Any], model: str, max_output_tokens: Optional[int],
+               demos: Optional[list] = None) -> tuple[dict[str, Any], TokenBudget]:
+    """
+    Size the rendered prompt of a signature call and trim the lowest-priority inputs until it fits
+    the context window of the model, leaving room for the completion. Few-shot demos count as instructions.
+    Raises PromptBudgetExceeded when the prompt cannot fit even after trimming.
+    """
+    max_output_tokens = max_output_tokens or DEFAULT_MAX_OUTPUT_TOKENS
+    window = context_window(model)
+    available = prompt_budget(window, max_output_tokens)
+
+    inputs = dict(inputs)
+    input_tokens = {name: estimate_tokens(_render(value)) for name, value in inputs.items()}
+    instructions_tokens = max(_prompt_tokens(signature, inputs, demos) - sum(input_tokens.values()), 0)
+
+    trimmed_tokens = {}
+    excess = instructions_tokens + sum(input_tokens.values()) - available
+
+    for name in TRIMMABLE_INPUTS:
+        if excess <= 0:
+            break
+        if name not in inputs or not input_tokens.get(name):
+            continue
+
+        keep = max(input_tokens[name] - excess, 0)
+        inputs[name] = _trim(inputs[name], keep)
+
+        new_tokens = estimate_tokens(_render(inputs[name]))
+        trimmed_tokens[name] = input_tokens[name] - new_tokens
+        excess -= trimmed_tokens[name]
+        input_tokens[name] = new_tokens
+
+    budget = TokenBudget(model, window, max_output_tokens, instructions_tokens, input_tokens, trimmed_tokens)
+
+    if trimmed_tokens:
+        logger.info(f"Trimmed prompt inputs to fit {model} context: {trimmed_tokens}")
+
+    if excess > 0:
+        raise PromptBudgetExceeded(
+            f"Prompt needs ~{budget.prompt_tokens} tokens but {model} only has room for {available} "
+            f"with {max_output_tokens} tokens reserved for the output."
+        )
+
+    return inputs, budget
+
+
+def split_batches(item_tokens: list[int], available_tokens: int, max_items: int) -> list[list[int]]:
+    """
+    Group item indices, in order, into batches whose items fit available_tokens together and number at most
+    max_items. An item too large on its own gets a batch of its own.
+    """
+    batches = []
+    batch, batch_tokens = [], 0
+
+    for i, tokens in enumerate(item_tokens):
+        if batch and (batch_tokens + tokens > available_tokens or len(batch) >= max_items):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+
+        batch.append(i)
+        batch_tokens += tokens
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def _prompt_tokens(signature, inputs: dict[str, Any], demos: Optional[list] = None) -> int:
+    messages = ChatAdapter().format(signature, demos=demos or [], inputs=inputs)
+
+    return sum(estimate_tokens(str(m["content"])) for m in messages)
+
+
+def _trim(value, keep_tokens: int):
+    """Trim a text, or a list of texts proportionally to their size, down to keep_tokens."""
+    if isinstance(value, str):
+        return _truncate(value, keep_tokens)
+
+    if isinstance(value, list) and all(isinstance(v, str) for v in value):
+        total = sum(estimate_tokens(v) for v in value)
+        if total == 0:
+            return value
+
+        return [_truncate(v, keep_tokens * estimate_tokens(v) // total) for v in value]
+
+    return value
+
+
+def _truncate(text: str, keep_tokens: int) -> str:
+    tokens = estimate_tokens(text)
+    if tokens <= keep_tokens:
+        return text
+
+    marker = TRUNCATION_MARKER.format(tokens=tokens - keep_tokens)
+    keep_chars = max(keep_tokens * CHARS_PER_TOKEN - len(marker), 0)
+
+    return text[:keep_chars] + marker
+
+
+def _render(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, BaseModel):
+        return value.model_dump_json()
+    if isinstance(value, list):
+        return "\n".join(_render(v) for v in value)
+
+    return json.dumps(value, default=str)
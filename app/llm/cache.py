@@ -0,0 +1,213 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+from pydantic import BaseModel
+from streamlit.logger import get_logger
+from app.llm.programs import program_registry
+from app.llm.streaming import SignatureStream
+
+
+logger = get_logger(__name__)
+
+RESPONSE_CACHE_PATH = os.getenv(
+    "LANGDON_RESPONSE_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "langdon", "responses.sqlite3"),
+)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("LANGDON_RESPONSE_CACHE_MAX_ENTRIES", 5000))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("LANGDON_RESPONSE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("LANGDON_RESPONSE_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+
+# model_params flag that allows caching responses sampled with temperature > 0.
+CACHE_SAMPLED_RESPONSES = "cache_sampled_responses"
+
+
+class ResponseCache:
+    """SQLite-backed cache of PromptSignature results with TTL expiry and LRU eviction."""
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int, ttl_seconds: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl_seconds),
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+
+        return pickle.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        data = pickle.dumps(value)
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now),
+            )
+            self._evict(now)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+
+        return {"hits": self.hits, "misses": self.misses, "bypasses": self.bypasses, "entries": entries, "bytes": size}
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl_seconds,))
+
+        entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if entries <= self.max_entries and size <= self.max_bytes:
+            return
+
+        # drop least recently used rows until both caps hold
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+        evicted = []
+        for key, row_size in rows:
+            if entries <= self.max_entries and size <= self.max_bytes:
+                break
+
+            evicted.append((key,))
+            entries -= 1
+            size -= row_size
+
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        logger.info(f"Evicted {len(evicted)} cached responses")
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def response_cache() -> ResponseCache:
+    """Return the process-wide response cache."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(
+                RESPONSE_CACHE_PATH,
+                max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                max_bytes=RESPONSE_CACHE_MAX_BYTES,
+                ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+            )
+
+    return _response_cache
+
+
+def cached_signature(signature, stream: bool = False):
+    """
+    Cache the result of a PromptSignature method keyed by the signature, its instructions version,
+    the canonicalized inputs and the model params.
+    Calls sampled with temperature > 0 bypass the cache unless model_params[CACHE_SAMPLED_RESPONSES] is set.
+    With stream=True the method returns a SignatureStream, whose result is cached once it has been consumed.
+    """
+    def decorator(fn):
+        fn_signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = fn_signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+
+            inputs = dict(bound.arguments)
+            model_params = inputs.pop("model_params")
+            cache_sampled = model_params.pop(CACHE_SAMPLED_RESPONSES, False)
+
+            cache = response_cache()
+            if (model_params.get("temperature") or 0) > 0 and not cache_sampled:
+                cache.bypasses += 1
+                return fn(*args, **kwargs)
+
+            key = signature_cache_key(signature, inputs, model_params)
+            result = cache.get(key)
+            if result is not None:
+                logger.info(f"Response cache hit for {signature.__name__}")
+                return SignatureStream.completed(result) if stream else result
+
+            result = fn(*args, **kwargs)
+            if stream:
+                result.on_result(lambda r: cache.set(key, r))
+            else:
+                cache.set(key, result)
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def signature_cache_key(signature, inputs: dict[str, Any], model_params: dict[str, Any]) -> str:
+    payload = {
+        "signature": signature.__name__,
+        "version": signature_version(signature),
+        "inputs": _canonicalize(inputs),
+        "model_params": _canonicalize(model_params),
+    }
+    # a compiled program changes the prompt as much as editing the signature
+    program = program_registry().version(signature)
+    if program is not None:
+        payload["program"] = program
+
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def signature_version(signature) -> str:
+    """Hash of the instructions and field descriptions, so editing a prompt invalidates its cached responses."""
+    fields = {name: str(field.json_schema_extra) for name, field in signature.fields.items()}
+    payload = json.dumps({"doc": signature.__doc__ or "", "fields": fields}, sort_keys=True)
+
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _canonicalize(value):
+    if isinstance(value, BaseModel):
+        return _canonicalize(value.model_dump())
+    if isinstance(value, dict):
+        return {str(k): _canonicalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonicalize(v) for v in value]
+    if isinstance(value, str):
+        return value.strip()
+    if value is None or isinstance(value, (int, float, bool)):
+        return value
+
+    return str(value)
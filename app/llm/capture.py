@@ -0,0 +1,98 @@
+import os
+import threading
+from collections import deque
+from typing import Any, Optional
+from dspy.utils.callback import BaseCallback
+from streamlit.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+# LM calls kept per capture; a signature call makes one, or a few when the adapter retries.
+PROMPT_CAPTURE_SIZE = int(os.getenv("LANGDON_PROMPT_CAPTURE_SIZE", 5))
+PRINT_PROMPTS = os.getenv("LANGDON_PRINT_PROMPTS", "false").lower() == "true"
+
+
+class PromptCapture(BaseCallback):
+    """
+    Records the prompts and completions of the LM calls made while it is registered, e.g. with
+    dspy.context(callbacks=[capture]), in a bounded ring buffer. One capture per signature call
+    keeps concurrent calls from seeing each other's prompts.
+    """
+
+    def __init__(self, maxlen: int = PROMPT_CAPTURE_SIZE):
+        self.entries = deque(maxlen=maxlen)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def on_lm_start(self, call_id: str, instance: Any, inputs: dict[str, Any]):
+        with self._lock:
+            self._pending[call_id] = (instance.model, inputs.get("prompt"), inputs.get("messages"))
+
+    def on_lm_end(self, call_id: str, outputs: Optional[list[str]], exception: Optional[Exception] = None):
+        with self._lock:
+            model, prompt, messages = self._pending.pop(call_id, (None, None, None))
+
+        if exception is not None:
+            return
+
+        self.record(model, prompt, messages, outputs or [])
+
+    def record(self, model: Optional[str], prompt: Optional[str], messages: Optional[list[dict]], outputs: list[str]):
+        entry = {"model": model, "prompt": prompt, "messages": messages, "outputs": outputs}
+        self.entries.append(entry)
+
+        if PRINT_PROMPTS:
+            prompt_text, response = format_history([entry])
+            print(prompt_text + response)
+
+    def render(self) -> tuple[str, str]:
+        """The prompt and completion of the latest LM call, formatted for display."""
+        return format_history(list(self.entries)[-1:])
+
+
+def format_history(history):
+    """Format prompts and their completions."""
+
+    input_prompt = ""
+    response = ""
+
+    for item in history:
+        messages = item["messages"] or [{"role": "user", "content": item["prompt"]}]
+        for msg in messages:
+            input_prompt += f"{msg['role'].capitalize()} message:\n"
+            input_prompt += _format_message_content(msg["content"])
+            input_prompt += "\n"
+
+        outputs = item["outputs"]
+        response += outputs[0].strip()
+
+        if len(outputs) > 1:
+            choices_text = f" \t (and {len(outputs)-1} other completions)\n"
+            response += choices_text
+
+    input_prompt += "\n"
+    response += "\n"
+
+    return input_prompt, response
+
+
+def _format_message_content(content: str | list[dict[str, Any]]):
+    if isinstance(content, str):
+        return f"{content.strip()}\n"
+
+    if not isinstance(content, list):
+        return
+
+    for c in content:
+        if c["type"] == "text":
+            return f"{c['text'].strip()}\n"
+        elif c["type"] == "image_url":
+            image_str = ""
+            if "base64" in c["image_url"].get("url", ""):
+                len_base64 = len(c["image_url"]["url"].split("base64,")[1])
+                image_str = f"<{c['image_url']['url'].split('base64,')[0]}base64,<IMAGE BASE 64 ENCODED({str(len_base64)})>"
+            else:
+                image_str = f"<image_url: {c['image_url']['url']}>"
+
+            return f"{image_str.strip()}\n"
@@ -0,0 +1,199 @@
+"""
+Compile a PromptSignature step offline with a DSPy optimizer and a labeled set, into a program the app loads at startup.
+
+    python -m app.llm.compile create_detection_rule labeled.jsonl --provider OpenAI --model gpt-4o-mini
+
+Each line of the labeled set holds the input and output fields of the step's signature, e.g. for create_detection_rule
+{"detection_description": {...}, "detection_language": "Splunk SPL", "example_detection_rules": [], "example_logs": [],
+"detection_steps": null, "detection_rule": {"code": ..., "logic": ..., "limitations": ..., "false_positive_rate": ...}}.
+Demos are drawn from the shortest examples and only kept when the model's answer is complete and about as concise as
+the label, so the compiled prompt teaches short answers. --instructions replaces the signature instructions with a
+shorter text. The program is written to LANGDON_PROGRAMS_DIR, where the app picks it up on its next start.
+"""
+import argparse
+import json
+import random
+import sys
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+
+def text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, BaseModel):
+        return value.model_dump_json()
+
+    return json.dumps(value, default=str)
+
+
+def read_labeled_set(path: str, signature) -> list:
+    import dspy
+
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+
+            entry = json.loads(line)
+            missing = [name for name in signature.output_fields if name not in entry]
+            if missing:
+                raise ValueError(f"{path}:{line_number}: missing output fields {', '.join(missing)}")
+
+            fields = {name: entry.get(name) for name in [*signature.input_fields, *signature.output_fields]}
+            examples.append(dspy.Example(**fields).with_inputs(*signature.input_fields))
+
+    return examples
+
+
+def conciseness_metric(signature, max_output_ratio: float):
+    """
+    Scores complete answers by how close their size stays to the label, up to 1 for answers no longer than it.
+    While bootstrapping demos, only complete answers within max_output_ratio of the label pass.
+    """
+    from app.llm.tokens import estimate_tokens
+
+    def metric(example, prediction, trace=None):
+        label_tokens = sum(estimate_tokens(text(example.get(name))) for name in signature.output_fields)
+        output_tokens = sum(estimate_tokens(text(prediction.get(name))) for name in signature.output_fields)
+        complete = all(prediction.get(name) not in (None, "", []) for name in signature.output_fields)
+
+        if trace is not None:
+            return complete and output_tokens <= max_output_ratio * max(label_tokens, 1)
+        if not complete:
+            return 0.0
+
+        return min(1.0, max(label_tokens, 1) / max(output_tokens, 1))
+
+    return metric
+
+
+def evaluate(program, devset: list, metric) -> dict[str, float]:
+    """Mean score, and estimated prompt and completion tokens per call, of a program over the dev set."""
+    from dspy.adapters.chat_adapter import ChatAdapter
+    from app.llm.routing import VALIDATION_ERRORS
+    from app.llm.tokens import estimate_tokens
+
+    scores, prompt_tokens, completion_tokens = [], [], []
+    for example in devset:
+        inputs = example.inputs().toDict()
+        messages = ChatAdapter().format(program.extended_signature, demos=program.demos, inputs=inputs)
+        prompt_tokens.append(sum(estimate_tokens(str(m["content"])) for m in messages))
+
+        try:
+            prediction = program(**inputs)
+        except VALIDATION_ERRORS:
+            scores.append(0.0)
+            continue
+
+        scores.append(metric(example, prediction))
+        completion_tokens.append(sum(estimate_tokens(text(prediction.get(name))) for name in program.extended_signature.output_fields))
+
+    return {
+        "score": sum(scores) / len(scores) if scores else 0.0,
+        "prompt_tokens": sum(prompt_tokens) / len(prompt_tokens) if prompt_tokens else 0.0,
+        "completion_tokens": sum(completion_tokens) / len(completion_tokens) if completion_tokens else 0.0,
+    }
+
+
+def main() -> int:
+    load_dotenv()
+
+    # after load_dotenv, the app modules read their settings from the environment on import
+    import dspy
+    from dspy.teleprompt import BootstrapFewShot, LabeledFewShot
+    from app.llm.budget import DEFAULT_MAX_OUTPUT_TOKENS
+    from app.llm.programs import program_path, save_program, PROGRAMS_DIR
+    from app.llm.prompt import PromptSignature, PROGRAM_SIGNATURES
+    from app.llm.setup import PROVIDERS, MODELS
+    from app.llm.tokens import estimate_tokens
+
+    parser = argparse.ArgumentParser(prog="python -m app.llm.compile", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("step", choices=list(PROGRAM_SIGNATURES))
+    parser.add_argument("labeled_set", help="JSONL file with the input and output fields of the step's signature per line")
+    parser.add_argument("--provider", default=next(iter(PROVIDERS)), choices=list(PROVIDERS))
+    parser.add_argument("--model", help="defaults to the first model of the provider")
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_OUTPUT_TOKENS)
+    parser.add_argument("--optimizer", choices=["bootstrap", "labeled"], default="bootstrap",
+                        help="bootstrap keeps demos the model answers well, labeled uses the labels as they are")
+    parser.add_argument("--demos", type=int, default=2, help="few-shot demos in the compiled prompt")
+    parser.add_argument("--instructions", help="file with shorter instructions replacing those of the signature")
+    parser.add_argument("--max-output-ratio", type=float, default=1.5,
+                        help="longest bootstrapped answer kept as a demo, relative to the size of its label")
+    parser.add_argument("--dev-ratio", type=float, default=0.2, help="share of the labeled set held out to compare the programs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help=f"program file, defaults to <signature>.json in {PROGRAMS_DIR}")
+    args = parser.parse_args()
+
+    signature = PROGRAM_SIGNATURES[args.step]
+    try:
+        examples = read_labeled_set(args.labeled_set, signature)
+    except (OSError, ValueError) as e:
+        print(f"Invalid labeled set: {e}", file=sys.stderr)
+        return 2
+
+    random.Random(args.seed).shuffle(examples)
+    dev_size = int(len(examples) * args.dev_ratio) if len(examples) > 1 else 0
+    devset, trainset = examples[:dev_size], examples[dev_size:]
+    # demos are taken in order, so the shortest examples make the shortest prompts
+    trainset.sort(key=lambda example: sum(estimate_tokens(text(value)) for value in example.values()))
+
+    compiled_signature = signature
+    if args.instructions:
+        with open(args.instructions, encoding="utf-8") as f:
+            compiled_signature = signature.with_instructions(f.read().strip())
+
+    lm, model_params = PromptSignature.llm({
+        "llm_provider": args.provider,
+        "model": args.model or next(iter(MODELS[PROVIDERS[args.provider]])),
+        "temperature": args.temperature,
+        "max_tokens": args.max_tokens,
+    })
+    metric = conciseness_metric(signature, args.max_output_ratio)
+
+    # the model params are the config of the modules while compiling, the registry passes them per call instead
+    with dspy.context(lm=lm):
+        baseline = dspy.ChainOfThought(signature, **model_params)
+        student = dspy.ChainOfThought(compiled_signature, **model_params)
+
+        print(f"Compiling {args.step} with {args.optimizer} on {len(trainset)} examples, {len(devset)} held out", file=sys.stderr)
+        if args.optimizer == "labeled":
+            optimizer = LabeledFewShot(k=args.demos)
+            program = optimizer.compile(student, trainset=trainset, sample=False)
+        else:
+            optimizer = BootstrapFewShot(metric=metric, max_bootstrapped_demos=args.demos, max_labeled_demos=args.demos, max_rounds=1)
+            program = optimizer.compile(student, trainset=trainset)
+
+        results = {}
+        if devset:
+            results = {"before": evaluate(baseline, devset, metric), "after": evaluate(program, devset, metric)}
+            for name, result in results.items():
+                print(
+                    f"{name:>6}: score {result['score']:.2f}, ~{result['prompt_tokens']:.0f} prompt tokens, "
+                    f"~{result['completion_tokens']:.0f} completion tokens per call",
+                    file=sys.stderr,
+                )
+
+    output = args.output or program_path(signature)
+    save_program(program, output, {
+        "step": args.step,
+        "optimizer": args.optimizer,
+        "model": lm.model,
+        "labeled_set": args.labeled_set,
+        "examples": len(examples),
+        "demos": len(program.demos),
+        "evaluation": results,
+        "compiled_at": datetime.now(timezone.utc).isoformat(),
+    })
+    print(f"Wrote {output} with {len(program.demos)} demos", file=sys.stderr)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
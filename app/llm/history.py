@@ -0,0 +1,22 @@
+import threading
+import dspy
+from dspy.clients.base_lm import GLOBAL_HISTORY
+
+
+# History entries kept per pooled client and globally. Callbacks find their call's entry in the client's
+# history once the call ends, so this must stay above the number of calls in flight on one client.
+LM_HISTORY_LIMIT = 100
+
+_history_lock = threading.Lock()
+
+
+def trim_history(lm: dspy.LM):
+    """
+    Bound the history of a pooled client, which lives for the whole process, and dspy's global one.
+    Called right after a call has been logged and its callbacks have read it back.
+    """
+    with _history_lock:
+        if len(lm.history) > LM_HISTORY_LIMIT:
+            del lm.history[:-LM_HISTORY_LIMIT]
+        if len(GLOBAL_HISTORY) > LM_HISTORY_LIMIT:
+            del GLOBAL_HISTORY[:-LM_HISTORY_LIMIT]
@@ -0,0 +1,268 @@
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Iterator, Optional
+import dspy
+import httpx
+import litellm
+from dspy.utils.callback import with_callbacks
+from streamlit.logger import get_logger
+from app.llm.history import trim_history
+from app.llm.ratelimit import call_with_backoff, notify_retry, rate_limiter, request_tokens
+from app.llm.tokens import estimate_tokens
+
+
+logger = get_logger(__name__)
+
+# Offers the "Local" provider, a stand-in LM that answers every signature without network access.
+LOCAL_LM_ENABLED = os.getenv("LANGDON_LOCAL_LM", "false").lower() == "true"
+# JSON file with output values by field name, e.g. {"score": 40, "investigation_guide": "..."}, replacing the defaults.
+LOCAL_LM_OUTPUTS = os.getenv("LANGDON_LOCAL_LM_OUTPUTS")
+LOCAL_LM_SEED = int(os.getenv("LANGDON_LOCAL_LM_SEED", 0))
+LOCAL_PROVIDER_PREFIX = "local"
+
+OUTPUT_FIELDS_PATTERN = re.compile(r"Your output fields are:\n(.*?)(?:\n\n|$)", re.DOTALL)
+FIELD_NAME_PATTERN = re.compile(r"^\d+\. `(\w+)`", re.MULTILINE)
+DETECTION_NAMES_PATTERN = re.compile(r"\[\[ ## detection_descriptions ## \]\]\n(.*?)(?:\n\n\[\[ ## |$)", re.DOTALL)
+STREAM_CHUNK_CHARS = 12
+
+DEFAULT_OUTPUTS = {
+    "reasoning": "The intel describes the technique in enough detail to map it to concrete log events.",
+    "suggested_detections": [
+        {
+            "name": "Suspicious PowerShell Encoded Command",
+            "mitre_tactic": "Execution",
+            "threat_behavior": "PowerShell started with an encoded command line to hide the script it runs.",
+            "log_evidence": "Process creation events (Sysmon EventID 1) where Image ends with powershell.exe and CommandLine contains -enc.",
+            "context": "Process creation logging with command lines enabled on endpoints.",
+        },
+        {
+            "name": "New Service Installed for Persistence",
+            "mitre_tactic": "Persistence",
+            "threat_behavior": "A service pointing to a binary in a user writable path is installed.",
+            "log_evidence": "Service installation events (System EventID 7045) with ImagePath under C:\\Users or C:\\ProgramData.",
+            "context": "System event log collection on servers and workstations.",
+        },
+    ],
+    "detection_rule": {
+        "code": "process where process.name == \"powershell.exe\" and process.args : (\"-enc\", \"-EncodedCommand\")",
+        "logic": "Matches PowerShell processes started with an encoded command.",
+        "limitations": "Misses obfuscated argument names and PowerShell hosted in other processes.",
+        "false_positive_rate": "Low, some management tooling runs encoded commands.",
+    },
+    "investigation_guide": "1. Decode the command line and review the script.\n2. Check the parent process and user.\n3. Escalate when the script downloads or executes payloads.",
+    "score": 80,
+    "assessment": "The rule covers the described behavior; argument obfuscation is a known gap.",
+    "final_summary": "# Detection package\n\nThe rule, its investigation guide and QA review are ready for deployment.",
+}
+
+
+class LocalProfile:
+    """How a local model behaves: latency before the first token, streaming speed and injected failures."""
+
+    latency_seconds: float
+    tokens_per_second: float
+    error_rate: float
+    invalid_rate: float
+    rpm: int
+    tpm: int
+
+    def __init__(self, latency_seconds: float = 0.0, tokens_per_second: float = 0.0, error_rate: float = 0.0,
+                 invalid_rate: float = 0.0, rpm: int = 1_000_000, tpm: int = 1_000_000_000):
+        self.latency_seconds = latency_seconds
+        # 0 streams as fast as possible
+        self.tokens_per_second = tokens_per_second
+        # share of requests failing with a rate limit error, retried by call_with_backoff
+        self.error_rate = error_rate
+        # share of completions that do not follow the output format, e.g. to exercise escalation
+        self.invalid_rate = invalid_rate
+        self.rpm = rpm
+        self.tpm = tpm
+
+    @staticmethod
+    def from_env():
+        return LocalProfile(
+            latency_seconds=float(os.getenv("LANGDON_LOCAL_LM_LATENCY_SECONDS", 0)),
+            tokens_per_second=float(os.getenv("LANGDON_LOCAL_LM_TOKENS_PER_SECOND", 0)),
+            error_rate=float(os.getenv("LANGDON_LOCAL_LM_ERROR_RATE", 0)),
+            invalid_rate=float(os.getenv("LANGDON_LOCAL_LM_INVALID_RATE", 0)),
+        )
+
+
+# Local models and their profiles, with their context window like MODELS.
+LOCAL_PROFILES = {
+    "instant": LocalProfile(),
+    "realistic": LocalProfile(latency_seconds=1.5, tokens_per_second=80),
+    "flaky": LocalProfile(latency_seconds=0.5, tokens_per_second=200, error_rate=0.3, rpm=60, tpm=100_000),
+    "invalid": LocalProfile(invalid_rate=1.0),
+    "custom": LocalProfile.from_env(),
+}
+LOCAL_CONTEXT_WINDOW = 128_000
+
+
+class LocalLM(dspy.LM):
+    """
+    dspy.LM answering from canned outputs instead of a provider, so prompt rendering, parsing and the UI can be
+    measured offline. Completions are deterministic per request, seed and attempt within one call's retries, so
+    retries of a request that failed may succeed while repeating the call repeats its outcome.
+    """
+
+    profile: LocalProfile
+    outputs: dict[str, Any]
+
+    def __init__(self, model: str, profile: LocalProfile, outputs: Optional[dict[str, Any]] = None, **kwargs):
+        super().__init__(model, cache=False, num_retries=0, **kwargs)
+        self.profile = profile
+        self.outputs = {**DEFAULT_OUTPUTS, **(outputs or {})}
+
+
+        rate_limiter().limits.setdefault(model, (profile.rpm, profile.tpm))
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        messages = messages or [{"role": "user", "content": prompt}]
+        tokens = request_tokens(messages, kwargs.get("max_tokens", self.kwargs.get("max_tokens")))
+
+        attempts = itertools.count()
+        outputs = call_with_backoff(
+            self.model, tokens,
+            lambda: self._call(prompt=prompt, messages=messages, attempt=next(attempts), **kwargs),
+            on_retry=lambda: notify_retry(dspy.settings.callbacks, self.model),
+        )
+        trim_history(self)
+
+        return outputs
+
+    def stream(self, messages: list[dict[str, Any]], attempt: int = 0, **kwargs) -> Iterator[litellm.ModelResponse]:
+        """
+        Streamed completion as litellm chunks, for SignatureStream. Failures and latency happen before the
+        iterator is returned, like a provider failing the request rather than the stream.
+        """
+        completion = self._complete(messages, attempt)
+
+        return self._chunks(completion, self._usage(messages, completion))
+
+    @with_callbacks
+    def _call(self, prompt=None, messages=None, attempt: int = 0, **kwargs):
+        completion = self._complete(messages, attempt)
+        if self.profile.tokens_per_second:
+            time.sleep(estimate_tokens(completion) / self.profile.tokens_per_second)
+
+        entry = dict(
+            prompt=prompt,
+            messages=messages,
+            kwargs={k: v for k, v in {**self.kwargs, **kwargs}.items() if not k.startswith("api_")},
+            response=None,
+            outputs=[completion],
+            usage=dict(self._usage(messages, completion)),
+            cost=0.0,
+            timestamp=datetime.now().isoformat(),
+            uuid=str(uuid.uuid4()),
+            model=self.model,
+            model_type=self.model_type,
+        )
+        self.history.append(entry)
+        self.update_global_history(entry)
+
+        return [completion]
+
+    def _complete(self, messages: list[dict[str, Any]], attempt: int) -> str:
+        rng = self._random(messages, attempt)
+
+        if self.profile.latency_seconds:
+            time.sleep(self.profile.latency_seconds)
+
+        if rng.random() < self.profile.error_rate:
+            raise litellm.RateLimitError(
+                message="Injected rate limit error",
+                llm_provider=LOCAL_PROVIDER_PREFIX,
+                model=self.model,
+                response=httpx.Response(429, request=httpx.Request("POST", "http://localhost")),
+            )
+
+        if rng.random() < self.profile.invalid_rate:
+            return "I am not able to follow the requested output format."
+
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        request = str(messages[-1]["content"])
+        fields = _output_fields(system)
+
+        # the JSON adapter, which dspy falls back to when a chat completion cannot be parsed
+        if "Outputs will be a JSON object" in system:
+            return json.dumps({field: self._output(field, request) for field in fields})
+
+        parts = []
+        for field in fields:
+            value = self._output(field, request)
+            parts.append(f"[[ ## {field} ## ]]\n{value if isinstance(value, str) else json.dumps(value)}")
+        parts.append("[[ ## completed ## ]]")
+
+        return "\n\n".join(parts)
+
+    def _output(self, field: str, request: str) -> Any:
+        if field == "detection_rules" and field not in self.outputs:
+            # a batch of rules answers every detection description of the request
+            return [{"detection_name": name, **self.outputs["detection_rule"]} for name in _detection_names(request)]
+
+        return self.outputs.get(field, f"Local output for {field}.")
+
+    def _random(self, messages: list[dict[str, Any]], attempt: int) -> random.Random:
+        request = hashlib.sha256(json.dumps(messages, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+        return random.Random(f"{LOCAL_LM_SEED}:{request}:{attempt}")
+
+    def _usage(self, messages: list[dict[str, Any]], completion: str) -> litellm.Usage:
+        prompt_tokens = estimate_tokens("".join(str(m["content"]) for m in messages))
+        completion_tokens = estimate_tokens(completion)
+
+        return litellm.Usage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens)
+
+    def _chunks(self, completion: str, usage: litellm.Usage) -> Iterator[litellm.ModelResponse]:
+        delay = 0.0
+        if self.profile.tokens_per_second:
+            delay = estimate_tokens(completion[:STREAM_CHUNK_CHARS]) / self.profile.tokens_per_second
+
+        for i in range(0, len(completion), STREAM_CHUNK_CHARS):
+            if delay:
+                time.sleep(delay)
+
+            chunk = litellm.ModelResponse(stream=True, model=self.model)
+            chunk.choices[0].delta = litellm.utils.Delta(role="assistant", content=completion[i:i + STREAM_CHUNK_CHARS])
+            # usage on the last chunk, as providers send it, so stream_chunk_builder does not count tokens with a tokenizer
+            if i + STREAM_CHUNK_CHARS >= len(completion):
+                chunk.usage = usage
+            yield chunk
+
+
+def local_outputs() -> dict[str, Any]:
+    if not LOCAL_LM_OUTPUTS:
+        return {}
+
+    with open(LOCAL_LM_OUTPUTS, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _output_fields(system: str) -> list[str]:
+    match = OUTPUT_FIELDS_PATTERN.search(system)
+    if match is None:
+        return []
+
+    return FIELD_NAME_PATTERN.findall(match.group(1))
+
+
+def _detection_names(request: str) -> list[str]:
+    match = DETECTION_NAMES_PATTERN.search(request)
+    if match is None:
+        return []
+
+    try:
+        descriptions = json.loads(match.group(1))
+    except json.JSONDecodeError:
+        return []
+
+    return [d.get("name", "") for d in descriptions if isinstance(d, dict)]
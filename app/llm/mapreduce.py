@@ -0,0 +1,102 @@
+import re
+from typing import Any
+from app.llm.tokens import estimate_tokens, CHARS_PER_TOKEN
+
+
+# Two detections whose name and behavior overlap above this Jaccard similarity are considered the same.
+DUPLICATE_SIMILARITY = 0.6
+
+
+def chunk_reports(reports: list[str], max_tokens: int) -> list[list[str]]:
+    """
+    Pack reports into chunks of at most max_tokens.
+    Small reports are grouped together, reports larger than the budget are split on paragraph boundaries.
+    """
+    pieces = []
+    for report in reports:
+        if estimate_tokens(report) <= max_tokens:
+            pieces.append(report)
+        else:
+            pieces.extend(_split_report(report, max_tokens))
+
+    chunks = []
+    current, current_tokens = [], 0
+    for piece in pieces:
+        piece_tokens = estimate_tokens(piece)
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append(current)
+            current, current_tokens = [], 0
+
+        current.append(piece)
+        current_tokens += piece_tokens
+
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+
+def merge_detections(detection_lists: list[list[Any]]) -> list[Any]:
+    """
+    Reduce step of the map-reduce suggestion: flatten per-chunk detections and drop near duplicates,
+    keeping the most detailed variant of each.
+    """
+    merged = []
+    signatures = []
+
+    for detections in detection_lists:
+        for detection in detections or []:
+            words = _words(f"{detection.name} {detection.threat_behavior}")
+
+            duplicate_of = next(
+                (i for i, other in enumerate(signatures) if _jaccard(words, other) >= DUPLICATE_SIMILARITY),
+                None,
+            )
+            if duplicate_of is None:
+                merged.append(detection)
+                signatures.append(words)
+            elif _detail(detection) > _detail(merged[duplicate_of]):
+                merged[duplicate_of] = detection
+                signatures[duplicate_of] = words
+
+    return merged
+
+
+def _split_report(report: str, max_tokens: int) -> list[str]:
+    max_chars = max_tokens * CHARS_PER_TOKEN
+
+    pieces = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", report):
+        while len(paragraph) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            pieces.append(current)
+            current = ""
+
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+
+    if current:
+        pieces.append(current)
+
+    return pieces
+
+
+def _words(text: str) -> set[str]:
+    return set(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def _jaccard(a: set[str], b: set[str]) -> float:
+    if not a or not b:
+        return 0.0
+
+    return len(a & b) / len(a | b)
+
+
+def _detail(detection) -> int:
+    return len(detection.threat_behavior) + len(detection.log_evidence) + len(detection.context)
@@ -0,0 +1,274 @@
+import functools
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+import dspy
+import litellm
+from dspy.utils.callback import BaseCallback
+from streamlit.logger import get_logger
+from app.llm.ratelimit import rate_limiter
+from app.llm.setup import PROVIDERS
+from app.llm.streaming import SignatureStream
+
+
+logger = get_logger(__name__)
+
+# Prometheus text exposition, written after every call and/or served over HTTP when configured.
+METRICS_FILE = os.getenv("LANGDON_METRICS_FILE")
+METRICS_PORT = int(os.getenv("LANGDON_METRICS_PORT", 0))
+RECENT_CALLS = 50
+# System message of dspy's JSON adapter, which re-asks the LM when a chat adapter completion fails to parse.
+JSON_ADAPTER_MARKER = "Outputs will be a JSON object"
+
+
+class CallMetrics(BaseCallback):
+    """Accounts the LM calls made while a PromptSignature step runs."""
+
+    step: str
+    started_at: float
+    first_token_at: Optional[float]
+    lm_calls: int
+    retries: int
+    prompt_tokens: int
+    completion_tokens: int
+    cost: float
+    model: Optional[str]
+
+    def __init__(self, step: str):
+        self.step = step
+        self.started_at = time.monotonic()
+        self.first_token_at = None
+        self.lm_calls = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.model = None
+
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def on_lm_start(self, call_id: str, instance: Any, inputs: dict[str, Any]):
+        messages = inputs.get("messages")
+        with self._lock:
+            self._pending[call_id] = (instance, messages)
+            self.model = instance.model
+
+            if messages and any(m["role"] == "system" and JSON_ADAPTER_MARKER in str(m["content"]) for m in messages):
+                self.retries += 1
+
+    def on_lm_retry(self, model: str):
+        """Not a dspy hook: call_with_backoff and SignatureStream call it before re-attempting a failed call."""
+        with self._lock:
+            self.retries += 1
+
+    def on_lm_first_token(self, call_id: str):
+        """Not a dspy hook: SignatureStream calls it when the first chunk of a streamed completion arrives."""
+        with self._lock:
+            if self.first_token_at is None:
+                self.first_token_at = time.monotonic()
+
+    def on_lm_end(self, call_id: str, outputs: Optional[list[str]], exception: Optional[Exception] = None):
+        with self._lock:
+            instance, messages = self._pending.pop(call_id, (None, None))
+            self.lm_calls += 1
+
+            if self.first_token_at is None:
+                self.first_token_at = time.monotonic()
+
+        if instance is None or exception is not None:
+            return
+
+        # the pooled LM is shared, so find this call's history entry by its messages rather than taking the last one
+        entry = next((e for e in reversed(instance.history) if e["messages"] is messages), None)
+        if entry is None:
+            return
+
+        usage = entry.get("usage") or {}
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        cost = entry.get("cost")
+        if cost is None:
+            cost = _estimate_cost(instance.model, prompt_tokens, completion_tokens)
+
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cost += cost
+
+    def finish(self, error: Optional[Exception] = None) -> dict[str, Any]:
+        now = time.monotonic()
+        first_token_at = self.first_token_at or now
+
+        return {
+            "step": self.step,
+            "model": self.model or "",
+            "wall_seconds": now - self.started_at,
+            "ttft_seconds": first_token_at - self.started_at,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            # re-attempts after transient provider errors, and JSON adapter calls after an unparsable completion
+            "retries": self.retries,
+            "cache_hit": self.lm_calls == 0 and error is None,
+            "cost": self.cost,
+            "error": error is not None,
+        }
+
+
+class MetricsRegistry:
+    """Process-wide aggregates of step calls, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.recent = deque(maxlen=RECENT_CALLS)
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, call: dict[str, Any]):
+        key = (call["step"], call["model"])
+        with self._lock:
+            self.recent.append(call)
+
+            totals = self._totals.setdefault(key, {
+                "calls": 0, "errors": 0, "cache_hits": 0, "retries": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0,
+                "wall_seconds": 0.0, "ttft_seconds": 0.0,
+            })
+            totals["calls"] += 1
+            totals["errors"] += int(call["error"])
+            totals["cache_hits"] += int(call["cache_hit"])
+            for name in ["retries", "prompt_tokens", "completion_tokens", "cost", "wall_seconds", "ttft_seconds"]:
+                totals[name] += call[name]
+
+        if METRICS_FILE:
+            self.write(METRICS_FILE)
+
+    def totals(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return [{"step": step, "model": model, **totals} for (step, model), totals in sorted(self._totals.items())]
+
+    def render_prometheus(self) -> str:
+        metrics = [
+            ("calls", "counter", "Step calls."),
+            ("errors", "counter", "Step calls that raised."),
+            ("cache_hits", "counter", "Step calls served from the response cache."),
+            ("retries", "counter", "LM calls retried by the adapter or after transient provider errors."),
+            ("prompt_tokens", "counter", "Prompt tokens sent."),
+            ("completion_tokens", "counter", "Completion tokens received."),
+            ("cost", "counter", "Estimated cost in USD."),
+            ("wall_seconds", "counter", "Wall time spent in steps, divide by calls for the mean."),
+            ("ttft_seconds", "counter", "Time to first token, divide by calls for the mean."),
+        ]
+        totals = self.totals()
+
+        lines = []
+        for name, kind, description in metrics:
+            metric = f"langdon_step_{name}_total"
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for row in totals:
+                lines.append(f'{metric}{{step="{row["step"]}",model="{row["model"]}"}} {row[name]}')
+
+        lines.append("# HELP langdon_llm_queue_depth Requests waiting for the rate limiter.")
+        lines.append("# TYPE langdon_llm_queue_depth gauge")
+        for model, depth in sorted(rate_limiter().queue_depths().items()):
+            lines.append(f'langdon_llm_queue_depth{{model="{model}"}} {depth}')
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+
+        os.replace(tmp_path, path)
+
+
+_metrics_registry = None
+_metrics_registry_lock = threading.Lock()
+
+
+def metrics_registry() -> MetricsRegistry:
+    """Return the process-wide metrics registry, serving it over HTTP when LANGDON_METRICS_PORT is set."""
+    global _metrics_registry
+    with _metrics_registry_lock:
+        if _metrics_registry is None:
+            _metrics_registry = MetricsRegistry()
+
+            if METRICS_PORT:
+                _serve_metrics(_metrics_registry, METRICS_PORT)
+
+    return _metrics_registry
+
+
+def instrumented_signature(step: str):
+    """
+    Record wall time, time to first token, tokens, retries, cache hits and cost of a PromptSignature method.
+    The LM calls are observed through a CallMetrics callback that the method picks up from dspy.settings.callbacks.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            metrics = CallMetrics(step)
+            # known up front, so calls served from the cache are labelled too
+            model_params = kwargs.get("model_params") or {}
+            if "model" in model_params:
+                provider = model_params.get("llm_provider")
+                metrics.model = f"{PROVIDERS.get(provider, provider)}/{model_params['model']}"
+
+            try:
+                with dspy.context(callbacks=[*dspy.settings.callbacks, metrics]):
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                metrics_registry().record(metrics.finish(error=e))
+                raise
+
+            if isinstance(result, SignatureStream) and result.result is None:
+                result.on_result(lambda _: metrics_registry().record(metrics.finish()))
+            else:
+                metrics_registry().record(metrics.finish())
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def _estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    try:
+        prompt_cost, completion_cost = litellm.cost_per_token(
+            model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+        )
+    except Exception:
+        return 0.0
+
+    return prompt_cost + completion_cost
+
+
+def _serve_metrics(registry: MetricsRegistry, port: int):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render_prometheus().encode("utf-8")
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer(("", port), MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Failed to serve metrics on port {port}: {e}")
+        return
+
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Serving Prometheus metrics on port {port}")
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Optional
+import dspy
+from streamlit.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+# Compiled programs, one <signature name>.json per signature, as written by `python -m app.llm.compile`.
+PROGRAMS_DIR = os.getenv("LANGDON_PROGRAMS_DIR", os.path.join(os.getcwd(), "programs"))
+# Key of the langdon metadata in a program file, next to the dspy module state.
+PROGRAM_METADATA = "langdon"
+# Never called, it is only configured while a module is built.
+PLACEHOLDER_MODEL = "langdon/placeholder"
+
+
+class ProgramRegistry:
+    """
+    The ChainOfThought module of every signature, built once per process and shared by all calls, with the
+    compiled program of the signature loaded into it when there is one. Modules hold no per-call state:
+    the LM comes from the dspy context and the model params are passed as the call config.
+    """
+
+    programs_dir: str
+
+    def __init__(self, programs_dir: str = PROGRAMS_DIR):
+        self.programs_dir = programs_dir
+        self._modules = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def predictor(self, signature) -> dspy.ChainOfThought:
+        with self._lock:
+            module = self._modules.get(signature.__name__)
+            if module is None:
+                module = self._build(signature)
+                self._modules[signature.__name__] = module
+
+        return module
+
+    def load(self, signatures: list) -> list[str]:
+        """Build the modules of the signatures up front, e.g. at startup. Returns those running a compiled program."""
+        for signature in signatures:
+            self.predictor(signature)
+
+        return [signature.__name__ for signature in signatures if self.version(signature)]
+
+    def version(self, signature) -> Optional[str]:
+        """Hash of the compiled program of the signature, None when the signature runs as written."""
+        self.predictor(signature)
+
+        return self._versions.get(signature.__name__)
+
+    def _build(self, signature) -> dspy.ChainOfThought:
+        # ChainOfThought only names its rationale output "reasoning", as the adapters expect, when a dspy.LM is configured
+        with dspy.context(lm=dspy.LM(PLACEHOLDER_MODEL)):
+            module = dspy.ChainOfThought(signature)
+
+        path = program_path(signature, self.programs_dir)
+        if not os.path.exists(path):
+            return module
+
+        with open(path, encoding="utf-8") as f:
+            content = f.read()
+
+        state = json.loads(content)
+        # dspy restores the fields of a signature by position, so a program of other fields would mislabel them
+        fields = state.get(PROGRAM_METADATA, {}).get("fields")
+        if fields != list(module.extended_signature.fields):
+            logger.warning(f"Ignoring compiled program {path}: compiled for fields {fields}, the signature now has {list(module.extended_signature.fields)}")
+            return module
+
+        module.load_state(state)
+        self._versions[signature.__name__] = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+        logger.info(f"Loaded compiled program for {signature.__name__} from {path} with {len(module.demos)} demos")
+
+        return module
+
+
+def program_path(signature, programs_dir: str = PROGRAMS_DIR) -> str:
+    return os.path.join(programs_dir, f"{signature.__name__}.json")
+
+
+def save_program(module: dspy.ChainOfThought, path: str, metadata: dict[str, Any]):
+    """Write a compiled module with the metadata the registry checks before loading it."""
+    state = module.dump_state(save_verbose=False)
+    state[PROGRAM_METADATA] = {**metadata, "fields": list(module.extended_signature.fields)}
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, default=_serializable)
+
+    os.replace(tmp_path, path)
+
+
+def _serializable(value):
+    # demos are dspy Examples
+    if hasattr(value, "toDict"):
+        return value.toDict()
+
+    return str(value)
+
+
+_program_registry = None
+_program_registry_lock = threading.Lock()
+
+
+def program_registry() -> ProgramRegistry:
+    global _program_registry
+    with _program_registry_lock:
+        if _program_registry is None:
+            _program_registry = ProgramRegistry()
+
+    return _program_registry
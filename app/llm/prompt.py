@@ -1,9 +1,32 @@
 import dspy
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel, Field
-from typing import Literal, Optional, Any
+from typing import Literal, Optional
+from streamlit.logger import get_logger
 from app.llm.setup import configure_lm
-from dspy.utils.callback import BaseCallback
-from dspy.clients.base_lm import GLOBAL_HISTORY
+from app.llm.mapreduce import chunk_reports, merge_detections
+from app.llm.budget import fit_inputs, split_batches, TokenBudget, PromptBudgetExceeded, DEFAULT_MAX_OUTPUT_TOKENS
+from app.llm.cache import cached_signature
+from app.llm.streaming import SignatureStream
+from app.llm.capture import PromptCapture
+from app.llm.metrics import instrumented_signature
+from app.llm.programs import program_registry
+from app.llm.routing import escalating_signature, ESCALATION_MODELS, VALIDATION_ERRORS
+from app.llm.tokens import estimate_tokens
+
+logger = get_logger(__name__)
+
+# Reports above this size are split into chunks and analysed with a map-reduce pass.
+SUGGEST_CHUNK_TOKENS = int(os.getenv("LANGDON_SUGGEST_CHUNK_TOKENS", 6000))
+SUGGEST_MAP_WORKERS = int(os.getenv("LANGDON_SUGGEST_MAP_WORKERS", 4))
+# Detection rules created together by create_detection_rules, at most, and the completion tokens reserved for each.
+RULE_BATCH_SIZE = int(os.getenv("LANGDON_RULE_BATCH_SIZE", 8))
+RULE_BATCH_OUTPUT_TOKENS = int(os.getenv("LANGDON_RULE_BATCH_OUTPUT_TOKENS", 600))
+# A batch call gets its own completion budget, the rules of its batch plus the reasoning about them, up to this
+# limit or max_tokens when higher. 4096 is the output limit of the smallest models on offer.
+RULE_BATCH_REASONING_TOKENS = int(os.getenv("LANGDON_RULE_BATCH_REASONING_TOKENS", 400))
+RULE_BATCH_MAX_OUTPUT_TOKENS = int(os.getenv("LANGDON_RULE_BATCH_MAX_OUTPUT_TOKENS", 4096))
 
 class Detection(BaseModel):
     name: str = Field(description="detection rule concise name")
@@ -82,6 +105,54 @@ Ensure that:
     detection_rule: DetectionRule = dspy.OutputField(desc="complete detection rule with code, logic, limitations, and false positive rate")
 
 
+class BatchedDetectionRule(BaseModel):
+    detection_name: str = Field(description="name of the detection description the rule implements, exactly as given")
+    # lenient, so one incomplete rule does not fail the whole batch; it is created again on its own
+    code: str = Field(default="", description="detection rule code")
+    logic: str = Field(default="", description="explanation of the rule's logic")
+    limitations: str = Field(default="", description="limitations and edge cases")
+    false_positive_rate: str = Field(default="", description="estimated false positive rate and rationale")
+
+
+class CreateDetectionRules(dspy.Signature):
+    """# ROLE AND PURPOSE
+You are an experienced detection engineer specialized in creating robust detection rules. Your task is to create one detection rule for each of the detection descriptions provided as input.
+
+Ensure that:
+- Each detection rule accurately captures the threat behavior of its detection description.
+- The detection rules are written in the specified detection language.
+- The detection rules follow the data conventions (field name, types, etc) presented in the example log data, if provided.
+- The detection rules follow the format and idioms used in example detection rules, if provided.
+
+# STEPS
+1. Understand the Threat Behaviors
+    - Carefully read each detection description given as input.
+    - Analyze the threat behavior and associated log data of each one.
+    - Note any detection steps provided for implementation.
+2. Develop the Detection Rules
+    - For each detection description, write a detection rule in the specified detection language that captures its threat behavior.
+    - Follow any supplied detection steps.
+    - Include comments in the code explaining the logic and any assumptions.
+3. Identify Limitations and Edge Cases
+    - Outline any limitations and edge cases each detection rule may encounter.
+4. Estimate False Positive Rates
+    - Provide an estimation of the false positive rate of each detection rule, with a clear rationale.
+
+# ADDITIONAL INSTRUCTIONS
+- Return exactly one detection rule per detection description, in the same order, named after its detection description.
+- If you cannot write a complete detection rule, explain why in its logic and specify the missing information.
+- Separate the detection rule code from the explanations.
+- Ensure your response is clear, professional, and free of errors.
+"""
+    detection_descriptions: list[Detection] = dspy.InputField(desc="descriptions of the detection rules to be created")
+    detection_language: str = dspy.InputField(desc="detection language to write the detection rules in")
+    example_detection_rules: list[str] = dspy.InputField(desc="example detection rules showing the format and idioms used in detection rules")
+    example_logs: list[str] = dspy.InputField(desc="example logs showing the structure of log data or events")
+    detection_steps: Optional[str] = dspy.InputField(desc="outline the steps typically followed when writing detection rules (optional)")
+
+    detection_rules: list[BatchedDetectionRule] = dspy.OutputField(desc="one complete detection rule per detection description, in the same order")
+
+
 class DevelopInvestigationGuide(dspy.Signature):
     """# ROLE AND PURPOSE
 You are an experienced SOC analyst specialized in creating detailed investigation guides for detection rules. Your task is to create an investigation guide based on the provided detection rule and other inputs.
@@ -250,100 +321,342 @@ You are a senior threat analyst tasked with compiling a comprehensive detection
     final_summary: str = dspy.OutputField(desc="markdown-formatted document for the detection package")
 
 
+# Signatures by PromptSignature step, the programs that can be compiled offline and loaded at startup.
+PROGRAM_SIGNATURES = {
+    "suggest_detections_from_intel": SuggestDetectionFromIntel,
+    "create_detection_rule": CreateDetectionRule,
+    "create_detection_rules": CreateDetectionRules,
+    "develop_investigation_guide": DevelopInvestigationGuide,
+    "qa_review": QAReview,
+    "final_summary": FinalSummary,
+}
+
+
 class Debug:
     prompt: str
     response: str
+    budget: Optional[TokenBudget]
 
-    def __init__(self, prompt: str, response: str):
+    def __init__(self, prompt: str, response: str, budget: Optional[TokenBudget] = None):
         self.prompt = prompt
         self.response = response
+        self.budget = budget
 
 
 class PromptSignature:
     @staticmethod
+    @instrumented_signature("suggest_detections_from_intel")
+    @escalating_signature
+    @cached_signature(SuggestDetectionFromIntel)
     def suggest_detections_from_intel(goal: str, reports: list[str], data_source: str, model_params: dict) -> list[Detection]:
         """Interpret the threat intelligence report and extract potential detections."""
-        llm_ctx, model_params = PromptSignature.llm_context(model_params)
-        with llm_ctx:
-            predictor = dspy.ChainOfThought(SuggestDetectionFromIntel, **model_params)
-            output = predictor(goal=goal, reports=reports, data_source=data_source)
+        lm, model_params = PromptSignature.llm(model_params)
+
+        # worker threads do not inherit dspy settings, so the callbacks are handed over explicitly
+        callbacks = dspy.settings.callbacks
+
+        chunks = chunk_reports(reports, SUGGEST_CHUNK_TOKENS)
+        if len(chunks) <= 1:
+            with dspy.context(lm=lm, callbacks=callbacks):
+                predictor = program_registry().predictor(SuggestDetectionFromIntel)
+                inputs, _ = PromptSignature.fit(predictor, lm, model_params, goal=goal, reports=reports, data_source=data_source)
+                output = predictor(**inputs, config=model_params)
+
+            return output.suggested_detections
+
+        logger.info(f"Reports exceed {SUGGEST_CHUNK_TOKENS} tokens, suggesting detections over {len(chunks)} chunks")
+
+        def suggest_chunk(chunk: list[str]) -> list[Detection]:
+            # dspy settings are thread local, so every worker enters its own context
+            with dspy.context(lm=lm, callbacks=callbacks):
+                predictor = program_registry().predictor(SuggestDetectionFromIntel)
+                inputs, _ = PromptSignature.fit(predictor, lm, model_params, goal=goal, reports=chunk, data_source=data_source)
+                output = predictor(**inputs, config=model_params)
 
-            dspy.inspect_history(n=1)
+            return output.suggested_detections
 
-        return output.suggested_detections
+        with ThreadPoolExecutor(max_workers=SUGGEST_MAP_WORKERS, thread_name_prefix="suggest") as pool:
+            detection_lists = list(pool.map(suggest_chunk, chunks))
+
+        return merge_detections(detection_lists)
 
     @staticmethod
+    @instrumented_signature("create_detection_rule")
+    @escalating_signature
+    @cached_signature(CreateDetectionRule)
     def create_detection_rule(detection_description: Detection, detection_language: str, example_logs: list[str], example_detections: list[str], detection_steps: Optional[str], model_params: dict):
         """Create a detection rule based on the provided detection description."""
-        llm_ctx, model_params = PromptSignature.llm_context(model_params)
-        with llm_ctx:
-            predictor = dspy.ChainOfThought(CreateDetectionRule, **model_params)
-            output = predictor(
+        lm, model_params = PromptSignature.llm(model_params)
+        capture = PromptCapture()
+        callbacks = [*dspy.settings.callbacks, capture]
+        with dspy.context(lm=lm, callbacks=callbacks):
+            predictor = program_registry().predictor(CreateDetectionRule)
+            inputs, budget = PromptSignature.fit(
+                predictor, lm, model_params,
+                detection_description=detection_description,
+                detection_language=detection_language,
+                example_logs=example_logs,
+                example_detection_rules=example_detections,
+                detection_steps=detection_steps,
+            )
+            output = predictor(**inputs, config=model_params)
+            rendered_prompt = capture.render()
+
+        return output.detection_rule, Debug(*rendered_prompt, budget=budget)
+
+    @staticmethod
+    @instrumented_signature("create_detection_rule")
+    @escalating_signature
+    @cached_signature(CreateDetectionRule, stream=True)
+    def stream_create_detection_rule(detection_description: Detection, detection_language: str, example_logs: list[str], example_detections: list[str], detection_steps: Optional[str], model_params: dict) -> SignatureStream:
+        """Streaming variant of create_detection_rule, the stream result is (rule, debug)."""
+        lm, model_params = PromptSignature.llm(model_params)
+        capture = PromptCapture()
+        callbacks = [*dspy.settings.callbacks, capture]
+        with dspy.context(lm=lm, callbacks=callbacks):
+            predictor = program_registry().predictor(CreateDetectionRule)
+            inputs, budget = PromptSignature.fit(
+                predictor, lm, model_params,
                 detection_description=detection_description,
                 detection_language=detection_language,
                 example_logs=example_logs,
                 example_detection_rules=example_detections,
                 detection_steps=detection_steps,
             )
-            rendered_prompt = _render_prompts()
 
-            dspy.inspect_history(n=1)
+        return SignatureStream(
+            lm, predictor, inputs, model_params, callbacks,
+            finalize=lambda output: (output.detection_rule, Debug(*capture.render(), budget=budget)),
+        )
 
-        return output.detection_rule, Debug(*rendered_prompt)
+    @staticmethod
+    def create_detection_rules(detection_descriptions: list[Detection], detection_language: str, example_logs: list[str], example_detections: list[str], detection_steps: Optional[str], model_params: dict) -> list[tuple[DetectionRule, Debug]]:
+        """
+        Create the detection rules of several detection descriptions in as few calls as fit the model, sharing
+        the instructions, examples and steps. Rules missing from a batch, or of a batch whose output fails to
+        parse, are created with create_detection_rule. Returns (rule, debug) per description, in order.
+        """
+        # the batch is not escalated, the rules it misses are when created one by one
+        escalation_models = model_params.get(ESCALATION_MODELS)
+        model_params = {k: v for k, v in model_params.items() if k != ESCALATION_MODELS}
+        shared_inputs = dict(
+            detection_language=detection_language,
+            example_logs=example_logs,
+            example_detection_rules=example_detections,
+            detection_steps=detection_steps,
+        )
+
+        results = [None] * len(detection_descriptions)
+        for batch in PromptSignature.rule_batches(detection_descriptions, shared_inputs, dict(model_params)):
+            if len(batch) > 1:
+                descriptions = [detection_descriptions[i] for i in batch]
+                try:
+                    rules, debug = PromptSignature.create_detection_rule_batch(
+                        detection_descriptions=descriptions,
+                        detection_language=detection_language,
+                        example_logs=example_logs,
+                        example_detections=example_detections,
+                        detection_steps=detection_steps,
+                        model_params={**model_params, "max_tokens": rule_batch_max_tokens(len(batch), model_params)},
+                    )
+                except VALIDATION_ERRORS as e:
+                    logger.warning(f"Batch of {len(batch)} detection rules failed to parse, creating them one by one: {e}")
+                else:
+                    for i, rule in zip(batch, _match_batched_rules(descriptions, rules)):
+                        if rule is not None:
+                            results[i] = (rule, debug)
+
+            for i in batch:
+                if results[i] is None:
+                    item_params = dict(model_params)
+                    if escalation_models:
+                        item_params[ESCALATION_MODELS] = escalation_models
+
+                    results[i] = PromptSignature.create_detection_rule(
+                        detection_description=detection_descriptions[i],
+                        detection_language=detection_language,
+                        example_logs=example_logs,
+                        example_detections=example_detections,
+                        detection_steps=detection_steps,
+                        model_params=item_params,
+                    )
+
+        return results
 
     @staticmethod
+    @instrumented_signature("create_detection_rules")
+    @cached_signature(CreateDetectionRules)
+    def create_detection_rule_batch(detection_descriptions: list[Detection], detection_language: str, example_logs: list[str], example_detections: list[str], detection_steps: Optional[str], model_params: dict):
+        """One call of create_detection_rules, the rules are returned as parsed, unmatched and unvalidated."""
+        lm, model_params = PromptSignature.llm(model_params)
+        capture = PromptCapture()
+        callbacks = [*dspy.settings.callbacks, capture]
+        with dspy.context(lm=lm, callbacks=callbacks):
+            predictor = program_registry().predictor(CreateDetectionRules)
+            inputs, budget = PromptSignature.fit(
+                predictor, lm, model_params,
+                detection_descriptions=detection_descriptions,
+                detection_language=detection_language,
+                example_logs=example_logs,
+                example_detection_rules=example_detections,
+                detection_steps=detection_steps,
+            )
+            output = predictor(**inputs, config=model_params)
+            rendered_prompt = capture.render()
+
+        return output.detection_rules, Debug(*rendered_prompt, budget=budget)
+
+    @staticmethod
+    def rule_batches(detection_descriptions: list[Detection], shared_inputs: dict, model_params: dict) -> list[list[int]]:
+        """
+        Split detection descriptions into batches whose prompt fits the model context next to the shared inputs,
+        and whose rules fit the completion budget of a batch call, see rule_batch_max_tokens.
+        """
+        lm, model_params = PromptSignature.llm(model_params)
+        max_output_tokens = rule_batch_max_tokens(RULE_BATCH_SIZE, model_params)
+        max_items = min(RULE_BATCH_SIZE, (max_output_tokens - RULE_BATCH_REASONING_TOKENS) // RULE_BATCH_OUTPUT_TOKENS)
+        if max_items <= 1:
+            return [[i] for i in range(len(detection_descriptions))]
+
+        predictor = program_registry().predictor(CreateDetectionRules)
+        try:
+            _, budget = fit_inputs(
+                predictor.extended_signature, {**shared_inputs, "detection_descriptions": []}, lm.model, max_output_tokens, demos=predictor.demos,
+            )
+        except PromptBudgetExceeded:
+            # the shared inputs need trimming on their own, leave that to the single rule calls
+            return [[i] for i in range(len(detection_descriptions))]
+
+        item_tokens = [estimate_tokens(d.model_dump_json()) for d in detection_descriptions]
+
+        return split_batches(item_tokens, budget.available_prompt_tokens - budget.prompt_tokens, max_items)
+
+    @staticmethod
+    @instrumented_signature("develop_investigation_guide")
+    @escalating_signature
+    @cached_signature(DevelopInvestigationGuide)
     def develop_investigation_guide(detection_rule: DetectionRule, standard_op_procedure: Optional[str], model_params: dict):
-        llm_ctx, model_params = PromptSignature.llm_context(model_params)
-        with llm_ctx:
-            predictor = dspy.ChainOfThought(DevelopInvestigationGuide, **model_params)
-            output = predictor(
+        lm, model_params = PromptSignature.llm(model_params)
+        capture = PromptCapture()
+        callbacks = [*dspy.settings.callbacks, capture]
+        with dspy.context(lm=lm, callbacks=callbacks):
+            predictor = program_registry().predictor(DevelopInvestigationGuide)
+            inputs, budget = PromptSignature.fit(
+                predictor, lm, model_params,
                 detection_rule=detection_rule,
                 example_standard_operation_procedure=standard_op_procedure,
             )
-            rendered_prompt = _render_prompts()
+            output = predictor(**inputs, config=model_params)
+            rendered_prompt = capture.render()
+
+        return output.investigation_guide, Debug(*rendered_prompt, budget=budget)
 
-            dspy.inspect_history(n=1)
+    @staticmethod
+    @instrumented_signature("develop_investigation_guide")
+    @escalating_signature
+    @cached_signature(DevelopInvestigationGuide, stream=True)
+    def stream_develop_investigation_guide(detection_rule: DetectionRule, standard_op_procedure: Optional[str], model_params: dict) -> SignatureStream:
+        """Streaming variant of develop_investigation_guide, the stream result is (guide, debug)."""
+        lm, model_params = PromptSignature.llm(model_params)
+        capture = PromptCapture()
+        callbacks = [*dspy.settings.callbacks, capture]
+        with dspy.context(lm=lm, callbacks=callbacks):
+            predictor = program_registry().predictor(DevelopInvestigationGuide)
+            inputs, budget = PromptSignature.fit(
+                predictor, lm, model_params,
+                detection_rule=detection_rule,
+                example_standard_operation_procedure=standard_op_procedure,
+            )
 
-        return output.investigation_guide, Debug(*rendered_prompt)
+        return SignatureStream(
+            lm, predictor, inputs, model_params, callbacks,
+            finalize=lambda output: (output.investigation_guide, Debug(*capture.render(), budget=budget)),
+        )
 
     @staticmethod
+    @instrumented_signature("qa_review")
+    @escalating_signature
+    @cached_signature(QAReview)
     def qa_review(detection_description: Detection, detection_rule: DetectionRule, model_params: dict):
         """Conduct a thorough and comprehensive review of a given detection rule."""
-        llm_ctx, model_params = PromptSignature.llm_context(model_params)
-        with llm_ctx:
-            predictor = dspy.ChainOfThought(QAReview, **model_params)
-            output = predictor(
+        lm, model_params = PromptSignature.llm(model_params)
+        capture = PromptCapture()
+        callbacks = [*dspy.settings.callbacks, capture]
+        with dspy.context(lm=lm, callbacks=callbacks):
+            predictor = program_registry().predictor(QAReview)
+            inputs, budget = PromptSignature.fit(
+                predictor, lm, model_params,
                 detection_description=detection_description,
                 detection_rule=detection_rule,
             )
-            rendered_prompt = _render_prompts()
-
-            dspy.inspect_history(n=1)
+            output = predictor(**inputs, config=model_params)
+            rendered_prompt = capture.render()
 
-        return output.score, output.assessment, Debug(*rendered_prompt)
+        return output.score, output.assessment, Debug(*rendered_prompt, budget=budget)
 
     @staticmethod
+    @instrumented_signature("final_summary")
+    @escalating_signature
+    @cached_signature(FinalSummary)
     def final_summary(detection_description: Detection, detection_rule: DetectionRule, investigation_guide: str, qa_assessment: str, qa_score: int, model_params: dict):
         """Compile a comprehensive detection package for the security operations team."""
 
-        llm_ctx, model_params = PromptSignature.llm_context(model_params)
-        with llm_ctx:
-            predictor = dspy.ChainOfThought(FinalSummary, **model_params)
-            output = predictor(
+        lm, model_params = PromptSignature.llm(model_params)
+        capture = PromptCapture()
+        callbacks = [*dspy.settings.callbacks, capture]
+        with dspy.context(lm=lm, callbacks=callbacks):
+            predictor = program_registry().predictor(FinalSummary)
+            inputs, budget = PromptSignature.fit(
+                predictor, lm, model_params,
+                detection_description=detection_description,
+                detection_rule=detection_rule,
+                investigation_guide=investigation_guide,
+                qa_assessment=qa_assessment,
+                qa_score=qa_score,
+            )
+            output = predictor(**inputs, config=model_params)
+            rendered_prompt = capture.render()
+
+        return output.final_summary, Debug(*rendered_prompt, budget=budget)
+
+    @staticmethod
+    @instrumented_signature("final_summary")
+    @escalating_signature
+    @cached_signature(FinalSummary, stream=True)
+    def stream_final_summary(detection_description: Detection, detection_rule: DetectionRule, investigation_guide: str, qa_assessment: str, qa_score: int, model_params: dict) -> SignatureStream:
+        """Streaming variant of final_summary, the stream result is (summary, debug)."""
+        lm, model_params = PromptSignature.llm(model_params)
+        capture = PromptCapture()
+        callbacks = [*dspy.settings.callbacks, capture]
+        with dspy.context(lm=lm, callbacks=callbacks):
+            predictor = program_registry().predictor(FinalSummary)
+            inputs, budget = PromptSignature.fit(
+                predictor, lm, model_params,
                 detection_description=detection_description,
                 detection_rule=detection_rule,
                 investigation_guide=investigation_guide,
                 qa_assessment=qa_assessment,
                 qa_score=qa_score,
             )
-            rendered_prompt = _render_prompts()
 
-            dspy.inspect_history(n=1)
+        return SignatureStream(
+            lm, predictor, inputs, model_params, callbacks,
+            finalize=lambda output: (output.final_summary, Debug(*capture.render(), budget=budget)),
+        )
 
-        return output.final_summary, Debug(*rendered_prompt)
+    @staticmethod
+    def fit(predictor, lm, model_params: dict, **inputs):
+        """Pre-flight check of the rendered prompt against the model context, trimming low priority inputs."""
+        return fit_inputs(predictor.extended_signature, inputs, lm.model, model_params.get("max_tokens"), demos=predictor.demos)
 
     @staticmethod
     def llm_context(model_params: dict):
+        lm, model_params = PromptSignature.llm(model_params)
+
+        return dspy.context(lm=lm), model_params
+
+    @staticmethod
+    def llm(model_params: dict):
         provider = model_params["llm_provider"]
         model = model_params["model"]
 
@@ -352,55 +665,42 @@ class PromptSignature:
         del model_params["llm_provider"]
         del model_params["model"]
 
-        return dspy.context(lm=lm), model_params
-
-
-def _render_prompts():
-    return _format_history(GLOBAL_HISTORY[-1:])
-
-
-def _format_history(history):
-    """Format prompts and their completions."""
-
-    input_prompt = ""
-    response = ""
-
-    for item in history:
-        messages = item["messages"] or [{"role": "user", "content": item["prompt"]}]
-        for msg in messages:
-            input_prompt += f"{msg['role'].capitalize()} message:\n"
-            input_prompt += _format_message_content(msg["content"])
-            input_prompt += "\n"
-
-        outputs = item["outputs"]
-        response += outputs[0].strip()
-
-        if len(outputs) > 1:
-            choices_text = f" \t (and {len(outputs)-1} other completions)\n"
-            response += choices_text
-
-    input_prompt += "\n"
-    response += "\n"
-
-    return input_prompt, response
-
-
-def _format_message_content(content: str | list[dict[str, Any]]):
-    if isinstance(content, str):
-        return f"{content.strip()}\n"
-
-    if not isinstance(content, list):
-        return
-
-    for c in content:
-        if c["type"] == "text":
-            return f"{c['text'].strip()}\n"
-        elif c["type"] == "image_url":
-            image_str = ""
-            if "base64" in c["image_url"].get("url", ""):
-                len_base64 = len(c["image_url"]["url"].split("base64,")[1])
-                image_str = f"<{c['image_url']['url'].split('base64,')[0]}base64,<IMAGE BASE 64 ENCODED({str(len_base64)})>"
-            else:
-                image_str = f"<image_url: {c['image_url']['url']}>"
-
-            return f"{image_str.strip()}\n"
+        return lm, model_params
+
+
+def rule_batch_max_tokens(batch_size: int, model_params: dict) -> int:
+    """
+    Completion budget of a batch call: RULE_BATCH_OUTPUT_TOKENS per rule and RULE_BATCH_REASONING_TOKENS, capped
+    by RULE_BATCH_MAX_OUTPUT_TOKENS, and never below max_tokens, which is sized for a single rule.
+    """
+    max_tokens = model_params.get("max_tokens") or DEFAULT_MAX_OUTPUT_TOKENS
+    batch_tokens = batch_size * RULE_BATCH_OUTPUT_TOKENS + RULE_BATCH_REASONING_TOKENS
+
+    return max(max_tokens, min(batch_tokens, RULE_BATCH_MAX_OUTPUT_TOKENS))
+
+
+def _match_batched_rules(detection_descriptions: list[Detection], rules: list[BatchedDetectionRule]) -> list[Optional[DetectionRule]]:
+    """
+    The rule of each description, None when it is missing, incomplete or ambiguous. Rules are matched by name,
+    and by position only when the batch answered every description and no other description claims the rule by
+    name. Duplicate names, in the descriptions or the rules, are ambiguous.
+    """
+    names = [description.name.strip().lower() for description in detection_descriptions]
+    rule_names = [rule.detection_name.strip().lower() for rule in rules]
+    positional = len(rules) == len(detection_descriptions)
+
+    matched = []
+    for i, name in enumerate(names):
+        rule = None
+        if names.count(name) == 1:
+            if rule_names.count(name) == 1:
+                rule = rules[rule_names.index(name)]
+            elif rule_names.count(name) == 0 and positional and rule_names[i] not in names:
+                rule = rules[i]
+
+        if rule is None or not rule.code.strip():
+            matched.append(None)
+        else:
+            matched.append(DetectionRule(**rule.model_dump(exclude={"detection_name"})))
+
+    return matched
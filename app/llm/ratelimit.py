@@ -0,0 +1,204 @@
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Optional
+import litellm
+from streamlit.logger import get_logger
+from app.llm.tokens import estimate_tokens
+
+
+logger = get_logger(__name__)
+
+DEFAULT_RPM = int(os.getenv("LANGDON_RATE_LIMIT_RPM", 500))
+DEFAULT_TPM = int(os.getenv("LANGDON_RATE_LIMIT_TPM", 200_000))
+# Per-model overrides as "model=rpm/tpm" pairs, e.g. "openai/gpt-4o=500/30000,antropic/claude-2=50/40000".
+RATE_LIMITS = os.getenv("LANGDON_RATE_LIMITS", "")
+
+MAX_RETRIES = int(os.getenv("LANGDON_RATE_LIMIT_MAX_RETRIES", 8))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+# Transient provider errors worth queueing behind a backoff instead of failing the step.
+RETRYABLE_ERRORS = (
+    litellm.RateLimitError,
+    litellm.ServiceUnavailableError,
+    litellm.InternalServerError,
+    litellm.Timeout,
+    litellm.APIConnectionError,
+)
+
+
+class TokenBucket:
+    """
+    Bucket refilled continuously up to its capacity. take() reserves right away and returns how long
+    the caller must wait, so waiting callers are served in arrival order.
+    """
+
+    capacity: float
+    rate: float
+    tokens: float
+    updated_at: float
+
+    def __init__(self, capacity: float, per_seconds: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def take(self, amount: float) -> float:
+        self._refill()
+
+        # a request larger than the bucket would wait forever, let it through once the bucket is full
+        self.tokens -= min(amount, self.capacity)
+        if self.tokens >= 0:
+            return 0.0
+
+        return -self.tokens / self.rate
+
+    def drain(self, seconds: float):
+        """Block the bucket for the given time, e.g. after the provider answered with Retry-After."""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+class RateLimiter:
+    """Process-wide requests-per-minute and tokens-per-minute buckets per provider model."""
+
+    def __init__(self, default_rpm: int, default_tpm: int, limits: dict[str, tuple[int, int]]):
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.limits = limits
+
+        self._buckets = {}
+        self._queued = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, model: str, tokens: int):
+        """Wait until a request of about `tokens` tokens to `model` fits in both buckets."""
+        with self._lock:
+            requests, token_bucket = self._model_buckets(model)
+            wait = max(requests.take(1), token_bucket.take(tokens))
+
+            if wait <= 0:
+                return
+
+            self._queued[model] = self._queued.get(model, 0) + 1
+
+        logger.info(f"Rate limit reached for {model}, queueing request for {wait:.1f}s")
+        try:
+            time.sleep(wait)
+        finally:
+            with self._lock:
+                self._queued[model] -= 1
+
+    def backoff(self, model: str, seconds: float):
+        """Hold back every request to `model` for `seconds`, the provider is throttling it."""
+        with self._lock:
+            for bucket in self._model_buckets(model):
+                bucket.drain(seconds)
+
+    def queue_depths(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._queued)
+
+    def _model_buckets(self, model: str) -> tuple[TokenBucket, TokenBucket]:
+        buckets = self._buckets.get(model)
+        if buckets is None:
+            rpm, tpm = self.limits.get(model, (self.default_rpm, self.default_tpm))
+            buckets = (TokenBucket(rpm), TokenBucket(tpm))
+            self._buckets[model] = buckets
+
+        return buckets
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def rate_limiter() -> RateLimiter:
+    """Return the process-wide rate limiter."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(DEFAULT_RPM, DEFAULT_TPM, parse_rate_limits(RATE_LIMITS))
+
+    return _rate_limiter
+
+
+def parse_rate_limits(spec: str) -> dict[str, tuple[int, int]]:
+    limits = {}
+    for limit in spec.split(","):
+        if "=" not in limit:
+            continue
+
+        model, values = (part.strip() for part in limit.split("=", 1))
+        rpm, tpm = values.split("/")
+        limits[model] = (int(rpm), int(tpm))
+
+    return limits
+
+
+def request_tokens(messages: list[dict[str, Any]], max_tokens: Optional[int]) -> int:
+    """Tokens a request counts against the TPM limit: the prompt plus the completion it may produce."""
+    prompt = "".join(m["content"] if isinstance(m["content"], str) else json.dumps(m["content"]) for m in messages)
+
+    return estimate_tokens(prompt) + (max_tokens or 0)
+
+
+def call_with_backoff(model: str, tokens: int, call: Callable[[], Any], on_retry: Optional[Callable[[], None]] = None):
+    """
+    Run a provider request behind the rate limiter, retrying transient errors with jittered exponential
+    backoff. A Retry-After sent by the provider takes precedence and holds back all requests to the model.
+    on_retry is called before every re-attempt, e.g. to count it in the step metrics.
+    """
+    limiter = rate_limiter()
+
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire(model, tokens)
+        try:
+            return call()
+        except RETRYABLE_ERRORS as e:
+            if attempt == MAX_RETRIES:
+                raise
+
+            delay = retry_after(e)
+            if delay is None:
+                # full jitter keeps concurrent sessions from retrying in lockstep
+                delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+            else:
+                limiter.backoff(model, delay)
+
+            logger.warning(f"{type(e).__name__} from {model}, retrying in {delay:.1f}s ({attempt + 1}/{MAX_RETRIES})")
+            if on_retry is not None:
+                on_retry()
+            time.sleep(delay)
+
+
+def notify_retry(callbacks: list, model: str):
+    """Dispatch a re-attempt to the callbacks that observe them, e.g. CallMetrics. Not a dspy hook."""
+    for callback in callbacks:
+        if hasattr(callback, "on_lm_retry"):
+            callback.on_lm_retry(model=model)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        # an HTTP date instead of seconds, fall back to the exponential backoff
+        return None
+
+    return None
@@ -0,0 +1,76 @@
+import functools
+import inspect
+import os
+from typing import Optional
+from streamlit.logger import get_logger
+from app.llm.setup import PROVIDERS, MODELS
+
+
+logger = get_logger(__name__)
+
+# PromptSignature steps that can be routed to their own model.
+ROUTED_STEPS = {
+    "suggest_detections_from_intel": "Suggest detections",
+    "create_detection_rule": "Detection rule",
+    "develop_investigation_guide": "Investigation guide",
+    "qa_review": "QA review",
+    "final_summary": "Final summary",
+}
+
+# model_params key with the models to retry with, in order, when a step's output fails validation.
+ESCALATION_MODELS = "escalation_models"
+# Adapter parse and pydantic validation errors are ValueErrors. Other errors are bugs, not bad outputs,
+# and are not worth a paid retry on another model.
+VALIDATION_ERRORS = (ValueError,)
+
+
+def default_step_models() -> dict[str, str]:
+    """Per-step models from LANGDON_STEP_MODELS, e.g. "qa_review=gpt-4o-mini,final_summary=gpt-4o-mini"."""
+    routes = {}
+    for route in os.getenv("LANGDON_STEP_MODELS", "").split(","):
+        if "=" not in route:
+            continue
+
+        step, model = (part.strip() for part in route.split("=", 1))
+        if step not in ROUTED_STEPS:
+            logger.warning(f"Ignoring model route for unknown step {step}")
+            continue
+
+        routes[step] = model
+
+    return routes
+
+
+def route_model(provider: str, default_model: str, step_model: Optional[str]) -> str:
+    """The model a step runs on: its own when set and offered by the provider, the default otherwise."""
+    if step_model and step_model in MODELS.get(PROVIDERS.get(provider), {}):
+        return step_model
+
+    return default_model
+
+
+def escalating_signature(fn):
+    """
+    Retry a PromptSignature method with the models in model_params[ESCALATION_MODELS] when its structured
+    output fails validation, e.g. a cheap model returning an unparsable DetectionRule.
+    Streamed methods only fail once consumed, so they are not escalated.
+    """
+    fn_signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        bound = fn_signature.bind(*args, **kwargs)
+        model_params = {k: v for k, v in bound.arguments["model_params"].items() if k != ESCALATION_MODELS}
+        models = [model_params["model"], *bound.arguments["model_params"].get(ESCALATION_MODELS, [])]
+
+        for i, model in enumerate(models):
+            bound.arguments["model_params"] = {**model_params, "model": model}
+            try:
+                return fn(*bound.args, **bound.kwargs)
+            except VALIDATION_ERRORS as e:
+                if i == len(models) - 1:
+                    raise
+
+                logger.warning(f"{fn.__name__} output of {model} failed validation, escalating to {models[i + 1]}: {e}")
+
+    return wrapper
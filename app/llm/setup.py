@@ -1,31 +1,169 @@
 import dspy
+import httpx
+import litellm
 import os
+import threading
+import time
+from typing import Optional
 from litellm import LiteLLM
+from app.llm.history import trim_history
+from app.llm.ratelimit import call_with_backoff, notify_retry, request_tokens
+from app.llm.local import LocalLM, LOCAL_LM_ENABLED, LOCAL_PROFILES, LOCAL_CONTEXT_WINDOW, LOCAL_PROVIDER_PREFIX, local_outputs
+from streamlit.logger import get_logger
+
+logger = get_logger(__name__)
+
+LM_POOL_IDLE_SECONDS = int(os.getenv("LANGDON_LM_POOL_IDLE_SECONDS", 15 * 60))
+
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+HTTP_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
 
 PROVIDERS = {
     "OpenAI": "openai",
     "Antropic": "antropic",
 }
+# Supported models per provider and their context window, in tokens.
 MODELS = {
-    "openai": [
-        "gpt-4o-mini",
-        "o1-mini",
-        "o1-preview",
-        "gpt-4o",
-        "gpt-4",
-        "gpt-3.5-turbo",
-    ],
-    "antropic": [
-        "claude-3",
-        "claude-3-5-sonnet-20240620",
-        "claude-3-haiku-20240307",
-        "claude-3-opus-20240229",
-        "claude-3-sonnet-20240229",
-        "claude-2",
-        "claude-2.1",
-        "claude-instant-1.2"
-    ],
+    "openai": {
+        "gpt-4o-mini": 128_000,
+        "o1-mini": 128_000,
+        "o1-preview": 128_000,
+        "gpt-4o": 128_000,
+        "gpt-4": 8_192,
+        "gpt-3.5-turbo": 16_385,
+    },
+    "antropic": {
+        "claude-3": 200_000,
+        "claude-3-5-sonnet-20240620": 200_000,
+        "claude-3-haiku-20240307": 200_000,
+        "claude-3-opus-20240229": 200_000,
+        "claude-3-sonnet-20240229": 200_000,
+        "claude-2": 100_000,
+        "claude-2.1": 200_000,
+        "claude-instant-1.2": 100_000,
+    },
 }
+DEFAULT_CONTEXT_WINDOW = 8_192
+
+if LOCAL_LM_ENABLED:
+    PROVIDERS["Local"] = LOCAL_PROVIDER_PREFIX
+    MODELS[LOCAL_PROVIDER_PREFIX] = {model: LOCAL_CONTEXT_WINDOW for model in LOCAL_PROFILES}
+
+
+class RateLimitedLM(dspy.LM):
+    """dspy.LM whose requests wait for the process-wide rate limiter and back off on throttling."""
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        tokens = request_tokens(
+            messages or [{"role": "user", "content": prompt}],
+            kwargs.get("max_tokens", self.kwargs.get("max_tokens")),
+        )
+
+        # every attempt goes through LM.__call__, so callbacks see retries as separate LM calls
+        outputs = call_with_backoff(
+            self.model, tokens,
+            lambda: super(RateLimitedLM, self).__call__(prompt=prompt, messages=messages, **kwargs),
+            on_retry=lambda: notify_retry(dspy.settings.callbacks, self.model),
+        )
+        trim_history(self)
+
+        return outputs
+
+
+class LMSettings:
+    """Provider connection settings, read from the environment once per pool generation."""
+
+    api_base: Optional[str]
+    api_key: Optional[str]
+    extra_headers: Optional[dict[str, str]]
+
+    def __init__(self, api_base: Optional[str], api_key: Optional[str], extra_headers: Optional[dict[str, str]]):
+        self.api_base = api_base
+        self.api_key = api_key
+        self.extra_headers = extra_headers
+
+    @staticmethod
+    def from_env():
+        extra_headers = None
+        header = os.getenv("LANGDON_LLM_PROVIDER_EXTRA_HEADER")
+        if header is not None:
+            name, value = header.split(":")
+            extra_headers = {name: value}
+
+        return LMSettings(
+            api_base=os.getenv("LANGDON_LLM_PROVIDER_API_BASE"),
+            api_key=os.getenv("LANGDON_LLM_OVERRIDE_API_KEY"),
+            extra_headers=extra_headers,
+        )
+
+
+class LMPool:
+    """
+    Process-wide pool of LM clients shared across steps and sessions.
+    Clients are keyed by provider, model, api_base and headers, and evicted after LM_POOL_IDLE_SECONDS unused.
+    """
+
+    def __init__(self, idle_seconds: int):
+        self.idle_seconds = idle_seconds
+        self.settings = LMSettings.from_env()
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        _configure_http_client()
+
+    def get(self, provider_prefix: str, model: str) -> dspy.LM:
+        with self._lock:
+            self._evict_idle()
+
+            settings = self.settings
+            headers = tuple(sorted((settings.extra_headers or {}).items()))
+            key = (provider_prefix, model, settings.api_base, headers)
+
+            entry = self._entries.get(key)
+            if entry is None:
+                logger.info(f"Creating LM client for {provider_prefix}/{model}")
+                entry = [_create_lm(provider_prefix, model, settings), 0.0]
+                self._entries[key] = entry
+
+            entry[1] = time.monotonic()
+
+            return entry[0]
+
+    def flush(self):
+        """Drop every pooled client and re-read the provider settings, e.g. after credentials rotate."""
+        with self._lock:
+            self._entries.clear()
+            self.settings = LMSettings.from_env()
+
+        logger.info("Flushed LM client pool")
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        for key, (_, last_used) in list(self._entries.items()):
+            if now - last_used > self.idle_seconds:
+                logger.info(f"Evicting idle LM client {key[0]}/{key[1]}")
+                del self._entries[key]
+
+
+_lm_pool = None
+_lm_pool_lock = threading.Lock()
+
+
+def lm_pool() -> LMPool:
+    """Return the process-wide LM client pool."""
+    global _lm_pool
+    with _lm_pool_lock:
+        if _lm_pool is None:
+            _lm_pool = LMPool(idle_seconds=LM_POOL_IDLE_SECONDS)
+
+    return _lm_pool
+
+
+def flush_lm_pool():
+    lm_pool().flush()
 
 
 def configure_lm(provider, model):
@@ -37,23 +175,42 @@ def configure_lm(provider, model):
 
     provider_prefix = PROVIDERS[provider]
 
+    return lm_pool().get(provider_prefix, model)
+
+
+def _create_lm(provider_prefix: str, model: str, settings: LMSettings) -> dspy.LM:
     model_fqn = f"{provider_prefix}/{model}"
 
+    if provider_prefix == LOCAL_PROVIDER_PREFIX:
+        return LocalLM(model_fqn, LOCAL_PROFILES[model], outputs=local_outputs())
+
     lm_args = {"model": model_fqn}
 
-    api_base = os.getenv("LANGDON_LLM_PROVIDER_API_BASE")
-    if api_base is not None:
-        lm_args["api_base"] = api_base
+    if settings.api_base is not None:
+        lm_args["api_base"] = settings.api_base
 
-    api_key = os.getenv("LANGDON_LLM_OVERRIDE_API_KEY")
-    if api_key is not None:
-        lm_args["api_key"] = api_key
+    if settings.api_key is not None:
+        lm_args["api_key"] = settings.api_key
 
-    header = os.getenv("LANGDON_LLM_PROVIDER_EXTRA_HEADER")
-    if header is not None:
-        name, value = header.split(":")
-        lm_args["extra_headers"] = {name: value}
+    if settings.extra_headers is not None:
+        lm_args["extra_headers"] = settings.extra_headers
 
-    lm = dspy.LM(**lm_args)
+    # retries are left to call_with_backoff, which also queues behind the shared rate limiter
+    lm = RateLimitedLM(**lm_args, num_retries=0)
 
     return lm
+
+
+def _configure_http_client():
+    # LiteLLM builds provider SDK clients on top of this session, sharing it keeps connections alive across calls.
+    # No shared async session: its connections are bound to the event loop that opened them, and steps run
+    # their async calls on a new loop every time.
+    if litellm.client_session is None:
+        litellm.client_session = httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+
+
+def context_window(model_fqn: str) -> int:
+    """Context window of a configured model, given its "provider/model" name."""
+    provider_prefix, _, model = model_fqn.partition("/")
+
+    return MODELS.get(provider_prefix, {}).get(model, DEFAULT_CONTEXT_WINDOW)
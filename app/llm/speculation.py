@@ -0,0 +1,102 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+from streamlit.logger import get_logger
+from app.llm.budget import DEFAULT_MAX_OUTPUT_TOKENS
+from app.llm.cache import signature_cache_key, CACHE_SAMPLED_RESPONSES
+from app.llm.prompt import PromptSignature, CreateDetectionRule, Detection
+from app.llm.tokens import estimate_tokens
+
+
+logger = get_logger(__name__)
+
+# How many of the suggested detections get a rule generated before the analyst picks one.
+SPECULATIVE_RULES = int(os.getenv("LANGDON_SPECULATIVE_RULES", 3))
+# Estimated tokens (prompt plus completion) a session may spend on speculation.
+SPECULATION_TOKEN_CAP = int(os.getenv("LANGDON_SPECULATION_TOKEN_CAP", 30000))
+SPECULATION_WORKERS = int(os.getenv("LANGDON_SPECULATION_WORKERS", 4))
+
+
+class RuleSpeculation:
+    """
+    Detection rules generated in the background for suggested detections, so the rule of the detection
+    the analyst selects is already running or done.
+    """
+
+    token_cap: int
+    spent_tokens: int
+    futures: dict[str, Future]
+
+    def __init__(self, token_cap: int = SPECULATION_TOKEN_CAP):
+        self.token_cap = token_cap
+        self.spent_tokens = 0
+        self.futures = {}
+
+    def speculate(self, detection: Detection, detection_language: str, detection_steps: Optional[str], model_params: dict) -> bool:
+        """Start generating the rule of a detection unless it already runs or the spend cap is reached."""
+        key = self._key(detection, detection_language, detection_steps, model_params)
+        if key in self.futures:
+            return True
+
+        cost = self._estimate_cost(detection, detection_steps, model_params)
+        if self.spent_tokens + cost > self.token_cap:
+            logger.info(f"Skipping speculative rule for {detection.name}: ~{cost} tokens would exceed the {self.token_cap} token cap")
+            return False
+
+        self.spent_tokens += cost
+        self.futures[key] = _executor().submit(
+            PromptSignature.create_detection_rule,
+            detection_description=detection,
+            detection_language=detection_language,
+            example_logs=[],
+            example_detections=[],
+            detection_steps=detection_steps,
+            model_params=dict(model_params),
+        )
+        logger.info(f"Started speculative rule for {detection.name} (~{cost} tokens, {self.spent_tokens}/{self.token_cap} spent)")
+
+        return True
+
+    def take(self, detection: Detection, detection_language: str, detection_steps: Optional[str], model_params: dict) -> Optional[Future]:
+        """Claim the speculation matching these inputs, if any, and cancel the others."""
+        future = self.futures.pop(self._key(detection, detection_language, detection_steps, model_params), None)
+        self.cancel()
+
+        return future
+
+    def cancel(self):
+        """Cancel speculations that did not start yet; running ones finish and their result is dropped."""
+        cancelled = sum(1 for future in self.futures.values() if future.cancel())
+        if self.futures:
+            logger.info(f"Cancelled {cancelled} of {len(self.futures)} unused speculative rules")
+
+        self.futures = {}
+
+    def _key(self, detection: Detection, detection_language: str, detection_steps: Optional[str], model_params: dict) -> str:
+        inputs = {
+            "detection_description": detection,
+            "detection_language": detection_language,
+            "detection_steps": detection_steps,
+        }
+        params = {k: v for k, v in model_params.items() if k != CACHE_SAMPLED_RESPONSES}
+
+        return signature_cache_key(CreateDetectionRule, inputs, params)
+
+    def _estimate_cost(self, detection: Detection, detection_steps: Optional[str], model_params: dict) -> int:
+        prompt = (CreateDetectionRule.__doc__ or "") + detection.model_dump_json() + (detection_steps or "")
+
+        return estimate_tokens(prompt) + (model_params.get("max_tokens") or DEFAULT_MAX_OUTPUT_TOKENS)
+
+
+_speculation_executor = None
+_speculation_executor_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _speculation_executor
+    with _speculation_executor_lock:
+        if _speculation_executor is None:
+            _speculation_executor = ThreadPoolExecutor(max_workers=SPECULATION_WORKERS, thread_name_prefix="speculation")
+
+    return _speculation_executor
@@ -0,0 +1,203 @@
+import itertools
+import re
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Iterator, Optional
+import dspy
+import litellm
+from dspy.adapters.chat_adapter import ChatAdapter
+from dspy.utils.callback import BaseCallback
+from streamlit.logger import get_logger
+from app.llm.history import trim_history
+from app.llm.local import LocalLM
+from app.llm.ratelimit import call_with_backoff, request_tokens
+
+
+logger = get_logger(__name__)
+
+FIELD_HEADER_PATTERN = re.compile(r"\[\[ ## (\w+) ## \]\]")
+
+
+class SignatureStream:
+    """
+    Streams the completion of a signature call as readable text, e.g. for st.write_stream.
+    The result built from the parsed outputs is available in `result` once the stream is exhausted.
+    """
+
+    lm: Optional[dspy.LM]
+    predictor: Any
+    inputs: dict[str, Any]
+    model_params: dict[str, Any]
+    callbacks: list[BaseCallback]
+    result: Any
+
+    def __init__(self, lm: Optional[dspy.LM], predictor, inputs: dict[str, Any], model_params: dict[str, Any],
+                 callbacks: list[BaseCallback], finalize: Optional[Callable[[dspy.Prediction], Any]]):
+        self.lm = lm
+        self.predictor = predictor
+        self.inputs = inputs
+        self.model_params = model_params
+        self.callbacks = callbacks
+        self.result = None
+
+        self._finalize = finalize
+        self._result_callbacks = []
+        self._done = False
+
+    @classmethod
+    def completed(cls, result) -> "SignatureStream":
+        """A stream that yields nothing, e.g. for a cached result."""
+        stream = cls(None, None, {}, {}, callbacks=[], finalize=None)
+        stream.result = result
+        stream._done = True
+
+        return stream
+
+    def on_result(self, callback: Callable[[Any], None]):
+        self._result_callbacks.append(callback)
+
+    def __iter__(self) -> Iterator[str]:
+        if self._done:
+            return
+
+        signature = self.predictor.extended_signature
+        adapter = ChatAdapter()
+        messages = adapter.format(signature, demos=self.predictor.demos, inputs=self.inputs)
+        kwargs = {**self.lm.kwargs, **self.model_params}
+
+        # LM.__call__ is bypassed, so dispatch its callbacks here
+        call_id = uuid.uuid4().hex
+        self._notify("on_lm_start", call_id=call_id, instance=self.lm, inputs={"prompt": None, "messages": messages, "kwargs": kwargs})
+
+        chunks = []
+        completion = ""
+        headers = _FieldHeaderFormatter()
+        try:
+            # only the request is retried, a stream that breaks off midway fails the step
+            attempts = itertools.count()
+            response = call_with_backoff(
+                self.lm.model,
+                request_tokens(messages, kwargs.get("max_tokens")),
+                lambda: self._completion(messages, kwargs, next(attempts)),
+                on_retry=lambda: self._notify("on_lm_retry", model=self.lm.model),
+            )
+
+            for chunk in response:
+                if not chunks:
+                    self._notify("on_lm_first_token", call_id=call_id)
+                chunks.append(chunk)
+
+                delta = chunk.choices[0].delta.content or ""
+                completion += delta
+
+                text = headers.feed(delta)
+                if text:
+                    yield text
+        except Exception as e:
+            self._notify("on_lm_end", call_id=call_id, outputs=None, exception=e)
+            raise
+
+        text = headers.flush()
+        if text:
+            yield text
+
+        self._record(messages, kwargs, chunks, completion)
+        self._notify("on_lm_end", call_id=call_id, outputs=[completion], exception=None)
+        trim_history(self.lm)
+
+        try:
+            output = dspy.Prediction(**adapter.parse(signature, completion))
+        except ValueError as e:
+            # same recovery as the non-streamed predictor: a regular call, which falls back to the JSON adapter
+            logger.warning(f"Failed to parse streamed completion, retrying without streaming: {e}")
+            self._notify("on_lm_retry", model=self.lm.model)
+            with dspy.context(lm=self.lm, callbacks=self.callbacks):
+                output = self.predictor(**self.inputs, config=self.model_params)
+
+        self.result = self._finalize(output)
+        self._done = True
+
+        for callback in self._result_callbacks:
+            callback(self.result)
+
+    def _completion(self, messages, kwargs, attempt: int):
+        if isinstance(self.lm, LocalLM):
+            return self.lm.stream(messages, attempt=attempt, **kwargs)
+
+        return litellm.completion(
+            model=self.lm.model,
+            messages=messages,
+            stream=True,
+            num_retries=self.lm.num_retries,
+            **kwargs,
+        )
+
+    def _notify(self, handler: str, **kwargs):
+        for callback in self.callbacks:
+            if not hasattr(callback, handler):
+                continue
+
+            try:
+                getattr(callback, handler)(**kwargs)
+            except Exception as e:
+                logger.warning(f"Error when calling callback {callback}: {e}")
+
+    def _record(self, messages, kwargs, chunks, completion):
+        """Log the call like LM.__call__ does, the callbacks of LM.__call__ do not see streamed requests."""
+        response = litellm.stream_chunk_builder(chunks, messages=messages)
+        usage = dict(response.usage) if response is not None and response.usage else {}
+
+        try:
+            cost = litellm.completion_cost(completion_response=response)
+        except Exception:
+            cost = None
+
+        entry = dict(
+            prompt=None,
+            messages=messages,
+            kwargs={k: v for k, v in kwargs.items() if not k.startswith("api_")},
+            response=response,
+            outputs=[completion],
+            usage=usage,
+            cost=cost,
+            timestamp=datetime.now().isoformat(),
+            uuid=str(uuid.uuid4()),
+            model=self.lm.model,
+            model_type=self.lm.model_type,
+        )
+        self.lm.history.append(entry)
+
+
+class _FieldHeaderFormatter:
+    """Rewrites the `[[ ## field ## ]]` markers of the chat adapter into markdown headings as text arrives."""
+
+    def __init__(self):
+        self.pending = ""
+
+    def feed(self, text: str) -> str:
+        self.pending += text
+
+        # hold back a marker that is still arriving
+        cut = self.pending.rfind("[")
+        start = self.pending.rfind("[[")
+        if start != -1 and "]]" not in self.pending[start:]:
+            cut = start
+        elif cut != len(self.pending) - 1:
+            cut = len(self.pending)
+
+        ready, self.pending = self.pending[:cut], self.pending[cut:]
+
+        return FIELD_HEADER_PATTERN.sub(_heading, ready)
+
+    def flush(self) -> str:
+        ready, self.pending = self.pending, ""
+
+        return FIELD_HEADER_PATTERN.sub(_heading, ready)
+
+
+def _heading(match: re.Match) -> str:
+    field = match.group(1)
+    if field == "completed":
+        return ""
+
+    return f"\n\n**{field.replace('_', ' ').capitalize()}**\n"
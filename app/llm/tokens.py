@@ -0,0 +1,9 @@
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate, about 4 characters per token for English prose."""
+    if not text:
+        return 0
+
+    return -(-len(text) // CHARS_PER_TOKEN)
@@ -33,12 +33,31 @@ DETECTION_ENGINEERING_STEPS = [
     DetectionEngineeringStep.FINAL_SUMMARY,
 ]
 
+# Steps a step needs before it can run. Steps with all their dependencies complete run together,
+# e.g. the investigation guide and the QA review only need the detection rule.
+DETECTION_ENGINEERING_STEP_DEPENDENCIES = {
+    DetectionEngineeringStep.INIT: [],
+    DetectionEngineeringStep.SUGGEST_DETECTION_FROM_INTEL: [DetectionEngineeringStep.INIT],
+    DetectionEngineeringStep.GENERATE_DETECTION_RULE: [DetectionEngineeringStep.SUGGEST_DETECTION_FROM_INTEL],
+    DetectionEngineeringStep.DEVELOP_INVESTIGATION_PLAYBOOK: [DetectionEngineeringStep.GENERATE_DETECTION_RULE],
+    DetectionEngineeringStep.QA_REVIEW: [DetectionEngineeringStep.GENERATE_DETECTION_RULE],
+    DetectionEngineeringStep.FINAL_SUMMARY: [
+        DetectionEngineeringStep.DEVELOP_INVESTIGATION_PLAYBOOK,
+        DetectionEngineeringStep.QA_REVIEW,
+    ],
+}
+
 
 class StateKey(Enum):
     LLM_PROVIDER = "llm_provider"
     MODEL = "model"
     MODEL_TEMPERATURE = "model_temperature"
     MODEL_MAX_TOKENS = "model_max_tokens"
+    STEP_MODEL = "step_model"
+    ESCALATE_INVALID_OUTPUT = "escalate_invalid_output"
+    CACHE_SAMPLED_RESPONSES = "cache_sampled_responses"
+    STREAM_RESPONSES = "stream_responses"
+    SPECULATIVE_RULES = "speculative_rules"
     DATA_SOURCE = "data_source"
     DETECTION_LANG = "detection_lang"
 
@@ -46,12 +65,28 @@ class StateKey(Enum):
     TRIAGE_STEPS = "triage_steps"
 
     DETECTION_ENG_CURRENT_STEP = "detection_eng_current_step"
+    DETECTION_ENG_COMPLETED_STEPS = "detection_eng_completed_steps"
 
     DETECTION_GOAL = "detection_goal"
     THREAT_SOURCES = "threat_sources"
     UPLOADED_THREAT_FILE = "uploaded_threat_file"
+    UPLOADED_THREAT_FILE_GENERATION = "uploaded_threat_file_generation"
+    UPLOADED_THREAT_FILE_PAGES = "uploaded_threat_file_pages"
+    UPLOADED_THREAT_FILE_LAYOUT_AWARE = "uploaded_threat_file_layout_aware"
+    UPLOADED_THREAT_FILE_IOC_TABLES = "uploaded_threat_file_ioc_tables"
+    UPLOADED_THREAT_FILE_ERROR = "uploaded_threat_file_error"
+    SPOOLED_THREAT_FILE = "spooled_threat_file"
     SCRAPED_THREAT_SOURCE = "scraped_threat_source"
 
+    BULK_MANIFEST_FILE = "bulk_manifest_file"
+    BULK_MANIFEST_FILE_GENERATION = "bulk_manifest_file_generation"
+    BULK_MANIFEST_PATH = "bulk_manifest_path"
+    BULK_DEFAULT_GOAL = "bulk_default_goal"
+    BULK_OUTPUT_DIR = "bulk_output_dir"
+    BULK_WORKERS = "bulk_workers"
+    BULK_MAX_DETECTIONS = "bulk_max_detections"
+    BULK_JOB = "bulk_job"
+
     EXAMPLE_DETECTIONS = "example_detections"
     EXAMPLE_LOGS = "example_logs"
 
@@ -62,6 +97,8 @@ class StateKey(Enum):
     INVESTIGATION_GUIDE = "investigation_guide"
     QA_REVIEW = "qa_review"
     FINAL_SUMMARY = "final_summary"
+    RULE_SPECULATION = "rule_speculation"
+    STEP_CALLS = "step_calls"
 
 
 class State:
@@ -76,6 +113,9 @@ class State:
         if not State.has(StateKey.DETECTION_ENG_CURRENT_STEP):
             State.set(StateKey.DETECTION_ENG_CURRENT_STEP, DETECTION_ENGINEERING_STEPS[0])
 
+        if not State.has(StateKey.DETECTION_ENG_COMPLETED_STEPS):
+            State.set(StateKey.DETECTION_ENG_COMPLETED_STEPS, set())
+
     @staticmethod
     def reset():
         execution_state = [
@@ -85,12 +125,29 @@ class State:
             StateKey.INVESTIGATION_GUIDE,
             StateKey.QA_REVIEW,
             StateKey.FINAL_SUMMARY,
+            StateKey.RULE_SPECULATION,
+            StateKey.STEP_CALLS,
         ]
 
+        speculation = State.get(StateKey.RULE_SPECULATION)
+        if speculation is not None:
+            speculation.cancel()
+
+        State.discard_spooled_upload()
+
         for key in execution_state:
             State.set(key, None)
 
         State.set(StateKey.DETECTION_ENG_CURRENT_STEP, DETECTION_ENGINEERING_STEPS[0])
+        State.set(StateKey.DETECTION_ENG_COMPLETED_STEPS, set())
+
+    @staticmethod
+    def discard_spooled_upload():
+        """Remove the upload spooled to disk by the threat source dialog and not submitted."""
+        spooled_file = State.get(StateKey.SPOOLED_THREAT_FILE)
+        if spooled_file is not None:
+            spooled_file.discard()
+            State.delete(StateKey.SPOOLED_THREAT_FILE)
 
     @staticmethod
     def component_key(key: StateKey, prefix="", suffix=""):
@@ -122,23 +179,40 @@ class State:
         State.set(key, list_val)
 
     @staticmethod
-    def advance_detection_engineering_step():
+    def complete_detection_engineering_step(step: DetectionEngineeringStep):
         """
-        Advance the detection engineering step to the next step.
+        Mark a detection engineering step as done and move the current step to the furthest step
+        whose dependencies are complete.
         NOTE: call st.rerun() after calling this method to re-render the page.
         """
+        completed = set(State.get(StateKey.DETECTION_ENG_COMPLETED_STEPS, set()))
+        completed.add(step)
+        State.set(StateKey.DETECTION_ENG_COMPLETED_STEPS, completed)
+
         current_step = State.get(StateKey.DETECTION_ENG_CURRENT_STEP)
-        current_index = DETECTION_ENGINEERING_STEPS.index(current_step)
-        next_index = current_index + 1
+        next_step = max(
+            [s for s in DETECTION_ENGINEERING_STEPS if State._dependencies_complete(s, completed)],
+            key=DETECTION_ENGINEERING_STEPS.index,
+        )
 
-        if next_index < len(DETECTION_ENGINEERING_STEPS):
-            next_step = DETECTION_ENGINEERING_STEPS[next_index]
-            logger.info(
-                f"Advancing from {DETECTION_ENGINEERING_STEPS[current_index]} to next step: {DETECTION_ENGINEERING_STEPS[next_index]}")
+        if next_step != current_step:
+            logger.info(f"Completed {step}, advancing from {current_step} to next step: {next_step}")
 
             State.set(StateKey.DETECTION_ENG_CURRENT_STEP, next_step)
-        else:
-            st.error("No more steps to advance to.")
+
+    @staticmethod
+    def ready_detection_engineering_steps() -> list[DetectionEngineeringStep]:
+        """Steps whose dependencies are complete but have not run yet."""
+        completed = State.get(StateKey.DETECTION_ENG_COMPLETED_STEPS, set())
+
+        return [
+            s for s in DETECTION_ENGINEERING_STEPS
+            if s not in completed and State._dependencies_complete(s, completed)
+        ]
+
+    @staticmethod
+    def _dependencies_complete(step: DetectionEngineeringStep, completed: set) -> bool:
+        return all(d in completed for d in DETECTION_ENGINEERING_STEP_DEPENDENCIES[step])
 
     @staticmethod
     def get(key: StateKey | str, default=None):
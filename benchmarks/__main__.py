@@ -0,0 +1,99 @@
+"""
+End-to-end benchmarks of the detection engineering pipeline on the local stand-in LM.
+
+    python -m benchmarks run --output results.json
+    python -m benchmarks compare baseline.json results.json
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+
+def configure_environment():
+    # before any app module is imported: settings are read at import time
+    os.environ.setdefault("LANGDON_LOCAL_LM", "true")
+
+    # cold, throwaway caches, so runs on the same machine are comparable
+    cache_dir = tempfile.mkdtemp(prefix="langdon-benchmark-")
+    os.environ["LANGDON_CACHE_DIR"] = os.path.join(cache_dir, "content")
+    os.environ["LANGDON_RESPONSE_CACHE_PATH"] = os.path.join(cache_dir, "responses.sqlite")
+
+
+def run(args) -> int:
+    configure_environment()
+
+    from benchmarks import drivers, report
+    from benchmarks.corpora import corpus_names
+
+    run_driver = {"signatures": drivers.run_signatures, "app": drivers.run_app}
+    corpora = corpus_names(args.corpus.split(","))
+
+    runs = []
+    for driver in args.driver.split(","):
+        for corpus in corpora:
+            for repetition in range(args.repeat):
+                print(f"{driver} {corpus} {repetition + 1}/{args.repeat}", file=sys.stderr)
+                for stage in run_driver[driver](corpus, args.model):
+                    runs.append({"driver": driver, "corpus": corpus, "repetition": repetition, **stage})
+
+    document = report.results_document(runs, args.model)
+    report.write_results(document, args.output)
+
+    for row in document["results"]:
+        print(f"{row['driver']:<11} {row['corpus']:<12} {row['stage']:<9} {row['wall_seconds']:>8.3f}s "
+              f"{row['peak_rss_mb']:>8.1f} MB {row['prompt_tokens']:>8} prompt tokens"
+              + (f" {row['reruns']:>3} reruns" if "reruns" in row else ""))
+
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        return compare_results(args.baseline, args.output, args.threshold)
+
+    return 0
+
+
+def compare(args) -> int:
+    return compare_results(args.baseline, args.current, args.threshold)
+
+
+def compare_results(baseline_path: str, current_path: str, thresholds: list[str]) -> int:
+    from benchmarks import report
+
+    baseline = report.load_results(baseline_path)
+    current = report.load_results(current_path)
+    changes = report.compare(baseline, current, report.parse_thresholds(thresholds))
+
+    print(report.render_report(baseline, current, changes))
+
+    return 1 if any(c["regression"] for c in changes) else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and write a results file")
+    run_parser.add_argument("--output", default="benchmark-results.json")
+    run_parser.add_argument("--driver", default="signatures,app", help="comma separated: signatures, app")
+    run_parser.add_argument("--corpus", default="small,medium,huge",
+                            help="comma separated corpora, sizes (small, medium, huge) or formats (text, pdf)")
+    run_parser.add_argument("--model", default="instant", help="local LM profile, e.g. instant or realistic")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--baseline", help="results file to compare the new results with")
+    run_parser.add_argument("--threshold", action="append", default=[], help="metric=relative increase, e.g. wall_seconds=0.1")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="report regressions between two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", action="append", default=[], help="metric=relative increase, e.g. wall_seconds=0.1")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
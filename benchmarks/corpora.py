@@ -0,0 +1,127 @@
+import hashlib
+import os
+import random
+import textwrap
+import fitz
+from app.ingestion import pdf
+from app.ingestion.spool import SpooledUpload
+
+
+FIXTURES_DIR = os.getenv("LANGDON_BENCHMARK_FIXTURES_DIR", os.path.join(os.path.expanduser("~"), ".cache", "langdon-benchmarks"))
+# Bump when the generated reports change, so stale fixtures are not compared with new ones.
+FIXTURES_VERSION = 1
+
+# Report sizes, in words.
+SIZES = {
+    "small": 1_500,
+    "medium": 15_000,
+    "huge": 150_000,
+}
+FORMATS = ["text", "pdf"]
+CORPORA = [f"{size}-{fmt}" for size in SIZES for fmt in FORMATS]
+
+GOAL = "Detect initial access, persistence and exfiltration by the actor described in the reports."
+
+ACTORS = ["EMBER BEAR", "SCARLET LYNX", "COBALT HERON", "IRON MARMOT"]
+TOOLS = ["Cobalt Strike", "Sliver", "PowerShell Empire", "rclone", "AdFind", "Mimikatz"]
+SERVICES = ["AWS Lambda", "EC2 instance profiles", "S3 buckets", "IAM roles", "Okta admin console", "GitLab runners"]
+PARAGRAPHS = [
+    "{actor} gained initial access through a phishing email that delivered an ISO archive. The archive contained a "
+    "shortcut file launching {tool} from a hidden directory, which connected to {domain} over HTTPS.",
+    "After landing, the operators enumerated {service} with stolen credentials of {user}. CloudTrail recorded bursts "
+    "of List and Describe calls from {ip} within a few minutes of the first login.",
+    "For persistence the actor created a new access key for {user} and attached an inline policy granting full "
+    "access to {service}. The key was used from {ip} on the following days.",
+    "Data was staged in a temporary bucket and exfiltrated with {tool} to infrastructure behind {domain}. The "
+    "transfer was throttled to stay below volume alerts.",
+    "The operators disabled logging on {service} shortly before the exfiltration and re-enabled it afterwards, "
+    "leaving a gap of about {minutes} minutes in the audit trail.",
+    "A scheduled function in {service} was modified to download a second stage from {domain} whose SHA-256 hash "
+    "was {hash}. The function ran under a role with broad permissions.",
+]
+HEADINGS = ["Executive summary", "Initial access", "Discovery", "Persistence", "Exfiltration", "Defense evasion"]
+
+PDF_LINE_CHARS = 95
+PDF_LINES_PER_PAGE = 60
+PDF_HEADER = "ACME Threat Research - TLP:CLEAR"
+
+
+def corpus_names(selection: list[str]) -> list[str]:
+    """Corpora matching the selection, given as corpus names, sizes or formats."""
+    names = [c for c in CORPORA if c in selection or any(part in selection for part in c.split("-"))]
+    unknown = [s for s in selection if s not in CORPORA and s not in SIZES and s not in FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown corpora: {', '.join(unknown)}")
+
+    return names
+
+
+def generate_report(words: int, seed: int = 0) -> str:
+    """A synthetic threat report of about `words` words, the same for the same size and seed."""
+    rng = random.Random(f"{seed}:{words}")
+    sections = []
+    count = 0
+
+    while count < words:
+        section = [f"## {HEADINGS[len(sections) % len(HEADINGS)]}"]
+        for _ in range(rng.randint(3, 8)):
+            paragraph = rng.choice(PARAGRAPHS).format(
+                actor=rng.choice(ACTORS),
+                tool=rng.choice(TOOLS),
+                service=rng.choice(SERVICES),
+                user=f"svc-{rng.choice(['deploy', 'backup', 'ci', 'admin'])}-{rng.randint(1, 99)}",
+                ip=f"{rng.randint(11, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                domain=f"{rng.choice(['cdn', 'update', 'sync', 'telemetry'])}-{rng.randint(100, 999)}.example.net",
+                hash=hashlib.sha256(str(rng.random()).encode()).hexdigest(),
+                minutes=rng.randint(5, 90),
+            )
+            section.append(paragraph)
+            count += len(paragraph.split())
+
+        sections.append("\n\n".join(section))
+
+    return "# Threat report\n\n" + "\n\n".join(sections)
+
+
+def corpus_path(name: str) -> str:
+    """Path of a corpus fixture, generated on first use."""
+    size, fmt = name.split("-")
+    extension = "pdf" if fmt == "pdf" else "md"
+    path = os.path.join(FIXTURES_DIR, f"v{FIXTURES_VERSION}", f"{name}.{extension}")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    report = generate_report(SIZES[size])
+    tmp_path = f"{path}.tmp"
+
+    if fmt == "pdf":
+        _write_pdf(report, tmp_path)
+    else:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(report)
+
+    os.replace(tmp_path, path)
+
+    return path
+
+
+def load_corpus(name: str) -> str:
+    """Extract a corpus fixture like an upload, with the layout-aware PDF extraction the UI defaults to."""
+    return pdf.serialize_file(SpooledUpload.from_path(corpus_path(name)), layout_aware=True)
+
+
+def _write_pdf(report: str, path: str):
+    lines = []
+    for paragraph in report.split("\n\n"):
+        lines.extend(textwrap.wrap(paragraph, PDF_LINE_CHARS) + [""])
+
+    document = fitz.open()
+    for i in range(0, len(lines), PDF_LINES_PER_PAGE):
+        page = document.new_page()
+        page.insert_text((50, 40), PDF_HEADER, fontsize=8)
+        page.insert_text((50, 70), "\n".join(lines[i:i + PDF_LINES_PER_PAGE]), fontsize=9)
+        page.insert_text((290, 820), str(i // PDF_LINES_PER_PAGE + 1), fontsize=8)
+
+    document.save(path)
+    document.close()
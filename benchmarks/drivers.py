@@ -0,0 +1,185 @@
+import contextlib
+import resource
+import sys
+import time
+from typing import Any, Iterator
+from streamlit.testing.v1 import AppTest
+from app.ingestion.cache import content_cache
+from app.llm.cache import response_cache
+from app.llm.local import LOCAL_PROVIDER_PREFIX
+from app.llm.metrics import metrics_registry
+from app.llm.prompt import PromptSignature
+from app.llm.setup import PROVIDERS
+from app.state import StateKey
+from benchmarks.corpora import GOAL, load_corpus
+
+
+LOCAL_PROVIDER = next(name for name, prefix in PROVIDERS.items() if prefix == LOCAL_PROVIDER_PREFIX)
+DATA_SOURCE = ["AWS CloudTrail Logs"]
+DETECTION_LANGUAGE = "Splunk SPL"
+MAX_TOKENS = 1000
+APP_TIMEOUT_SECONDS = 600
+# Runs of the app script per interaction above which the pipeline is assumed stuck.
+MAX_APP_RUNS = 20
+
+_script_runs = 0
+
+
+def run_signatures(corpus: str, model: str) -> list[dict[str, Any]]:
+    """Suggest, rule, guide, QA and summary through PromptSignature, as the steps of the UI call them."""
+    _clear_caches()
+    model_params = {"temperature": 0.0, "max_tokens": MAX_TOKENS, "llm_provider": LOCAL_PROVIDER, "model": model}
+    stages = []
+
+    with measure(stages, "ingest"):
+        report = load_corpus(corpus)
+
+    with measure(stages, "suggest"):
+        detections = PromptSignature.suggest_detections_from_intel(GOAL, [report], ", ".join(DATA_SOURCE), dict(model_params))
+
+    detection = detections[0]
+    with measure(stages, "rule"):
+        rule, _ = PromptSignature.create_detection_rule(detection, DETECTION_LANGUAGE, [], [], None, dict(model_params))
+
+    with measure(stages, "guide"):
+        guide, _ = PromptSignature.develop_investigation_guide(rule, None, dict(model_params))
+
+    with measure(stages, "qa"):
+        score, assessment, _ = PromptSignature.qa_review(detection, rule, dict(model_params))
+
+    with measure(stages, "summary"):
+        PromptSignature.final_summary(detection, rule, guide, assessment, score, dict(model_params))
+
+    return stages
+
+
+def run_app(corpus: str, model: str) -> list[dict[str, Any]]:
+    """The same flow through the Streamlit page, clicking through it like an analyst with AppTest."""
+    _clear_caches()
+    report = load_corpus(corpus)
+    stages = []
+
+    app = AppTest.from_function(_app_script, default_timeout=APP_TIMEOUT_SECONDS)
+    app.session_state[StateKey.LLM_PROVIDER.value] = LOCAL_PROVIDER
+    app.session_state[StateKey.MODEL.value] = model
+    app.session_state[StateKey.DATA_SOURCE.value] = DATA_SOURCE
+    app.session_state[StateKey.DETECTION_LANG.value] = DETECTION_LANGUAGE
+    app.session_state[StateKey.DETECTION_GOAL.value] = GOAL
+    app.session_state[StateKey.THREAT_SOURCES.value] = [{"type": "file", "id": corpus, "content": report}]
+
+    with measure(stages, "load", count_reruns=True):
+        _run(app)
+
+    with measure(stages, "suggest", count_reruns=True):
+        _button(app, "Start detection generation").click()
+        _run(app)
+
+    with measure(stages, "pipeline", count_reruns=True):
+        _button(app, "Process Selected Detection").click()
+        _run(app)
+
+        # the page advances one step per run once the previous step stored its result
+        runs = 0
+        while app.session_state[StateKey.FINAL_SUMMARY.value] is None:
+            runs += 1
+            if runs > MAX_APP_RUNS:
+                raise RuntimeError(f"Pipeline did not reach the final summary, stuck at {app.session_state[StateKey.DETECTION_ENG_CURRENT_STEP.value]}")
+            _run(app)
+
+    return stages
+
+
+@contextlib.contextmanager
+def measure(stages: list[dict[str, Any]], stage: str, count_reruns: bool = False) -> Iterator[None]:
+    """Record wall time, peak RSS, prompt tokens and LM calls (and app script runs) of a stage."""
+    _reset_peak_rss()
+    totals_before = _llm_totals()
+    runs_before = _script_runs
+    started_at = time.perf_counter()
+
+    yield
+
+    wall_seconds = time.perf_counter() - started_at
+    totals_after = _llm_totals()
+    result = {
+        "stage": stage,
+        "wall_seconds": wall_seconds,
+        "peak_rss_mb": _peak_rss_mb(),
+        "prompt_tokens": totals_after["prompt_tokens"] - totals_before["prompt_tokens"],
+        "llm_calls": totals_after["calls"] - totals_before["calls"],
+    }
+    if count_reruns:
+        result["reruns"] = _script_runs - runs_before
+
+    stages.append(result)
+
+
+def _app_script():
+    # runs as the AppTest script, in this process, so the counter of this module is shared
+    from benchmarks import drivers
+    drivers.count_script_run()
+
+    from app.chat.page import DetectionEngineeringPage
+    from app.state import State
+
+    State.init()
+    DetectionEngineeringPage().render()
+
+
+def count_script_run():
+    global _script_runs
+    _script_runs += 1
+
+
+def _run(app: AppTest):
+    app.run()
+    if app.exception:
+        raise RuntimeError(f"App raised: {app.exception[0].message}")
+
+
+def _button(app: AppTest, label: str):
+    button = next((b for b in app.button if b.label == label), None)
+    if button is None:
+        raise RuntimeError(f"No {label!r} button on the page")
+    if button.disabled:
+        raise RuntimeError(f"{label!r} button is disabled")
+
+    return button
+
+
+def _clear_caches():
+    # every repetition measures a cold run, not the response or extraction cache
+    response_cache().clear()
+    content_cache().clear()
+
+
+def _llm_totals() -> dict[str, float]:
+    totals = {"calls": 0, "prompt_tokens": 0}
+    for row in metrics_registry().totals():
+        totals["calls"] += row["calls"]
+        totals["prompt_tokens"] += row["prompt_tokens"]
+
+    return totals
+
+
+def _reset_peak_rss():
+    # Linux resets VmHWM, the peak RSS, on writing 5 to clear_refs; elsewhere the peak is the process-wide one
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    # bytes on macOS, kilobytes elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
@@ -0,0 +1,153 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+
+# Relative increase over the baseline that counts as a regression, per metric.
+DEFAULT_THRESHOLDS = {
+    "wall_seconds": 0.25,
+    "peak_rss_mb": 0.15,
+    "prompt_tokens": 0.05,
+    "llm_calls": 0.0,
+    "reruns": 0.0,
+}
+# Increases below these are noise whatever their relative size, e.g. a stage going from 2ms to 3ms.
+MIN_DELTAS = {
+    "wall_seconds": 0.05,
+    "peak_rss_mb": 5.0,
+}
+KEY_FIELDS = ("driver", "corpus", "stage")
+
+
+def aggregate(runs: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """One row per driver, corpus and stage: the median over the repetitions, and the max of the peak RSS."""
+    groups = {}
+    for run in runs:
+        groups.setdefault(tuple(run[k] for k in KEY_FIELDS), []).append(run)
+
+    rows = []
+    for key, group in groups.items():
+        row = dict(zip(KEY_FIELDS, key))
+        row["repeat"] = len(group)
+        for metric in DEFAULT_THRESHOLDS:
+            values = [run[metric] for run in group if metric in run]
+            if not values:
+                continue
+
+            if metric == "peak_rss_mb":
+                row[metric] = max(values)
+            elif metric == "wall_seconds":
+                row[metric] = statistics.median(values)
+            else:
+                # counts stay integers
+                row[metric] = statistics.median_low(values)
+            if metric == "wall_seconds" and len(values) > 1:
+                row["wall_seconds_stdev"] = statistics.stdev(values)
+
+        rows.append(row)
+
+    return rows
+
+
+def results_document(runs: list[dict[str, Any]], model: str) -> dict[str, Any]:
+    return {
+        "commit": _git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "model": model,
+        "results": aggregate(runs),
+        "runs": runs,
+    }
+
+
+def write_results(document: dict[str, Any], path: str):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+
+
+def load_results(path: str) -> dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any], thresholds: Optional[dict[str, float]] = None) -> list[dict[str, Any]]:
+    """Changes of every metric measured in both results, flagged as regressions when above the thresholds."""
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    baseline_rows = {tuple(row[k] for k in KEY_FIELDS): row for row in baseline["results"]}
+
+    changes = []
+    for row in current["results"]:
+        base = baseline_rows.get(tuple(row[k] for k in KEY_FIELDS))
+        if base is None:
+            continue
+
+        for metric, threshold in thresholds.items():
+            if metric not in row or metric not in base:
+                continue
+
+            delta = row[metric] - base[metric]
+            relative = delta / base[metric] if base[metric] else (float("inf") if delta > 0 else 0.0)
+            regression = relative > threshold and delta > MIN_DELTAS.get(metric, 0)
+
+            changes.append({
+                **{k: row[k] for k in KEY_FIELDS},
+                "metric": metric,
+                "baseline": base[metric],
+                "current": row[metric],
+                "relative": relative,
+                "regression": regression,
+            })
+
+    return changes
+
+
+def render_report(baseline: dict[str, Any], current: dict[str, Any], changes: list[dict[str, Any]]) -> str:
+    regressions = [c for c in changes if c["regression"]]
+    lines = [
+        f"Baseline {baseline.get('commit') or 'unknown'} ({baseline.get('created_at')}), "
+        f"current {current.get('commit') or 'unknown'} ({current.get('created_at')})",
+        "",
+        f"{'driver':<11} {'corpus':<12} {'stage':<9} {'metric':<14} {'baseline':>12} {'current':>12} {'change':>9}",
+    ]
+    for change in changes:
+        marker = "  REGRESSION" if change["regression"] else ""
+        relative = "new" if change["relative"] == float("inf") else f"{change['relative']:+.1%}"
+        lines.append(
+            f"{change['driver']:<11} {change['corpus']:<12} {change['stage']:<9} {change['metric']:<14} "
+            f"{change['baseline']:>12.3f} {change['current']:>12.3f} {relative:>9}{marker}"
+        )
+
+    lines.append("")
+    lines.append(f"{len(regressions)} regressions in {len(changes)} compared metrics.")
+
+    return "\n".join(lines)
+
+
+def parse_thresholds(values: list[str]) -> dict[str, float]:
+    """Threshold overrides given as "metric=relative increase", e.g. "wall_seconds=0.1"."""
+    thresholds = {}
+    for value in values:
+        metric, _, threshold = value.partition("=")
+        if metric not in DEFAULT_THRESHOLDS:
+            raise ValueError(f"Unknown metric {metric}, expected one of {', '.join(DEFAULT_THRESHOLDS)}")
+
+        thresholds[metric] = float(threshold)
+
+    return thresholds
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return result.stdout.strip()
@@ -1,10 +1,19 @@
-from app.chat.page import DetectionEngineeringPage
 from dotenv import load_dotenv
+
+# before the app modules are imported, they read their settings from the environment on import
+load_dotenv()
+
+from app.chat.page import DetectionEngineeringPage
 from app.state import State
+from app.ingestion.spool import sweep_spool_dir
+from app.llm.programs import program_registry
+from app.llm.prompt import PROGRAM_SIGNATURES
 
 
 def main():
-    load_dotenv()
+    # once per process, later reruns find the modules built and the spool directory swept
+    program_registry().load(list(PROGRAM_SIGNATURES.values()))
+    sweep_spool_dir()
 
     State.init()
 